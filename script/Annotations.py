@@ -0,0 +1,74 @@
+import re
+
+import tsl.script.Script
+
+class Annotations( tsl.script.Script.Script ):
+    '''a = Annotations( 'Name of Movie', outdir='/tmp/movie-stuff' ) # Outdir defaults to .
+    a.annotations = foo
+
+    a.save( outdir='/tmp/movie-stuff', pretty=False )
+         # Outdir defaults to the Outdir set in the constructor, or . if none was set
+         # Creates a file in outdir called 'name_of_movie_annotations.json'
+
+    a.load( outdir='/tmp/movie-stuff', loadfiles={ 'annotations' : '../a.json' } )
+         # Outdir and filenames have same defaults as the save method
+
+    a.get_tokens()        # [ 'INT', 'LAB', 'Egon', 'frowns', ... ]
+    a.get_tagged_stems()  # [ ( 'int', 'NNP' ), ( 'lab', 'NNP' ), ( 'egon', 'NNP' ), ( 'frown', 'VBZ' ), ... ]
+    a.get_line_range( 1, 10 )
+         # The start and end positions in the lists above of the tokens
+         # on lines 1 through 10 of the script
+
+    The annotations are the word tokens of the raw script as split by
+    nltk.wordpunct_tokenize, the part of speech tag nltk.pos_tag gives
+    each of them, and the Porter stem of each lowercased token.  They
+    are stored compactly as:
+
+    vocabulary   - each distinct token once
+    stems        - the stem of each entry in vocabulary
+    tagset       - each distinct tag once
+    tokens       - the position in vocabulary of each token in order
+    tags         - the position in tagset of the tag of each token
+    line_offsets - the position in tokens of the first token of each
+                   line, followed by the number of tokens
+
+    See tsl.script.parse.annotate for how they are computed.
+    '''
+
+    def __init__( self, script, outdir=None ):
+        self.script = script
+        self.script_fname = re.sub( r'\s+', '_', script.lower() )
+
+        self.annotations = {
+            'vocabulary'   : [],
+            'stems'        : [],
+            'tagset'       : [],
+            'tokens'       : [],
+            'tags'         : [],
+            'line_offsets' : [ 0 ],
+            }
+
+        self.outdir = outdir
+
+        self.outputs = [ 'annotations' ]
+
+    def get_tokens( self ):
+        vocabulary = self.annotations['vocabulary']
+        return [ vocabulary[x] for x in self.annotations['tokens'] ]
+
+    def get_tags( self ):
+        tagset = self.annotations['tagset']
+        return [ tagset[x] for x in self.annotations['tags'] ]
+
+    def get_stems( self ):
+        stems = self.annotations['stems']
+        return [ stems[x] for x in self.annotations['tokens'] ]
+
+    def get_tagged_stems( self ):
+        return zip( self.get_stems(), self.get_tags() )
+
+    def get_line_range( self, first_line, last_line ):
+        '''Return the start and end positions of the tokens of script
+        lines first_line through last_line, numbered from 1.'''
+        line_offsets = self.annotations['line_offsets']
+        return ( line_offsets[first_line-1], line_offsets[last_line] )
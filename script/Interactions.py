@@ -15,8 +15,12 @@ class Interactions( tsl.script.Script.Script ):
 
     i.load( outdir='/tmp/movie-stuff', loadfiles={ 'interactions' : '../p.json', 'interaction_ns' : 'ns.json', 'interaction_sn' : '/tmp/sn.json' } )
          # Outdir and filenames have same defaults as the save method
+         # interaction_ns and interaction_sn are derived from
+         # interactions on first access unless given in loadfiles
     '''
 
+    derived_outputs = [ 'interaction_sn', 'interaction_ns' ]
+
 
     def __init__( self, script, outdir=None ):
         self.script = script
@@ -29,3 +33,24 @@ class Interactions( tsl.script.Script.Script ):
         self.outdir = outdir
         self.outputs = [ 'interactions', 'interaction_sn', 'interaction_ns' ]
 
+    def derive( self, output ):
+        '''Rebuild the interaction_ns or interaction_sn hash of hashes
+        from the flat interactions list, in the same way
+        tsl.script.parse.parse.update_interaction populates them.'''
+
+        if output == 'interaction_ns':
+            keys = lambda i: ( ( i['a']['name'], i['b']['name'], i['where']['scene_id'] ),
+                               ( i['b']['name'], i['a']['name'], i['where']['scene_id'] ) )
+        elif output == 'interaction_sn':
+            keys = lambda i: ( ( i['where']['scene_id'], i['a']['name'], i['b']['name'] ),
+                               ( i['where']['scene_id'], i['b']['name'], i['a']['name'] ) )
+        else:
+            return super( Interactions, self ).derive( output )
+
+        result = {}
+
+        for interaction in self.interactions:
+            for ( k1, k2, k3 ) in keys( interaction ):
+                result.setdefault( k1, {} ).setdefault( k2, {} ).setdefault( k3, [] ).append( interaction )
+
+        return result
@@ -0,0 +1,114 @@
+import json
+import os
+import re
+
+import tsl.script.Script
+
+class Scenes( tsl.script.Script.Script ):
+    '''s = Scenes( 'Name of Movie', outdir='/tmp/movie-stuff' ) # Outdir defaults to .
+
+    s.write_scenes( Script, Structure, Presences, outdir='/tmp/movie-stuff' )
+         # Outdir defaults to the Outdir set in the constructor, or . if none was set
+         # Creates name_of_movie_scene_data.jsonl holding one line of
+         # JSON per scene, and name_of_movie_scene_index.json holding
+         # the byte offset and length of each scene's line
+
+    s.load( outdir='/tmp/movie-stuff' )
+    s.load_scenes( 40, 75 )
+         # Returns { scene_id : { 'script_lines' : [...], 'structure' : {...}, 'presence_sn' : {...} } }
+         # for scenes 40 through 75 inclusive, reading only those chunks
+    '''
+
+    def __init__( self, script, outdir=None ):
+        self.script = script
+        self.script_fname = re.sub( r'\s+', '_', script.lower() )
+
+        # Keyed on scene_id, values are [ offset, length ] in bytes of
+        # that scene's chunk in the scene data file.
+        self.scene_index = {}
+
+        self.outdir = outdir
+        self.loaddir = None
+
+        self.outputs = [ 'scene_index' ]
+
+    def write_scenes( self, Script, Structure, Presences, outdir=None ):
+        '''Write the scene data file and scene index for the parsed
+        script.  Chunks are written in scene order so any contiguous
+        range of scenes is a contiguous range of bytes.'''
+
+        if outdir is None:
+            if self.outdir is None:
+                outdir = '.'
+            else:
+                outdir = self.outdir
+
+        if not os.path.isdir( outdir ):
+            os.makedirs( outdir )
+
+        self.scene_index = {}
+
+        script_lines = Script.script_lines
+        scenes = Structure.structure['scenes']
+        presence_sn = Presences.presence_sn
+
+        f = open( self.get_data_file( outdir ), 'wb' )
+        offset = 0
+        for scene_id in sorted( scenes, key=int ):
+            scene = scenes[scene_id]
+            chunk = json.dumps( {
+                    'script_lines' : script_lines[ scene['first_line']-1 : scene['last_line'] ],
+                    'structure'    : scene,
+                    'presence_sn'  : presence_sn.get( scene_id, {} )
+                    }, separators=( ',', ':' ) ) + "\n"
+            f.write( chunk )
+            self.scene_index[scene_id] = [ offset, len( chunk ) ]
+            offset += len( chunk )
+        f.close()
+
+        self.save( outdir=outdir, pretty=False )
+        self.loaddir = outdir
+
+    def load( self, loaddir=None, loadfiles=None ):
+        super( Scenes, self ).load( loaddir, loadfiles )
+
+        if loaddir is None:
+            if self.outdir is None:
+                loaddir = '.'
+            else:
+                loaddir = self.outdir
+
+        self.loaddir = loaddir
+
+    def load_scenes( self, first_scene, last_scene=None ):
+        '''Return the chunks for scenes first_scene through last_scene
+        inclusive keyed on scene_id, with a single read of the scene
+        data file.  Scenes in the range that don't exist are
+        skipped.'''
+
+        if last_scene is None:
+            last_scene = first_scene
+
+        scene_ids = [ str( x ) for x in range( int( first_scene ), int( last_scene ) + 1 ) if str( x ) in self.scene_index ]
+
+        if not scene_ids:
+            return {}
+
+        start = self.scene_index[scene_ids[0]][0]
+        end = sum( self.scene_index[scene_ids[-1]] )
+
+        f = open( self.get_data_file( self.loaddir ), 'rb' )
+        f.seek( start )
+        data = f.read( end - start )
+        f.close()
+
+        result = {}
+
+        for scene_id in scene_ids:
+            ( offset, length ) = self.scene_index[scene_id]
+            result[scene_id] = json.loads( data[ offset - start : offset - start + length ] )
+
+        return result
+
+    def get_data_file( self, directory ):
+        return "%s/%s_scene_data.jsonl" % ( directory, self.script_fname )
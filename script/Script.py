@@ -1,7 +1,27 @@
+import gzip
 import json
 import os
 import re
 
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# Output compression formats and the file suffix each is saved with.
+COMPRESSION_SUFFIXES = {
+    None   : '.json',
+    'gzip' : '.json.gz',
+    'lzma' : '.json.xz',
+    }
+
+# How many encoded chunks of JSON we gather before handing them to the
+# file object in compact mode.
+CHUNK_SIZE = 4096
+
 class Script( object ):
     '''p = Scripts( 'Name of Movie', outdir='/tmp/movie-stuff' ) # Outdir defaults to .
     p.script_lines = foo
@@ -11,10 +31,23 @@ class Script( object ):
          # Pretty controls whether the output JSON is human readable
          # Creates files in outdir called 'name_of_movie_script_lines.json'
 
+    p.save( pretty=False, compression='gzip' )
+         # Compact output is streamed without indentation
+         # Compression of None, 'gzip' or 'lzma' writes files ending in
+         # .json, .json.gz or .json.xz respectively
+
     p.load( outdir='/tmp/movie-stuff', loadfiles={ 'script_lines' : '../sl.json' } )
          # Outdir and filenames have same defaults as the save method
+         # Nothing is read until an output is first accessed, outputs
+         # named in derived_outputs are computed from the others
+         # unless a file for them is given in loadfiles.
+         # Compressed files are decompressed transparently.
     '''
 
+    # Outputs which subclasses can compute from their other outputs
+    # via the derive method rather than read from disk.
+    derived_outputs = []
+
     def __init__( self, script, outdir=None ):
         self.script = script
         self.script_fname = re.sub( r'\s+', '_', script.lower() )
@@ -26,7 +59,10 @@ class Script( object ):
         self.outputs = [ 'script_lines' ]
 
 
-    def save( self, outdir=None, pretty=True ):
+    def save( self, outdir=None, pretty=True, compression=None ):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise Exception( "Unknown compression %s, expected one of %s" % ( compression, COMPRESSION_SUFFIXES.keys() ) )
+
         if outdir is None:
             if self.outdir is None:
                 outdir = '.'
@@ -37,16 +73,28 @@ class Script( object ):
             os.makedirs( outdir )
 
         for output in self.outputs:
-            outfile = "%s/%s_%s.json" % ( outdir, self.script_fname, output )
-            f = open( outfile, 'w' )
+            outfile = "%s/%s_%s%s" % ( outdir, self.script_fname, output, COMPRESSION_SUFFIXES[compression] )
+            f = open_output_file( outfile, 'wb' )
             if pretty:
-                json.dump( self.__getattribute__( output ), f, sort_keys=True, indent=4 )
+                json.dump( getattr( self, output ), f, sort_keys=True, indent=4 )
             else:
-                json.dump( self.__getattribute__( output ), f )
+                # Stream the compact encoding out in batches of chunks
+                # rather than a write per token.
+                encoder = json.JSONEncoder( separators=( ',', ':' ) )
+                chunks = []
+                for chunk in encoder.iterencode( getattr( self, output ) ):
+                    chunks.append( chunk )
+                    if len( chunks ) >= CHUNK_SIZE:
+                        f.write( ''.join( chunks ) )
+                        chunks = []
+                f.write( ''.join( chunks ) )
 
             f.close()
 
     def load( self, loaddir=None, loadfiles=None ):
+        '''Arrange for our outputs to be read from loaddir the first
+        time each of them is accessed.'''
+
         if loaddir is None:
             if self.outdir is None:
                 loaddir = '.'
@@ -58,11 +106,64 @@ class Script( object ):
 
         input_files = self.outputs
         
+        pending = {}
+
         for input_file in input_files:
-            if input_file not in loadfiles:
-                loadfiles[input_file] = "%s/%s_%s.json" % ( loaddir, self.script_fname, input_file )
+            if input_file in loadfiles:
+                pending[input_file] = loadfiles[input_file]
+            elif input_file not in self.derived_outputs:
+                pending[input_file] = find_output_file( "%s/%s_%s" % ( loaddir, self.script_fname, input_file ) )
+
+            # Drop any in memory value so the next access goes
+            # through __getattr__.
+            if input_file in self.__dict__:
+                delattr( self, input_file )
+
+        self.__dict__['_pending_loads'] = pending
 
-            f = open( loadfiles[input_file], 'r' )
-            setattr( self, input_file, json.load( f ) ) 
+    def __getattr__( self, name ):
+        '''Only called when name is not already set on the object, this
+        reads or derives an output on first access and caches it.'''
+
+        pending = self.__dict__.get( '_pending_loads', {} )
+
+        if name in pending:
+            f = open_output_file( pending.pop( name ), 'rb' )
+            value = json.load( f )
             f.close()
-            
+        elif name in self.derived_outputs and name in self.__dict__.get( 'outputs', [] ):
+            value = self.derive( name )
+        else:
+            raise AttributeError( "'%s' object has no attribute '%s'" % ( type( self ).__name__, name ) )
+
+        setattr( self, name, value )
+        return value
+
+    def derive( self, output ):
+        '''Return the value of output computed from our other outputs,
+        subclasses which populate derived_outputs must override this.'''
+        raise NotImplementedError( "%s can not derive %s" % ( type( self ).__name__, output ) )
+
+def find_output_file( base ):
+    '''Given a saved output's path without its suffix, return the path
+    of the most recently written variant of it on disk, or the
+    uncompressed path if none exist.'''
+
+    candidates = [ base + suffix for suffix in COMPRESSION_SUFFIXES.values() if os.path.exists( base + suffix ) ]
+
+    if not candidates:
+        return base + COMPRESSION_SUFFIXES[None]
+
+    return max( candidates, key=os.path.getmtime )
+
+def open_output_file( filename, mode ):
+    '''Open filename with the compression implied by its suffix.'''
+
+    if filename.endswith( '.gz' ):
+        return gzip.open( filename, mode )
+    elif filename.endswith( '.xz' ):
+        if lzma is None:
+            raise Exception( "lzma compression requires the lzma module, on Python 2 install backports.lzma." )
+        return lzma.open( filename, mode )
+    else:
+        return open( filename, mode )
@@ -0,0 +1,195 @@
+'''Computes the word tokens, part of speech tags and stems of a script
+once, so the utilities which need them can share the result rather
+than each re-tokenizing and re-tagging the raw script.
+
+a = get_annotations( 'Ghostbusters', '../example-scripts/ghostbusters.txt', outdir )
+     # Loads the saved tsl.script.Annotations from outdir, or computes
+     # and saves them there if there are none.
+
+a = annotate_script( 'Ghostbusters', '../example-scripts/ghostbusters.txt', outdir )
+     # Always computes the annotations, without saving them.
+
+a = get_annotations( 'Ghostbusters', script_file, outdir, Structure=Structure, processes=4 )
+     # With a Structure the tokens are split at scene boundaries and
+     # the scenes tagged across a pool of processes.  The tagger only
+     # sees the tokens of one scene at a time, so the tags of the first
+     # and last few tokens of a scene can differ from tagging the
+     # script as a whole.
+
+a = annotate_script( 'Ghostbusters', script_file, outdir, Structure, pool=pool )
+     # Tags the scenes across pool, from create_pool( 4 ) say, so one
+     # pool of tagging processes can be shared across scripts.  The
+     # caller closes and joins it.  Without a pool tag_scenes starts
+     # one for the script and closes it when done.
+
+Stems, the English lexicon and the tagger are kept for the life of the
+process, so each distinct word is stemmed once, and each worker of a
+shared pool loads the tagger once however many scripts we annotate.
+'''
+
+import multiprocessing
+import os
+import re
+
+import nltk
+
+import tsl.script.Annotations
+import tsl.script.Script
+
+# The stem of each lowercased word we've seen.
+stem_cache = {}
+porter = None
+
+english_words = None
+
+tagger = None
+
+def stem( word ):
+    '''Return the Porter stem of word.'''
+    global porter
+
+    if word not in stem_cache:
+        if porter is None:
+            porter = nltk.PorterStemmer()
+        stem_cache[word] = porter.stem( word )
+
+    return stem_cache[word]
+
+def get_english_words():
+    '''Return the set of lowercased words in nltk.corpus.words.'''
+    global english_words
+
+    if english_words is None:
+        english_words = set( w.lower() for w in nltk.corpus.words.words() )
+
+    return english_words
+
+def get_tagger():
+    '''Return the tagger nltk.pos_tag uses, loading it on first use.'''
+    global tagger
+
+    if tagger is None:
+        tagger = nltk.tag.PerceptronTagger()
+
+    return tagger
+
+def tag_tokens( tokens ):
+    '''Return the part of speech tag of each of tokens.'''
+    return [ x[1] for x in get_tagger().tag( tokens ) ]
+
+def create_pool( processes=None ):
+    '''Return a new pool of processes, by default one per core, each
+    of which loads the tagger as it starts.  The caller must close and
+    join it.'''
+    return multiprocessing.Pool( processes, initializer=get_tagger )
+
+def tag_scenes( tokens, line_offsets, scene_lines, processes=None, pool=None ):
+    '''Return the tags of tokens, tagging the tokens of each scene
+    separately across pool, or if None across a pool of processes
+    started and closed for this call.  scene_lines are the first lines
+    of each scene, any tokens before the first scene are tagged as a
+    scene of their own.'''
+
+    starts = sorted( set( [ 0 ] + [ line_offsets[x-1] for x in scene_lines ] ) )
+    ends = starts[1:] + [ len( tokens ) ]
+
+    chunks = [ tokens[start:end] for ( start, end ) in zip( starts, ends ) if start < end ]
+
+    if pool is not None:
+        tagged = pool.map( tag_tokens, chunks )
+    elif multiprocessing.current_process().daemon:
+        # Workers of another pool can't start a pool of their own.
+        tagged = map( tag_tokens, chunks )
+    else:
+        pool = create_pool( processes )
+        try:
+            tagged = pool.map( tag_tokens, chunks )
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    result = []
+    for tags in tagged:
+        result += tags
+
+    return result
+
+def get_scene_lines( Structure ):
+    return [ x['first_line'] for x in Structure.structure['scenes'].values() ]
+
+def get_line_tokens( line ):
+    '''Return the tokens of line which have a word character in them.'''
+    return [ t for t in nltk.wordpunct_tokenize( line ) if re.search( r'\w', t ) ]
+
+def annotate_lines( name, lines, outdir=None, scene_lines=None, processes=None, pool=None ):
+    '''Return the Annotations of the script whose raw lines are given.
+    Tokens never span lines, so tokenizing line by line gives the
+    same tokens as tokenizing the whole script.  When scene_lines are
+    given each scene is tagged separately as in tag_scenes.'''
+
+    vocabulary = {}
+    tokens = []
+    line_offsets = [ 0 ]
+
+    for line in lines:
+        tokens += get_line_tokens( line )
+        line_offsets.append( len( tokens ) )
+
+    # Tagging is by far the slowest step.
+    if scene_lines:
+        tags = tag_scenes( tokens, line_offsets, scene_lines, processes, pool )
+    else:
+        tags = tag_tokens( tokens )
+
+    tagset = {}
+
+    A = tsl.script.Annotations.Annotations( name, outdir )
+
+    for ( token, tag ) in zip( tokens, tags ):
+        if token not in vocabulary:
+            vocabulary[token] = len( A.annotations['vocabulary'] )
+            A.annotations['vocabulary'].append( token )
+            A.annotations['stems'].append( stem( token.lower() ) )
+        if tag not in tagset:
+            tagset[tag] = len( A.annotations['tagset'] )
+            A.annotations['tagset'].append( tag )
+
+        A.annotations['tokens'].append( vocabulary[token] )
+        A.annotations['tags'].append( tagset[tag] )
+
+    A.annotations['line_offsets'] = line_offsets
+
+    return A
+
+def annotate_script( name, script_file, outdir=None, Structure=None, processes=None, pool=None ):
+    '''Return the Annotations of script_file, tagged a scene at a time
+    across processes or pool if the Structure of the script is
+    given.'''
+
+    f = open( script_file, 'r' )
+    lines = [ unicode( x, errors='ignore' ) for x in f.readlines() ]
+    f.close()
+
+    scene_lines = None
+    if Structure is not None:
+        scene_lines = get_scene_lines( Structure )
+
+    return annotate_lines( name, lines, outdir, scene_lines, processes, pool )
+
+def get_annotations( name, script_file, outdir, Structure=None, processes=None ):
+    '''Return the Annotations for name saved in outdir, computing them
+    from script_file as annotate_script does and saving them there if
+    there are none.'''
+
+    A = tsl.script.Annotations.Annotations( name, outdir )
+
+    if os.path.exists( tsl.script.Script.find_output_file( "%s/%s_annotations" % ( outdir, A.script_fname ) ) ):
+        A.load()
+    else:
+        A = annotate_script( name, script_file, outdir, Structure, processes )
+        A.save( pretty=False )
+
+    return A
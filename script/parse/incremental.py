@@ -0,0 +1,439 @@
+'''Incremental re-parsing of a script while it is being edited.
+
+p = IncrementalParser( Script )
+     # Parses the whole script once, p.Structure, p.Presences and
+     # p.Interactions hold the results and are kept up to date.
+
+scene_ids = p.replace_lines( first_line, last_line, [ 'New line one\n', 'New line two\n' ] )
+     # Replace lines first_line through last_line inclusive, by line_no,
+     # with the given contents.  Use last_line = first_line - 1 to insert
+     # before first_line, and no contents to delete.  Returns the ids of
+     # the scenes which were re-analyzed.
+
+Only lines from just before the edit up to the point where the line
+types agree with those of the prior parse are re-classified, and only
+the scenes containing them are re-assembled and re-counted.  Scenes
+after those are renumbered if lines or scenes were added or removed.
+
+Presences and interactions are recomputed for just the re-assembled
+scenes when the edit leaves the number of scenes and the nouns those
+scenes introduce (scene locations and speakers) unchanged.  Otherwise
+the nouns known at every point of the script may have changed, and
+they are recomputed for the whole script.
+'''
+
+# Parser states.
+from tsl.script.parse.const import DIALOG, DIALOG_HEADER, FRONT, SCENE_HEADING
+
+# Noun types
+from tsl.script.parse.const import CHARACTER, THING, LOCATION
+
+# Interaction types
+from tsl.script.parse.const import APPEAR
+
+from tsl.script.parse.parse import iter_line_types, assemble_scenes, add_word_counts, compute_presence_and_interactions, update_presence_and_interactions_for_headings_and_dialog, update_presence_and_interactions_for_action, add_dialog_words, get_scene_location, get_character_from_dialog_header, _update_interaction_helper
+
+import tsl.script.Presences
+import tsl.script.Interactions
+import tsl.script.Structure
+
+# Order of noun type promotion in update_noun_type.
+NOUN_TYPE_RANK = { THING : 0, LOCATION : 1, CHARACTER : 2 }
+
+class IncrementalParser( object ):
+
+    def __init__( self, Script, lines_per_page=56 ):
+        self.Script = Script
+        self.lines_per_page = lines_per_page
+
+        script_lines = Script.script_lines
+
+        self.line_types = list( iter_line_types( script_lines ) )
+
+        self.Structure = tsl.script.Structure.Structure( Script.script, Script.outdir )
+        self.Structure.structure = assemble_scenes( script_lines, self.line_types )
+        add_word_counts( self.Structure.structure, script_lines )
+
+        self.compute_all_presences()
+
+    def compute_all_presences( self ):
+        ( self.Presences, self.Interactions ) = compute_presence_and_interactions( self.Script, self.Structure )
+
+        self.discoveries = {}
+        for scene_id in self.Structure.structure['scenes']:
+            self.discoveries[scene_id] = self.get_discoveries( scene_id )
+
+    def replace_lines( self, first_line, last_line, contents ):
+        script_lines = self.Script.script_lines
+        script = self.Structure.structure
+
+        if first_line < 1 or first_line > len( script_lines ) + 1 or last_line < first_line - 1 or last_line > len( script_lines ):
+            raise Exception( "Can't replace lines %s through %s of a %s line script." % ( first_line, last_line, len( script_lines ) ) )
+
+        # Old indices a up to b are replaced by new indices a up to a+m.
+        a = first_line - 1
+        b = last_line
+        m = len( contents )
+        delta = m - ( b - a )
+
+        new_lines = []
+        for content in contents:
+            content = content.replace( "\r\r\n", "\n" ).replace( "\r\n", "\n" )
+            if not content.endswith( "\n" ):
+                content += "\n"
+            new_lines.append( { 'line_no' : 0, 'page_no' : 0, 'content' : content } )
+
+        script_lines[a:b] = new_lines
+        moved = self.renumber_lines( a, m )
+
+        # Re-classify from the line before the edit, whose next line
+        # has changed, until a line after the edit gets the same types
+        # it had before, from which point nothing further can change.
+        old_types = self.line_types
+        start = max( a - 1, 0 )
+
+        prior_types = ( FRONT, FRONT )
+        if start > 0 and old_types[start - 1][0] != FRONT:
+            prior_types = old_types[start - 1]
+
+        new_types = old_types[:start]
+        resync = len( script_lines )
+        for ( i, types ) in enumerate( iter_line_types( script_lines, start, prior_types ), start ):
+            if i >= a + m and types == old_types[i - delta]:
+                resync = i
+                break
+            new_types.append( types )
+        new_types += old_types[resync - delta:]
+
+        self.line_types = new_types
+
+        # Re-assemble whole scenes around the lines whose types may have
+        # changed.  The scene starts chosen here are outside that
+        # region, so they are scene starts in both the old and new
+        # types.
+        lo = 0
+        for i in range( start - 1, 0, -1 ):
+            if self.is_scene_start( new_types, i ):
+                lo = i
+                break
+
+        hi = len( script_lines )
+        for i in range( resync + 1, len( script_lines ) ):
+            if self.is_scene_start( new_types, i ):
+                hi = i
+                break
+
+        old_scenes = script['scenes']
+        old_ids = sorted( old_scenes, key=int )
+
+        # Old scenes lo_scene up to hi_scene lie within the region.
+        lo_scene = len( old_ids ) + 1
+        hi_scene = len( old_ids ) + 1
+        for scene_id in old_ids:
+            first = old_scenes[scene_id]['first_line'] - 1
+            if first >= lo and lo_scene > len( old_ids ):
+                lo_scene = int( scene_id )
+            if first >= hi - delta:
+                hi_scene = int( scene_id )
+                break
+
+        region = assemble_scenes( script_lines, new_types, lo, hi )
+        if lo == 0:
+            script['front'] = region['front']
+
+        new_count = len( region['scenes'] )
+        scene_delta = new_count - ( hi_scene - lo_scene )
+
+        scenes = {}
+        for scene_id in old_ids:
+            number = int( scene_id )
+            if number < lo_scene:
+                scenes[scene_id] = old_scenes[scene_id]
+            elif number >= hi_scene:
+                scene = old_scenes[scene_id]
+                if delta or scene_delta:
+                    shift_scene( scene, delta, scene_delta )
+                scenes[str( number + scene_delta )] = scene
+
+        touched = []
+        for ( scene_id, scene ) in region['scenes'].items():
+            number = int( scene_id ) + lo_scene - 1
+            scene['scene_number'] = number
+            scenes[str( number )] = scene
+            touched.append( str( number ) )
+        touched.sort( key=int )
+
+        script['scenes'] = scenes
+        add_word_counts( script, script_lines, touched )
+
+        old_discoveries = set()
+        for scene_id in range( lo_scene, hi_scene ):
+            old_discoveries.update( self.discoveries[str( scene_id )] )
+
+        new_discoveries = {}
+        for scene_id in touched:
+            new_discoveries[scene_id] = self.get_discoveries( scene_id )
+
+        if scene_delta == 0 and old_discoveries == set( sum( new_discoveries.values(), [] ) ):
+            self.discoveries.update( new_discoveries )
+            self.update_scene_presences( lo_scene, touched, delta, moved )
+        else:
+            self.compute_all_presences()
+
+        return touched
+
+    def renumber_lines( self, first, count ):
+        '''Fix the line and page numbers of script_lines from index first
+        on, paging as tsl.script.parse.load.load_txt does.  Returns True
+        if the numbers of any line after the count lines from first
+        changed.'''
+
+        script_lines = self.Script.script_lines
+
+        form_feeds = False
+        for line in script_lines:
+            if '\f' in line['content']:
+                form_feeds = True
+                break
+
+        moved = False
+
+        for i in range( first, len( script_lines ) ):
+            line = script_lines[i]
+
+            if form_feeds:
+                page_no = 1
+                if i > 0:
+                    page_no = script_lines[i - 1]['page_no']
+                if '\f' in line['content']:
+                    page_no += 1
+            else:
+                page_no = 1 + i / self.lines_per_page
+
+            # Each line's numbers follow from the line before, so once
+            # one is right the rest are.
+            if i >= first + count:
+                if line['line_no'] == i + 1 and line['page_no'] == page_no:
+                    break
+                moved = True
+
+            line['line_no'] = i + 1
+            line['page_no'] = page_no
+
+        return moved
+
+    def is_scene_start( self, line_types, i ):
+        return line_types[i][0] == SCENE_HEADING and ( i == 0 or line_types[i - 1][0] != SCENE_HEADING )
+
+    def get_discoveries( self, scene_id ):
+        '''The nouns the first pass of compute_presence_and_interactions
+        learns from this scene, in order, as ( name, noun_type ) pairs.'''
+
+        script_lines = self.Script.script_lines
+
+        result = []
+
+        for block in self.Structure.structure['scenes'][scene_id]['scene_blocks']:
+            if block['block_type'] == SCENE_HEADING:
+                result.append( ( get_scene_location( script_lines[block['first_line'] - 1]['content'] ), LOCATION ) )
+            elif block['block_type'] == DIALOG:
+                for line_key in sorted( block['line_types'], key=int ):
+                    if block['line_types'][line_key] == DIALOG_HEADER:
+                        character = get_character_from_dialog_header( script_lines[int( line_key ) - 1]['content'] )
+                        if character != '':
+                            result.append( ( character, CHARACTER ) )
+
+        return result
+
+    def update_scene_presences( self, first_scene, touched, delta, moved ):
+        '''Recompute presences and interactions for the touched scenes,
+        which are contiguous from first_scene and may be none, and if
+        moved shift the line numbers of those in later scenes by delta
+        and update their page numbers.'''
+
+        script_lines = self.Script.script_lines
+        script = self.Structure.structure
+        Presences = self.Presences
+        Interactions = self.Interactions
+        presence_ns = Presences.presence_ns
+
+        last_scene = first_scene + len( touched ) - 1
+
+        # A later scene whose heading names a character is set in the
+        # last location we established, which may be one of ours.
+        while str( last_scene + 1 ) in script['scenes'] and self.uses_prior_location( str( last_scene + 1 ) ):
+            last_scene += 1
+            touched.append( str( last_scene ) )
+
+        # The nouns known at the start of the first touched scene in
+        # the first pass, and their types at that point.
+        P = tsl.script.Presences.Presences( self.Script.script, self.Script.outdir )
+        I = tsl.script.Interactions.Interactions( self.Script.script, self.Script.outdir )
+        for scene_id in range( 1, first_scene ):
+            for ( name, noun_type ) in self.discoveries[str( scene_id )]:
+                if name not in P.presence_ns:
+                    P.presence_ns[name] = { 'noun_type' : noun_type }
+                elif NOUN_TYPE_RANK[noun_type] > NOUN_TYPE_RANK[P.presence_ns[name]['noun_type']]:
+                    P.presence_ns[name]['noun_type'] = noun_type
+
+        update_presence_and_interactions_for_headings_and_dialog( P, I, script_lines, script, touched )
+
+        # The second pass sees every noun with its final type.
+        for name in presence_ns:
+            if name not in P.presence_ns:
+                P.presence_ns[name] = { 'noun_type' : presence_ns[name]['noun_type'] }
+            else:
+                P.presence_ns[name]['noun_type'] = presence_ns[name]['noun_type']
+
+        update_presence_and_interactions_for_action( P, I, script_lines, script, touched, self.get_prior_location( first_scene ) )
+
+        add_dialog_words( P.presences, script_lines, script )
+
+        # Swap the touched scenes' presences and interactions for the
+        # new ones, keeping the order they would have from a full
+        # parse: first pass in scene order, then second pass in scene
+        # order.
+        is_second_pass = lambda p: p['presence_type'] == APPEAR
+        later_presences = splice( Presences.presences, P.presences, first_scene, last_scene, is_second_pass )
+        later_interactions = splice( Interactions.interactions, I.interactions, first_scene, last_scene, lambda i: is_second_pass( i['b'] ) )
+
+        for scene_id in touched:
+            for name in Presences.presence_sn.get( scene_id, {} ):
+                del presence_ns[name][scene_id]
+            if scene_id in Presences.presence_sn:
+                del Presences.presence_sn[scene_id]
+
+            for ( name, presences ) in P.presence_sn.get( scene_id, {} ).items():
+                presence_ns[name][scene_id] = list( presences )
+                Presences.presence_sn.setdefault( scene_id, {} )[name] = presences
+
+        # The interaction views may not have been derived yet, in which
+        # case they will be from the updated interactions.
+        if 'interaction_ns' in Interactions.__dict__ or 'interaction_sn' in Interactions.__dict__:
+            interaction_ns = Interactions.interaction_ns
+            interaction_sn = Interactions.interaction_sn
+
+            for scene_id in touched:
+                for ( name1, others ) in interaction_sn.get( scene_id, {} ).items():
+                    for name2 in others:
+                        del interaction_ns[name1][name2][scene_id]
+                        if not interaction_ns[name1][name2]:
+                            del interaction_ns[name1][name2]
+                    if not interaction_ns[name1]:
+                        del interaction_ns[name1]
+                if scene_id in interaction_sn:
+                    del interaction_sn[scene_id]
+
+            for interaction in I.interactions:
+                _update_interaction_helper( interaction_ns, interaction['a'], interaction['b'], interaction['where'], 'name', 'name', 'scene_id', interaction )
+                _update_interaction_helper( interaction_ns, interaction['b'], interaction['a'], interaction['where'], 'name', 'name', 'scene_id', interaction )
+                _update_interaction_helper( interaction_sn, interaction['where'], interaction['a'], interaction['b'], 'scene_id', 'name', 'name', interaction )
+                _update_interaction_helper( interaction_sn, interaction['where'], interaction['b'], interaction['a'], 'scene_id', 'name', 'name', interaction )
+
+        if not moved:
+            return
+
+        # Presences and interactions share where data structures, so
+        # make sure we move each one just once.  An interaction in a
+        # later scene may involve the location of an earlier one.
+        shifted = set()
+        def shift( where ):
+            if id( where ) not in shifted and int( where['scene_id'] ) > last_scene:
+                shifted.add( id( where ) )
+                where['line_no'] += delta
+                where['page_no'] = script_lines[where['line_no'] - 1]['page_no']
+
+        for presence in later_presences:
+            shift( presence['where'] )
+        for interaction in later_interactions:
+            shift( interaction['where'] )
+            shift( interaction['a']['where'] )
+            shift( interaction['b']['where'] )
+
+    def uses_prior_location( self, scene_id ):
+        '''True if the second pass sets this scene in the location of an
+        earlier scene, because each of its headings names a character.'''
+
+        presence_ns = self.Presences.presence_ns
+        script_lines = self.Script.script_lines
+
+        headings = [ x for x in self.Structure.structure['scenes'][scene_id]['scene_blocks'] if x['block_type'] == SCENE_HEADING ]
+        for block in headings:
+            name = get_scene_location( script_lines[block['first_line'] - 1]['content'] )
+            if not ( name in presence_ns and presence_ns[name]['noun_type'] == CHARACTER ):
+                return False
+
+        return len( headings ) > 0
+
+    def get_prior_location( self, scene_number ):
+        '''The location the second pass has established before it reaches
+        scene_number.'''
+
+        presence_sn = self.Presences.presence_sn
+        presence_ns = self.Presences.presence_ns
+        script_lines = self.Script.script_lines
+
+        for scene_id in range( scene_number - 1, 0, -1 ):
+            scene_id = str( scene_id )
+            for block in self.Structure.structure['scenes'][scene_id]['scene_blocks']:
+                if block['block_type'] == SCENE_HEADING:
+                    name = get_scene_location( script_lines[block['first_line'] - 1]['content'] )
+                    if not ( name in presence_ns and presence_ns[name]['noun_type'] == CHARACTER ):
+                        return presence_sn[scene_id][name][0]
+
+        return {}
+
+def shift_scene( scene, delta, scene_delta ):
+    '''Move a scene data structure delta lines and scene_delta scenes
+    along.'''
+
+    scene['scene_number'] += scene_delta
+    scene['heading_line'] += delta
+    scene['first_line'] += delta
+    scene['last_line'] += delta
+
+    if delta:
+        for block in scene['scene_blocks']:
+            block['first_line'] += delta
+            block['last_line'] += delta
+            block['line_types'] = dict( [ ( str( int( k ) + delta ), v ) for ( k, v ) in block['line_types'].items() ] )
+
+def first_index( items, predicate, lo=0, hi=None ):
+    '''Return the index of the first of items[lo:hi] for which
+    predicate is true, or hi if there are none.  Predicate must be
+    true for every item after that one.'''
+
+    if hi is None:
+        hi = len( items )
+
+    while lo < hi:
+        middle = ( lo + hi ) / 2
+        if predicate( items[middle] ):
+            hi = middle
+        else:
+            lo = middle + 1
+
+    return lo
+
+def splice( old, new, first_scene, last_scene, is_second_pass ):
+    '''Replace the elements of old in scenes first_scene through
+    last_scene with those of new, in place.  Both lists hold first
+    pass elements in scene order followed by second pass elements in
+    scene order.  Returns the elements of old in later scenes.'''
+
+    boundary = first_index( old, is_second_pass )
+    new_boundary = first_index( new, is_second_pass )
+
+    ranges = []
+    later = []
+    for ( lo, hi ) in [ ( 0, boundary ), ( boundary, len( old ) ) ]:
+        start = first_index( old, lambda x: int( x['where']['scene_id'] ) >= first_scene, lo, hi )
+        end = first_index( old, lambda x: int( x['where']['scene_id'] ) > last_scene, start, hi )
+        ranges.append( ( start, end ) )
+        later += old[end:hi]
+
+    # Second pass first so the first pass indices still hold.
+    old[ranges[1][0]:ranges[1][1]] = new[new_boundary:]
+    old[ranges[0][0]:ranges[0][1]] = new[:new_boundary]
+
+    return later
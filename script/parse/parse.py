@@ -224,6 +224,45 @@ def get_types( line, next_line, prior_types ):
 def parse_script_lines( Script ):
     script_lines = Script.script_lines
 
+    line_types = list( iter_line_types( script_lines ) )
+
+    script = assemble_scenes( script_lines, line_types )
+
+    add_word_counts( script, script_lines )
+
+    structure = tsl.script.Structure.Structure( Script.script, Script.outdir )
+    structure.structure = script
+
+    return structure
+
+def iter_line_types( script_lines, start=0, prior_types=( FRONT, FRONT ) ):
+    '''Yields the ( block_type, line_type ) of each line from index
+    start onward, given the types in effect before that line.'''
+
+    for i in range( start, len( script_lines ) ):
+        line = script_lines[i]['content']
+
+        next_line = False
+        if ( i + 1 < len( script_lines ) ):
+            next_line = script_lines[ i + 1 ]['content']
+        
+        types = get_types( line=line, next_line=next_line, prior_types=prior_types )
+
+        yield types
+
+        # Front matter doesn't change the prior types.
+        if ( types[0] != FRONT ):
+            prior_types = types
+
+def assemble_scenes( script_lines, line_types, first=0, last=None ):
+    '''Group the lines from index first up to last into the front,
+    scenes and blocks of the script data structure, given the types of
+    each line from iter_line_types.  Scenes are numbered from 1, so
+    when first is not 0 it should be the heading of a scene.'''
+
+    if last is None:
+        last = len( script_lines )
+
     types = ( FRONT, FRONT )
     prior_types = ( FRONT, FRONT )
 
@@ -247,16 +286,13 @@ def parse_script_lines( Script ):
 
     line_no = None
 
-    for ( i, line_dict ) in enumerate( script_lines ):
+    for i in range( first, last ):
+        line_dict = script_lines[i]
         line = line_dict['content']
         line_no = line_dict['line_no']
         page_no = line_dict['page_no']
 
-        next_line = False
-        if ( i + 1 < len( script_lines ) ):
-            next_line = script_lines[ i + 1 ]['content']
-        
-        types = get_types( line=line, next_line=next_line, prior_types=prior_types )
+        types = line_types[i]
 
         if ( types[0] == FRONT ):
             script['front']['first_line'] = 1
@@ -315,11 +351,17 @@ def parse_script_lines( Script ):
     # Delete the stub scene we seeded the data structure with.
     del script['scenes']['0']
 
-    script_total_words = 0
-    script_dialog_words = 0
+    return script
+
+def add_word_counts( script, script_lines, scene_ids=None ):
+    '''Add total and dialog word counts to the blocks and scenes in
+    scene_ids, by default all of them, and recompute the script
+    totals.'''
 
-    # Add word counts.
-    for scene_id in script['scenes'].keys():
+    if scene_ids is None:
+        scene_ids = script['scenes'].keys()
+
+    for scene_id in scene_ids:
         scene = script['scenes'][scene_id]
         
         total_words = 0
@@ -348,16 +390,9 @@ def parse_script_lines( Script ):
 
         scene['total_words'] = total_words
         scene['dialog_words'] = dialog_words
-        script_total_words += total_words
-        script_dialog_words += dialog_words
-
-    script['total_words'] = script_total_words
-    script['dialog_words'] = script_dialog_words
 
-    structure = tsl.script.Structure.Structure( Script.script, Script.outdir )
-    structure.structure = script
-
-    return structure
+    script['total_words'] = sum( [ x['total_words'] for x in script['scenes'].values() ] )
+    script['dialog_words'] = sum( [ x['dialog_words'] for x in script['scenes'].values() ] )
                   
 '''
 A noun === ( name, noun_type )
@@ -395,7 +430,30 @@ def compute_presence_and_interactions( Script, Structure, parse_mode=STRICT ):
     interaction_sn = Interactions.interaction_sn
 
     mode = parse_mode
-    for scene_id in sorted( script['scenes'], key=int ):
+
+    scene_ids = sorted( script['scenes'], key=int )
+
+    update_presence_and_interactions_for_headings_and_dialog( Presences, Interactions, script_lines, script, scene_ids )
+
+    # We have to process action and direction after scenes and dialog
+    # because we only learn about nouns from scenes and dialog in
+    # strict mode - if we did action and direction above locations
+    # would not have presences until the first time a scene is set in
+    # them, and characters would not have presences until they speak.
+    update_presence_and_interactions_for_action( Presences, Interactions, script_lines, script, scene_ids )
+
+    # Augment dialog presence with the words of dialog spoken.
+    add_dialog_words( Presences.presences, script_lines, script )
+
+    return ( Presences, Interactions )
+
+def update_presence_and_interactions_for_headings_and_dialog( Presences, Interactions, script_lines, script, scene_ids ):
+    '''The first pass over the scenes in scene_ids, in order, which
+    learns about nouns from scene headings and dialog.'''
+
+    presence_ns = Presences.presence_ns
+
+    for scene_id in scene_ids:
         scene_location = {}
         for block in script['scenes'][scene_id]['scene_blocks']:
 
@@ -419,13 +477,20 @@ def compute_presence_and_interactions( Script, Structure, parse_mode=STRICT ):
                                                              scene_id=scene_id, scene_location=scene_location,
                                                              block=block )
                 
-    # We have to process action and direction after scenes and dialog
-    # because we only learn about nouns from scenes and dialog in
-    # strict mode - if we did action and direction above locations
-    # would not have presences until the first time a scene is set in
-    # them, and characters would not have presences until they speak.
-    prior_scene_location = {}
-    for scene_id in sorted( script['scenes'], key=int ):
+def update_presence_and_interactions_for_action( Presences, Interactions, script_lines, script, scene_ids, prior_scene_location=None ):
+    '''The second pass over the scenes in scene_ids, in order, which
+    finds the nouns learned in the first pass in action and direction.
+    prior_scene_location is the location used for a scene whose
+    heading turns out to name a character, for the first scene in
+    scene_ids it is that of the scene before it.'''
+
+    if prior_scene_location is None:
+        prior_scene_location = {}
+
+    presence_ns = Presences.presence_ns
+    presence_sn = Presences.presence_sn
+
+    for scene_id in scene_ids:
         scene_location = {}
         for block in script['scenes'][scene_id]['scene_blocks']:
             if block['block_type'] == SCENE_HEADING:
@@ -448,8 +513,11 @@ def compute_presence_and_interactions( Script, Structure, parse_mode=STRICT ):
                                                             last_line=block['last_line'], 
                                                             scene_id=scene_id, scene_location=scene_location )
                 
-    # Augment dialog presence with the words of dialog spoken.
-    for presence in Presences.presences:
+def add_dialog_words( presences, script_lines, script ):
+    '''Set dialog_words on each DISCUSS presence in presences to the
+    number of words the speaker says in that piece of dialog.'''
+
+    for presence in presences:
         presence_type = presence['presence_type']
         scene_id = presence['where']['scene_id']
         first_line = presence['where']['line_no']
@@ -479,8 +547,6 @@ def compute_presence_and_interactions( Script, Structure, parse_mode=STRICT ):
 
         presence['dialog_words'] = dialog_words
 
-    return ( Presences, Interactions )
-
 def get_scene_location( scene_heading ):
     '''We try to be forgiving of a variety of styles.  We perform the
     following operations in order:
@@ -787,7 +853,14 @@ def get_name_offsets( Presences, text, offset=0, new_nouns=[] ):
 
     result = []
 
+    lower_text = text.lower()
+
     for name in presence_ns:
+        # Most names don't occur in any given text, and checking for
+        # that is far cheaper than the regular expression below which
+        # has to be compiled for each name.
+        if name.lower() not in lower_text:
+            continue
         for m in re.finditer( r'\b'+re.escape( name )+r'\b', text, re.I ):
             result.append( ( name, m.start() ) )
 
@@ -796,8 +869,10 @@ def get_name_offsets( Presences, text, offset=0, new_nouns=[] ):
             result.append( ( noun[0], m.start() ) )
         
     # Handle the odd case where something was present in new_nouns and
-    # presence_ns.  Return the list in increasing order of occurrence.
-    return sorted( list( set( result ) ), key=lambda x : x[1] )
+    # presence_ns.  Return the list in increasing order of occurrence,
+    # with names found at the same offset in name order so the result
+    # doesn't depend on the order of presence_ns.
+    return sorted( list( set( result ) ), key=lambda x : ( x[1], x[0] ) )
 
 def get_line_for_offset( line_offsets, pos ):
     '''Return the lowest line number whose end is after pos, or print
@@ -0,0 +1,187 @@
+'''Memoizes the reports in tsl.script.reports.reports.
+
+cache = ReportCache( max_entries=256, cache_dir='/tmp/report-cache' )
+     # cache_dir is optional, without it results are only kept in memory
+
+cache.top_presences( Presences, top_n=5, noun_types=[CHARACTER] )
+cache.top_interactions( Presences, Interactions, top_n=5, interaction_types=[SETTING] )
+cache.run_reports( Presences, Interactions, specs )
+     # Same arguments and results as the functions of the same name in
+     # tsl.script.reports.reports.
+
+Results are keyed on a version of the data and the query with its
+defaults filled in and its filters put in a canonical order, so
+queries which differ only in the order of their filters share a
+result.  The version is a SHA1 of the presences, and of the
+interactions for interaction reports, computed the first time we see
+each object.  Pass version= to use your own instead, and call
+invalidate on an object whose data has changed since we saw it.
+
+The max_entries most recently used results are kept in memory.  With
+a cache_dir every result is also written there, and results missing
+from memory are looked for there before being computed.
+'''
+
+import collections
+import hashlib
+import json
+import os
+import weakref
+
+import tsl.script.reports.reports
+
+from tsl.script.reports.reports import PRESENCE_REPORT_DEFAULTS, INTERACTION_REPORT_DEFAULTS
+
+class ReportCache( object ):
+
+    def __init__( self, max_entries=256, cache_dir=None ):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+
+        # Keyed on the cache key, in order from least to most recently
+        # used.
+        self.results = collections.OrderedDict()
+
+        # Data versions of the Presences and Interactions objects we've
+        # seen.
+        self.versions = weakref.WeakKeyDictionary()
+
+        self.hits = 0
+        self.misses = 0
+
+    def top_presences( self, Presences, version=None, **kwargs ):
+        kwargs['report'] = 'presences'
+        return self.run_reports( Presences, None, [ kwargs ], version )[0]
+
+    def top_interactions( self, Presences, Interactions, version=None, **kwargs ):
+        kwargs['report'] = 'interactions'
+        return self.run_reports( Presences, Interactions, [ kwargs ], version )[0]
+
+    def run_reports( self, Presences, Interactions, specs, version=None ):
+        '''Return the results of tsl.script.reports.reports.run_reports
+        for specs, computing only those we don't have in one batch.'''
+
+        keys = [ self.get_key( Presences, Interactions, spec, version ) for spec in specs ]
+
+        results = [ self.get( key ) for key in keys ]
+
+        missing = [ i for i in range( len( specs ) ) if results[i] is None ]
+        if missing:
+            computed = tsl.script.reports.reports.run_reports( Presences, Interactions, [ specs[i] for i in missing ] )
+            for ( i, result ) in zip( missing, computed ):
+                self.put( keys[i], result )
+                results[i] = result
+
+        # Callers are free to modify what we hand back.
+        return [ list( result ) for result in results ]
+
+    def get( self, key ):
+        if key in self.results:
+            result = self.results.pop( key )
+            self.results[key] = result
+            self.hits += 1
+            return result
+
+        if self.cache_dir is not None:
+            filename = self.get_filename( key )
+            if os.path.exists( filename ):
+                f = open( filename, 'r' )
+                result = [ tuple( x ) for x in json.load( f ) ]
+                f.close()
+                self.remember( key, result )
+                self.hits += 1
+                return result
+
+        self.misses += 1
+        return None
+
+    def put( self, key, result ):
+        self.remember( key, result )
+
+        if self.cache_dir is not None:
+            if not os.path.isdir( self.cache_dir ):
+                os.makedirs( self.cache_dir )
+
+            # Write to the side and rename so readers never see a
+            # partial result.
+            filename = self.get_filename( key )
+            f = open( filename + '.tmp', 'w' )
+            json.dump( result, f )
+            f.close()
+            os.rename( filename + '.tmp', filename )
+
+    def remember( self, key, result ):
+        self.results[key] = result
+        while len( self.results ) > self.max_entries:
+            self.results.popitem( last=False )
+
+    def clear( self ):
+        '''Forget the results held in memory, those on disk remain.'''
+        self.results.clear()
+
+    def invalidate( self, data ):
+        '''Forget the version of a Presences or Interactions object whose
+        data has changed, so it is computed afresh next time.'''
+        if data in self.versions:
+            del self.versions[data]
+
+    def get_filename( self, key ):
+        return "%s/%s.json" % ( self.cache_dir, hashlib.sha1( key ).hexdigest() )
+
+    def get_key( self, Presences, Interactions, spec, version=None ):
+        if spec.get( 'report' ) == 'presences':
+            defaults = PRESENCE_REPORT_DEFAULTS
+        elif spec.get( 'report' ) == 'interactions':
+            defaults = INTERACTION_REPORT_DEFAULTS
+        else:
+            raise Exception( "Report specs must have a report of presences or interactions: %s" % ( spec ) )
+
+        if version is None:
+            version = self.get_version( Presences, 'presences' )
+            if spec['report'] == 'interactions':
+                version += self.get_version( Interactions, 'interactions' )
+
+        return json.dumps( [ version, normalize_spec( spec, defaults ) ], sort_keys=True )
+
+    def get_version( self, data, output ):
+        if data not in self.versions:
+            digest = hashlib.sha1()
+            for chunk in json.JSONEncoder( sort_keys=True, separators=( ',', ':' ) ).iterencode( getattr( data, output ) ):
+                if isinstance( chunk, unicode ):
+                    chunk = chunk.encode( 'utf-8' )
+                digest.update( chunk )
+            self.versions[data] = digest.hexdigest()
+
+        return self.versions[data]
+
+def normalize_spec( spec, defaults ):
+    '''Return spec with its defaults filled in and each filter in a
+    canonical order, leaving in duplicates only where they change the
+    result.'''
+
+    result = dict( defaults )
+
+    for key in spec:
+        if key != 'report' and key not in defaults:
+            raise Exception( "Unknown option %s for %s report." % ( key, spec['report'] ) )
+        result[key] = spec[key]
+
+    for key in [ 'scene_list', 'interaction_types', 'names' ]:
+        if result.get( key ):
+            result[key] = sorted( set( result[key] ) )
+        elif key in result and key != 'names':
+            result[key] = []
+    if result.get( 'names' ) == []:
+        result['names'] = None
+
+    if spec['report'] == 'presences':
+        result['noun_types'] = sorted( set( result['noun_types'] ) )
+        result['presence_types'] = sorted( set( result['presence_types'] ) )
+    else:
+        # Type pairs match either way around.  Each presence type pair
+        # that matches counts so repeats matter, and valid_noun_types
+        # decides on the first noun type pair so order matters.
+        result['noun_types'] = [ sorted( x ) for x in result['noun_types'] ]
+        result['presence_types'] = sorted( [ sorted( x ) for x in result['presence_types'] ] )
+
+    return result
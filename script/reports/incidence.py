@@ -0,0 +1,74 @@
+'''Which names are present, and which speak, in each scene as sparse
+name by scene matrices, for co-presence counts over whole casts.
+
+incidence = SceneIncidence( Presences, names=[ 'RIPLEY', 'DALLAS', 'ASH' ] ) # Names defaults to every name
+
+incidence.scene_counts()                # [ 72, 43, 40 ], the number of scenes each name is in
+incidence.scene_counts( speaking=True ) # The number of scenes each name speaks in
+incidence.scene_fractions()             # scene_counts over the number of scenes
+incidence.scene_totals( speaking=True ) # The number of names speaking in each of incidence.scene_ids
+incidence.co_presence()
+     # A names by names array of the number of scenes both names are
+     # in, with the number of scenes each name is in on the diagonal.
+
+The scenes are those of presence_sn in scene order, and row i of the
+matrices is incidence.names[i].
+'''
+
+import numpy
+import scipy.sparse
+
+from tsl.script.parse.const import DISCUSS
+
+class SceneIncidence( object ):
+
+    def __init__( self, Presences, names=None ):
+        presence_ns = Presences.presence_ns
+
+        if names is None:
+            names = presence_ns.keys()
+        self.names = list( names )
+
+        self.scene_ids = sorted( Presences.presence_sn.keys(), key=int )
+        columns = dict( [ ( x, i ) for ( i, x ) in enumerate( self.scene_ids ) ] )
+
+        present = ( [], [] )
+        speaking = ( [], [] )
+
+        for ( i, name ) in enumerate( self.names ):
+            for ( scene_id, presences ) in presence_ns[name].items():
+                if scene_id == 'noun_type':
+                    continue
+                present[0].append( i )
+                present[1].append( columns[scene_id] )
+                for presence in presences:
+                    if presence['presence_type'] == DISCUSS:
+                        speaking[0].append( i )
+                        speaking[1].append( columns[scene_id] )
+                        break
+
+        shape = ( len( self.names ), len( self.scene_ids ) )
+
+        # Each name has at most one entry per scene, so the matrices
+        # hold only ones.
+        self.present = scipy.sparse.csr_matrix( ( numpy.ones( len( present[0] ), dtype=int ), present ), shape=shape )
+        self.speaking = scipy.sparse.csr_matrix( ( numpy.ones( len( speaking[0] ), dtype=int ), speaking ), shape=shape )
+
+    def get_matrix( self, speaking=False ):
+        if speaking:
+            return self.speaking
+        else:
+            return self.present
+
+    def scene_counts( self, speaking=False ):
+        return numpy.asarray( self.get_matrix( speaking ).sum( axis=1 ) ).ravel()
+
+    def scene_fractions( self, speaking=False ):
+        return self.scene_counts( speaking ) / float( len( self.scene_ids ) )
+
+    def scene_totals( self, speaking=False ):
+        return numpy.asarray( self.get_matrix( speaking ).sum( axis=0 ) ).ravel()
+
+    def co_presence( self, speaking=False ):
+        matrix = self.get_matrix( speaking )
+        return ( matrix * matrix.T ).toarray()
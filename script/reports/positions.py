@@ -0,0 +1,136 @@
+'''A positional index of the words of a script, from its annotations.
+
+index = PositionIndex( Annotations, Structure, key='stem' ) # Key is stem or token, tokens are lowercased
+
+index.get_offsets( 'ghost' ) # Sorted word offsets of each token whose stem is ghost
+index.get_lines( 'ghost' )   # The line number of each of those
+index.get_scenes( 'ghost' )  # The scene number of each of those, 0 before the first scene
+index.get_concordance( 'ghost', width=5 )
+     # The 5 tokens either side of each occurrence of ghost
+
+stats = index.get_gap_statistics( unit='line', thresholds=[ 56*15, 56*30 ] )
+     # Arrays over index.keys of occurrences, max_gap, mean_gap and
+     # span, the gaps being between consecutive occurrences of each
+     # key in words, lines or scenes, and gaps_at_least with a column
+     # per threshold of how many gaps are at least that long.
+
+word_dispersion_plot( index, [ 'ghost', 'slime' ], title )
+     # A dispersion plot of the word offsets of each key.
+
+The positions of every key are held in one array sorted by key and
+then offset, with each key's positions a slice of it, so statistics
+over every key are computed a whole array at a time.
+'''
+
+import numpy
+
+from tsl.script.reports.reports import plot_dispersion
+
+class PositionIndex( object ):
+
+    def __init__( self, Annotations, Structure=None, key='stem' ):
+        self.Annotations = Annotations
+
+        annotations = Annotations.annotations
+
+        if key == 'stem':
+            vocabulary_keys = annotations['stems']
+        elif key == 'token':
+            vocabulary_keys = [ x.lower() for x in annotations['vocabulary'] ]
+        else:
+            raise Exception( "Unknown key %s, expected one of stem or token" % ( key ) )
+
+        self.keys = sorted( set( vocabulary_keys ) )
+        self.key_ids = dict( [ ( x, i ) for ( i, x ) in enumerate( self.keys ) ] )
+
+        token_keys = numpy.array( [ self.key_ids[x] for x in vocabulary_keys ], dtype=int )[ numpy.array( annotations['tokens'], dtype=int ) ]
+
+        # A stable sort keeps each key's tokens in order of offset.
+        self.offsets = numpy.argsort( token_keys, kind='mergesort' )
+        self.starts = numpy.concatenate( ( [ 0 ], numpy.cumsum( numpy.bincount( token_keys, minlength=len( self.keys ) ) ) ) )
+
+        line_offsets = numpy.array( annotations['line_offsets'], dtype=int )
+        self.lines = numpy.searchsorted( line_offsets, self.offsets, side='right' )
+
+        # The scene number of each line, with line numbers from 1.
+        line_scenes = numpy.zeros( len( line_offsets ), dtype=int )
+        if Structure is not None:
+            for ( scene_id, scene ) in Structure.structure['scenes'].items():
+                line_scenes[ scene['first_line'] : scene['last_line'] + 1 ] = int( scene_id )
+        self.scenes = line_scenes[self.lines]
+
+        self.tokens = None
+
+    def get_slice( self, key ):
+        if key not in self.key_ids:
+            return slice( 0, 0 )
+        i = self.key_ids[key]
+        return slice( self.starts[i], self.starts[i+1] )
+
+    def get_offsets( self, key ):
+        return self.offsets[ self.get_slice( key ) ]
+
+    def get_lines( self, key ):
+        return self.lines[ self.get_slice( key ) ]
+
+    def get_scenes( self, key ):
+        return self.scenes[ self.get_slice( key ) ]
+
+    def get_positions( self, unit ):
+        if unit == 'word':
+            return self.offsets
+        elif unit == 'line':
+            return self.lines
+        elif unit == 'scene':
+            return self.scenes
+        else:
+            raise Exception( "Unknown unit %s, expected one of word, line or scene" % ( unit ) )
+
+    def get_concordance( self, key, width=5 ):
+        '''Return a list of the tokens from width before to width after
+        each occurrence of key.'''
+
+        if self.tokens is None:
+            self.tokens = self.Annotations.get_tokens()
+
+        return [ self.tokens[ max( 0, x - width ) : x + width + 1 ] for x in self.get_offsets( key ) ]
+
+    def get_gap_statistics( self, unit='line', thresholds=[] ):
+        '''Return a dictionary of arrays over self.keys, described in
+        the module documentation.'''
+
+        positions = self.get_positions( unit )
+
+        occurrences = numpy.diff( self.starts )
+
+        # The gap after each position but the last of its key, and the
+        # key it belongs to.
+        gaps = numpy.diff( positions )
+        gap_keys = numpy.repeat( numpy.arange( len( self.keys ) ), occurrences )[:-1]
+        within = numpy.ones( len( gaps ), dtype=bool )
+        within[ self.starts[1:-1][ self.starts[1:-1] > 0 ] - 1 ] = False
+        gaps = gaps[within]
+        gap_keys = gap_keys[within]
+
+        max_gap = numpy.zeros( len( self.keys ), dtype=int )
+        numpy.maximum.at( max_gap, gap_keys, gaps )
+
+        span = numpy.bincount( gap_keys, weights=gaps, minlength=len( self.keys ) ).astype( int )
+        mean_gap = span / numpy.maximum( occurrences - 1, 1 ).astype( float )
+
+        gaps_at_least = numpy.zeros( ( len( self.keys ), len( thresholds ) ), dtype=int )
+        for ( i, threshold ) in enumerate( thresholds ):
+            gaps_at_least[:, i] = numpy.bincount( gap_keys[ gaps >= threshold ], minlength=len( self.keys ) )
+
+        return {
+            'occurrences'   : occurrences,
+            'max_gap'       : max_gap,
+            'mean_gap'      : mean_gap,
+            'span'          : span,
+            'gaps_at_least' : gaps_at_least,
+            }
+
+def word_dispersion_plot( index, keys, title ):
+    '''Plot the word offsets of each of keys in the PositionIndex
+    index.'''
+    return plot_dispersion( [ index.get_offsets( x ) for x in keys ], keys, title )
@@ -0,0 +1,173 @@
+'''Answers top presence and interaction reports over contiguous ranges
+of scenes from cumulative counts.
+
+index = SceneRangeIndex( Presences, Interactions ) # Interactions is optional
+
+index.top_presences( 40, 75, top_n=5, noun_types=[CHARACTER] )
+index.top_interactions( 40, 75, top_n=5, interaction_types=[DISCUSS] )
+     # The same results as top_presences and top_interactions in
+     # tsl.script.reports.reports with a scene_list of scenes 40
+     # through 75, and the same options other than scene_list.
+
+( ranges, names, counts ) = index.window_presence_counts( 10, presence_types=[DISCUSS] )
+( ranges, pairs, counts ) = index.window_interaction_counts( 10, interaction_types=[SETTING] )
+     # For every run of 10 consecutive scenes, ranges holds the first
+     # and last scene and column i of counts the count for each name
+     # or pair over ranges[i].
+
+For each name we keep the running total of its presences of each
+presence type in scene order, and for each pair the running total of
+their interactions of each combination of interaction type and
+presence types.  The count over any range of scenes is then the
+difference of two of those totals.
+'''
+
+import bisect
+
+import numpy
+
+from tsl.script.parse.const import SETTING, DISCUSS, MENTION, APPEAR
+
+from tsl.script.reports.reports import count_valid_presence_types, select_top, valid_noun_types
+
+PRESENCE_TYPES = [ SETTING, DISCUSS, MENTION, APPEAR ]
+
+class SceneRangeIndex( object ):
+
+    def __init__( self, Presences, Interactions=None ):
+        self.Presences = Presences
+
+        presence_ns = Presences.presence_ns
+
+        scenes = set( Presences.presence_sn.keys() )
+        if Interactions is not None:
+            scenes.update( Interactions.interaction_sn.keys() )
+
+        # Scene numbers in order, and the position of each scene_id in
+        # that order.
+        self.scene_numbers = sorted( [ int( x ) for x in scenes ] )
+        positions = dict( [ ( str( x ), i ) for ( i, x ) in enumerate( self.scene_numbers ) ] )
+
+        # In presence_ns order, which is the order top_presences breaks
+        # ties in.
+        self.names = presence_ns.keys()
+        self.noun_types = numpy.array( [ presence_ns[x]['noun_type'] for x in self.names ], dtype=object )
+
+        counts = numpy.zeros( ( len( self.names ), len( PRESENCE_TYPES ), len( self.scene_numbers ) + 1 ), dtype=int )
+        type_indices = dict( [ ( x, i ) for ( i, x ) in enumerate( PRESENCE_TYPES ) ] )
+        for ( i, name ) in enumerate( self.names ):
+            for scene in presence_ns[name]:
+                if scene == 'noun_type':
+                    continue
+                for presence in presence_ns[name][scene]:
+                    counts[i, type_indices[presence['presence_type']], positions[scene] + 1] += 1
+        self.presence_totals = numpy.cumsum( counts, axis=2 )
+
+        if Interactions is None:
+            return
+
+        interaction_ns = Interactions.interaction_ns
+
+        # Each pair once, in the order top_interactions visits them.
+        self.pairs = []
+        for name1 in sorted( interaction_ns.keys() ):
+            for name2 in sorted( interaction_ns[name1].keys() ):
+                if name1 <= name2:
+                    self.pairs.append( ( name1, name2 ) )
+
+        # The combinations of interaction type and presence types which
+        # occur.
+        combination_indices = {}
+        self.combinations = []
+        entries = []
+        for ( i, ( name1, name2 ) ) in enumerate( self.pairs ):
+            for scene in interaction_ns[name1][name2]:
+                for interaction in interaction_ns[name1][name2][scene]:
+                    combination = ( interaction['interaction_type'], interaction['a']['presence_type'], interaction['b']['presence_type'] )
+                    if combination not in combination_indices:
+                        combination_indices[combination] = len( self.combinations )
+                        self.combinations.append( combination )
+                    entries.append( ( i, combination_indices[combination], positions[scene] + 1 ) )
+
+        counts = numpy.zeros( ( len( self.pairs ), len( self.combinations ), len( self.scene_numbers ) + 1 ), dtype=int )
+        for entry in entries:
+            counts[entry] += 1
+        self.interaction_totals = numpy.cumsum( counts, axis=2 )
+
+    def get_positions( self, first_scene, last_scene ):
+        '''Return the start and end positions in our running totals of
+        scenes first_scene through last_scene.'''
+        return ( bisect.bisect_left( self.scene_numbers, int( first_scene ) ),
+                 bisect.bisect_right( self.scene_numbers, int( last_scene ) ) )
+
+    def get_presence_weights( self, presence_types ):
+        return numpy.array( [ not presence_types or x in presence_types for x in PRESENCE_TYPES ], dtype=int )
+
+    def get_interaction_weights( self, interaction_types, presence_types ):
+        '''How much an interaction of each of our combinations counts
+        towards a report with these filters.'''
+        return numpy.array( [ count_valid_presence_types( type_a, type_b, presence_types ) if not interaction_types or interaction_type in interaction_types else 0
+                              for ( interaction_type, type_a, type_b ) in self.combinations ], dtype=int )
+
+    def get_pair_mask( self, noun_types ):
+        if not noun_types:
+            return numpy.ones( len( self.pairs ), dtype=bool )
+        return numpy.array( [ valid_noun_types( self.Presences, name1, name2, noun_types ) for ( name1, name2 ) in self.pairs ], dtype=bool )
+
+    def top_presences( self, first_scene, last_scene, top_n=0, min_appearances=1, noun_types=[], presence_types=[] ):
+        ( lo, hi ) = self.get_positions( first_scene, last_scene )
+
+        counts = numpy.dot( self.presence_totals[:, :, hi] - self.presence_totals[:, :, lo], self.get_presence_weights( presence_types ) )
+
+        keep = counts >= min_appearances
+        if noun_types:
+            keep &= numpy.array( [ x in noun_types for x in self.noun_types ], dtype=bool )
+
+        result = [ ( self.names[i], self.noun_types[i], int( counts[i] ) ) for i in numpy.flatnonzero( keep ) ]
+
+        return select_top( result, top_n, lambda x: -x[2] )
+
+    def top_interactions( self, first_scene, last_scene, top_n=0, min_interactions=1, noun_types=[], presence_types=[], interaction_types=[], names=None ):
+        ( lo, hi ) = self.get_positions( first_scene, last_scene )
+
+        counts = numpy.dot( self.interaction_totals[:, :, hi] - self.interaction_totals[:, :, lo], self.get_interaction_weights( interaction_types, presence_types ) )
+
+        result = []
+
+        for i in numpy.flatnonzero( ( counts >= min_interactions ) & self.get_pair_mask( noun_types ) ):
+            ( name1, name2 ) = self.pairs[i]
+            # When names are given we report the pair with a name from
+            # names first.
+            if names:
+                if name1 in names:
+                    pass
+                elif name2 in names:
+                    ( name1, name2 ) = ( name2, name1 )
+                else:
+                    continue
+            result.append( ( name1, name2, int( counts[i] ) ) )
+
+        return select_top( result, top_n, lambda x: ( -x[2], x[0], x[1] ) )
+
+    def get_windows( self, window, step ):
+        '''Return the start positions of each run of window scenes, and
+        the first and last scene numbers of each.'''
+
+        starts = numpy.arange( 0, len( self.scene_numbers ) - window + 1, step )
+        ranges = [ ( self.scene_numbers[x], self.scene_numbers[x + window - 1] ) for x in starts ]
+
+        return ( starts, ranges )
+
+    def window_presence_counts( self, window, step=1, presence_types=[] ):
+        ( starts, ranges ) = self.get_windows( window, step )
+
+        totals = numpy.tensordot( self.get_presence_weights( presence_types ), self.presence_totals, axes=( [ 0 ], [ 1 ] ) )
+
+        return ( ranges, self.names, totals[:, starts + window] - totals[:, starts] )
+
+    def window_interaction_counts( self, window, step=1, presence_types=[], interaction_types=[] ):
+        ( starts, ranges ) = self.get_windows( window, step )
+
+        totals = numpy.tensordot( self.get_interaction_weights( interaction_types, presence_types ), self.interaction_totals, axes=( [ 0 ], [ 1 ] ) )
+
+        return ( ranges, self.pairs, totals[:, starts + window] - totals[:, starts] )
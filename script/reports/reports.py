@@ -1,11 +1,43 @@
 from tsl.script.parse.const import CHARACTER, THING, LOCATION, SETTING, DISCUSS, MENTION, APPEAR
 
-import matplotlib.pyplot as plt
+import tsl.script.Script
+
+import csv
+import heapq
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import nltk.text
+import numpy
 from nltk.tokenize import word_tokenize
 import re
 import StringIO
 
+# Suffixes added to CSV report filenames for each compression format.
+CSV_COMPRESSION_SUFFIXES = {
+    None   : '',
+    'gzip' : '.gz',
+    'lzma' : '.xz',
+    }
+
+# Options of the specs given to run_reports and their defaults.
+PRESENCE_REPORT_DEFAULTS = {
+    'top_n'           : 0,
+    'min_appearances' : 1,
+    'noun_types'      : [],
+    'presence_types'  : [],
+    'scene_list'      : [],
+    }
+
+INTERACTION_REPORT_DEFAULTS = {
+    'top_n'             : 0,
+    'min_interactions'  : 1,
+    'noun_types'        : [],
+    'presence_types'    : [],
+    'scene_list'        : [],
+    'interaction_types' : [],
+    'names'             : None,
+    }
+
 def top_presences( Presences, top_n=0, min_appearances=1, noun_types=[], presence_types = [], scene_list=[] ):
     '''Return an array of name, noun_type, count tuples ordered in
     descending order of count.  
@@ -15,45 +47,7 @@ def top_presences( Presences, top_n=0, min_appearances=1, noun_types=[], presenc
     matching types in noun_types or presence_types or are constrained
     to scenes in scene_list.'''
 
-    presence_ns = Presences.presence_ns
-
-    result = []
-
-    for name in presence_ns:
-        appearances = 0
-
-        ntype = presence_ns[name]['noun_type']
-        if noun_types and not ntype in noun_types:
-            continue
-        
-        scenes = []
-        if scene_list:
-            scenes = list( 
-                set( 
-                    scene_list 
-                    ).intersection( 
-                    set( 
-                        presence_ns[name].keys() 
-                        ) 
-                    ) 
-                )
-        else:
-            scenes = [ scene for scene in presence_ns[name].keys() if scene != 'noun_type' ]
-        for scene in scenes:
-            if presence_types:
-                for appearance in presence_ns[name][scene]:
-                    if appearance['presence_type'] in presence_types:
-                        appearances += 1
-            else:
-                appearances += len( presence_ns[name][scene] )
-
-        if appearances >= min_appearances:
-            result.append( ( name, ntype, appearances ) )
-
-    if top_n > 0:
-        return sorted( result, key=lambda x: -x[2] )[:top_n]
-    else:
-        return sorted( result, key=lambda x: -x[2] )
+    return run_reports( Presences, None, [ { 'report' : 'presences', 'top_n' : top_n, 'min_appearances' : min_appearances, 'noun_types' : noun_types, 'presence_types' : presence_types, 'scene_list' : scene_list } ] )[0]
 
 def top_interactions( Presences, Interactions, top_n=0, min_interactions=1, noun_types=[], presence_types=[], scene_list=[], interaction_types=[], names=None ):
     '''Return an array of name1, name2, count tuples in descending order of count.
@@ -77,53 +71,170 @@ def top_interactions( Presences, Interactions, top_n=0, min_interactions=1, noun
     Finally a list of interaction types can be provided to limit the
     types of interactions desired.'''
 
-    interaction_ns = Interactions.interaction_ns
+    return run_reports( Presences, Interactions, [ { 'report' : 'interactions', 'top_n' : top_n, 'min_interactions' : min_interactions, 'noun_types' : noun_types, 'presence_types' : presence_types, 'scene_list' : scene_list, 'interaction_types' : interaction_types, 'names' : names } ] )[0]
 
-    result = []
+def run_reports( Presences, Interactions, specs ):
+    '''Answer a batch of top_presences and top_interactions queries
+    with a single pass over presence_ns and a single pass over
+    interaction_ns.
 
-    handled = {}
+    Each spec is a dictionary with a 'report' of either 'presences' or
+    'interactions', and otherwise the keyword arguments of
+    top_presences or top_interactions respectively, for example:
 
-    if not names:
-        names = sorted( interaction_ns.keys() )
-    else:
-        names.sort()
-
-    for name1 in names:
-        for name2 in sorted( interaction_ns[name1].keys() ):
-            # We have all interactions symetrically, so a-b and b-a
-            # will both appear.  For reporting we'll just show the a-b
-            # interactions, not the b-a interactions.
-            if name1 in handled and name2 in handled[name1]:
-                continue    
-            if name2 in handled:
-                handled[name2][name1] = True
-            else:
-                handled[name2] = { name1 : True }
-
-            interactions = 0
-            
-            if noun_types and not valid_noun_types( Presences, name1, name2, noun_types ):
+    run_reports( Presences, Interactions, [
+        { 'report' : 'presences', 'top_n' : 5, 'noun_types' : [ CHARACTER ] },
+        { 'report' : 'interactions', 'top_n' : 5, 'interaction_types' : [ SETTING ] } ] )
+
+    Returns a list with the result of each spec, in the order of
+    specs.  Interactions may be None if there are no interaction
+    specs.'''
+
+    results = [ [] for spec in specs ]
+
+    presence_specs = [ ( i, get_report_spec( spec, PRESENCE_REPORT_DEFAULTS ) ) for ( i, spec ) in enumerate( specs ) if spec['report'] == 'presences' ]
+    interaction_specs = [ ( i, get_report_spec( spec, INTERACTION_REPORT_DEFAULTS ) ) for ( i, spec ) in enumerate( specs ) if spec['report'] == 'interactions' ]
+
+    if len( presence_specs ) + len( interaction_specs ) != len( specs ):
+        raise Exception( "Report specs must have a report of presences or interactions: %s" % ( specs ) )
+
+    if presence_specs:
+        presence_ns = Presences.presence_ns
+
+        for name in presence_ns:
+            ntype = presence_ns[name]['noun_type']
+
+            active = [ ( i, spec ) for ( i, spec ) in presence_specs if not spec['noun_types'] or ntype in spec['noun_types'] ]
+            if not active:
                 continue
 
-            scenes = []
-            if scene_list:
-                scenes = list( set( scene_list ).intersection( set( interaction_ns[name1][name2].keys() ) ) )
-            else:
-                scenes = [ scene for scene in interaction_ns[name1][name2].keys() ]
+            # Tally this name's appearances by scene and presence type
+            # once, then each spec just sums the tallies it wants.
+            counts = {}
+            for scene in presence_ns[name]:
+                if scene == 'noun_type':
+                    continue
+                scene_counts = counts[scene] = {}
+                for appearance in presence_ns[name][scene]:
+                    presence_type = appearance['presence_type']
+                    scene_counts[presence_type] = scene_counts.get( presence_type, 0 ) + 1
+
+            for ( i, spec ) in active:
+                appearances = 0
+                for scene in counts:
+                    if spec['scene_list'] and scene not in spec['scene_list']:
+                        continue
+                    if spec['presence_types']:
+                        appearances += sum( [ counts[scene].get( x, 0 ) for x in spec['presence_types'] ] )
+                    else:
+                        appearances += sum( counts[scene].values() )
+
+                if appearances >= spec['min_appearances']:
+                    results[i].append( ( name, ntype, appearances ) )
+
+        for ( i, spec ) in presence_specs:
+            results[i] = select_top( results[i], spec['top_n'], lambda x: -x[2] )
+
+    if interaction_specs:
+        interaction_ns = Interactions.interaction_ns
+
+        for name1 in sorted( interaction_ns.keys() ):
+            for name2 in sorted( interaction_ns[name1].keys() ):
+                # We have all interactions symetrically, so a-b and b-a
+                # will both appear, we take each pair once.
+                if name2 < name1:
+                    continue
+
+                active = []
+                for ( i, spec ) in interaction_specs:
+                    # When names are given we report the pair with a
+                    # name from names first.
+                    if spec['names'] is None:
+                        pair = ( name1, name2 )
+                    elif name1 in spec['names']:
+                        pair = ( name1, name2 )
+                    elif name2 in spec['names']:
+                        pair = ( name2, name1 )
+                    else:
+                        continue
+
+                    if spec['noun_types'] and not valid_noun_types( Presences, pair[0], pair[1], spec['noun_types'] ):
+                        continue
+
+                    active.append( ( i, spec, pair ) )
+
+                if not active:
+                    continue
+
+                counts = {}
+                for scene in interaction_ns[name1][name2]:
+                    for interaction in interaction_ns[name1][name2][scene]:
+                        key = ( scene, interaction['interaction_type'], interaction['a']['presence_type'], interaction['b']['presence_type'] )
+                        counts[key] = counts.get( key, 0 ) + 1
+
+                for ( i, spec, pair ) in active:
+                    interactions = 0
+                    for ( ( scene, interaction_type, type_a, type_b ), count ) in counts.items():
+                        if spec['scene_list'] and scene not in spec['scene_list']:
+                            continue
+                        if spec['interaction_types'] and interaction_type not in spec['interaction_types']:
+                            continue
+                        interactions += count * count_valid_presence_types( type_a, type_b, spec['presence_types'] )
+
+                    if interactions >= spec['min_interactions']:
+                        results[i].append( ( pair[0], pair[1], interactions ) )
+
+        for ( i, spec ) in interaction_specs:
+            results[i] = select_top( results[i], spec['top_n'], lambda x: ( -x[2], x[0], x[1] ) )
+
+    return results
+
+def get_report_spec( spec, defaults ):
+    '''Fill in the defaults for a report spec, with the filters we test
+    membership of turned into sets.'''
+
+    result = dict( defaults )
+
+    for key in spec:
+        if key == 'report':
+            continue
+        if key not in defaults:
+            raise Exception( "Unknown option %s for %s report." % ( key, spec['report'] ) )
+        result[key] = spec[key]
+
+    for key in [ 'scene_list', 'interaction_types', 'names' ]:
+        if result.get( key ):
+            result[key] = set( result[key] )
+    if result.get( 'names' ) is not None and not result['names']:
+        result['names'] = None
+
+    if spec['report'] == 'presences':
+        result['presence_types'] = list( set( result['presence_types'] ) )
 
-            for scene in scenes:
-                if interaction_types:
-                    interactions += count_valid_interactions( [ i for i in interaction_ns[name1][name2][scene] if i['interaction_type'] in interaction_types ], presence_types )
-                else:
-                    interactions += count_valid_interactions( interaction_ns[name1][name2][scene], presence_types )
+    return result
 
-            if interactions >= min_interactions:
-                result.append( ( name1, name2, interactions ) )
+def select_top( result, top_n, key ):
+    '''Return the top_n elements of result in order of key, or all of
+    them if top_n is 0, selecting rather than sorting everything when
+    we can.'''
 
     if top_n > 0:
-        return sorted( result, key=lambda x: -x[2] )[:top_n]
+        return heapq.nsmallest( top_n, result, key=key )
     else:
-        return sorted( result, key=lambda x: -x[2] )
+        return sorted( result, key=key )
+
+def count_valid_presence_types( type_a, type_b, presence_types ):
+    '''How many times an interaction between presences of type_a and
+    type_b counts towards count_valid_interactions.'''
+
+    if presence_types:
+        count = 0
+        for type1, type2 in presence_types:
+            if ( type_a == type1 and type_b == type2 ) or ( type_a == type2 and type_b == type1 ):
+                count += 1
+        return count
+    else:
+        return 1
 
 def count_valid_interactions( interactions, presence_types ):
     if presence_types:
@@ -150,55 +261,97 @@ def valid_noun_types( Presences, p1, p2, noun_types ):
 
 
 def print_interaction_ns( Interactions ):
+    output = StringIO.StringIO()
+    write_interaction_ns( Interactions, output )
+    return output.getvalue()
+
+def write_interaction_ns( Interactions, f ):
+    '''Write each interaction in interaction_ns to the file object f
+    as a line of name1 name2 interaction_type line_no.'''
 
     interaction_ns = Interactions.interaction_ns
 
-    x = ''
     for name1 in interaction_ns:
         for name2 in interaction_ns[name1]:
             for scene in interaction_ns[name1][name2]:
                 for i in interaction_ns[name1][name2][scene]:
-                    x += ' '.join([ i['a']['name'],i['b']['name'],i['interaction_type'],str( i['where']['line_no'] ) ])
-                    x += "\n"
-    return x
+                    f.write( ' '.join( encode_csv_row( [ i['a']['name'], i['b']['name'], i['interaction_type'], str( i['where']['line_no'] ) ] ) ) )
+                    f.write( "\n" )
 
 def get_presence_csv( Presences ):
-    '''Return a CSV like string with all presences, including noun,
-    noun type, presence_type, and where information.'''
-    ret = "name,nount_type,presence_type,scene_id,page_no,line_no\n"
+    '''Return a CSV string with all presences, including noun, noun
+    type, presence_type, and where information.'''
+    output = StringIO.StringIO()
+    write_presence_csv( Presences, output )
+    return output.getvalue()
+
+def write_presence_csv( Presences, f ):
+    '''Write the rows of get_presence_csv to the file object f one at
+    a time.'''
+    write_csv_rows( f, iter_presence_rows( Presences ) )
+
+def iter_presence_rows( Presences ):
+    '''Yield the header and then a row for each presence.'''
 
     presences = Presences.presences
     presence_ns = Presences.presence_ns
-    
 
-    for p in presences:
-        ret += ','.join( [ p['name'], presence_ns[p['name']]['noun_type'], p['presence_type'], p['where']['scene_id'], str( p['where']['page_no'] ), str( p['where']['line_no'] ) ] )
-        ret += "\n"
+    yield [ 'name', 'nount_type', 'presence_type', 'scene_id', 'page_no', 'line_no' ]
 
-    return ret
+    for p in presences:
+        yield [ p['name'], presence_ns[p['name']]['noun_type'], p['presence_type'], p['where']['scene_id'], p['where']['page_no'], p['where']['line_no'] ]
 
 def get_interaction_csv( Presences, Interactions ):
-    '''Return a CSV like string with all interactions including both
+    '''Return a CSV string with all interactions including both
     nouns, types, presence_types, interaction type, and where
     information'''
+    output = StringIO.StringIO()
+    write_interaction_csv( Presences, Interactions, output )
+    return output.getvalue()
+
+def write_interaction_csv( Presences, Interactions, f ):
+    '''Write the rows of get_interaction_csv to the file object f one
+    at a time.'''
+    write_csv_rows( f, iter_interaction_rows( Presences, Interactions ) )
+
+def iter_interaction_rows( Presences, Interactions ):
+    '''Yield the header and then a row for each interaction.'''
 
     presence_ns = Presences.presence_ns
     interactions = Interactions.interactions
 
-    ret = "noun1,noun1_type,noun1_presence_type,noun2,noun2_type,noun2_presence_type,interaction_type,scene_id,page_no,line_no\n"
+    yield [ 'noun1', 'noun1_type', 'noun1_presence_type', 'noun2', 'noun2_type', 'noun2_presence_type', 'interaction_type', 'scene_id', 'page_no', 'line_no' ]
 
     for i in interactions:
         p1 = i['a']
         p2 = i['b']
-        interaction_type = i['interaction_type']
         where = i['where']
-        
-        ret += ','.join( [ p1['name'], presence_ns[p1['name']]['noun_type'], p1['presence_type'], 
-                           p2['name'], presence_ns[p2['name']]['noun_type'], p2['presence_type'], 
-                           interaction_type, where['scene_id'], str( where['page_no'] ) , str( where['line_no'] ) ] )
-        ret += "\n"
 
-    return ret
+        yield [ p1['name'], presence_ns[p1['name']]['noun_type'], p1['presence_type'],
+                p2['name'], presence_ns[p2['name']]['noun_type'], p2['presence_type'],
+                i['interaction_type'], where['scene_id'], where['page_no'], where['line_no'] ]
+
+def open_csv_file( filename, compression=None ):
+    '''Open filename for writing a CSV report, with compression of
+    None, 'gzip' or 'lzma' adding a .gz or .xz suffix respectively.
+    Returns the file object.'''
+
+    if compression not in CSV_COMPRESSION_SUFFIXES:
+        raise Exception( "Unknown compression %s, expected one of %s" % ( compression, CSV_COMPRESSION_SUFFIXES.keys() ) )
+
+    return tsl.script.Script.open_output_file( filename + CSV_COMPRESSION_SUFFIXES[compression], 'wb' )
+
+def write_csv_rows( f, rows ):
+    '''Write rows to the file object f as they are produced, quoting
+    any fields which contain commas, quotes or newlines.'''
+
+    writer = csv.writer( f, lineterminator="\n" )
+    for row in rows:
+        writer.writerow( encode_csv_row( row ) )
+
+def encode_csv_row( row ):
+    # The Python 2 csv module only handles byte strings.
+    return [ x.encode( 'utf-8' ) if isinstance( x, unicode ) else x for x in row ]
 
 def get_singletons( Presences ):
     '''Return a list of nouns that only appear once.'''
@@ -235,6 +388,34 @@ def presence_plot( Script, names, title ):
         new_names,
         title )
 
+def presence_dispersion_plot( Script, Presences, names, title ):
+    '''Produce the same plot as presence_plot from the lines Presences
+    already found each name on, rather than by searching the script
+    text for them.'''
+
+    return plot_dispersion( get_presence_offsets( Script, Presences, names ), names, title )
+
+def get_presence_offsets( Script, Presences, names ):
+    '''Return a list with a sorted array for each of names of the word
+    offsets of the start of each line that name is present on.'''
+
+    script_lines = Script.script_lines
+    presence_ns = Presences.presence_ns
+
+    word_counts = numpy.array( [ len( x['content'].split() ) for x in script_lines ], dtype=int )
+    line_offsets = numpy.concatenate( ( [ 0 ], numpy.cumsum( word_counts ) ) )
+
+    result = []
+
+    for name in names:
+        line_nos = []
+        for scene in presence_ns.get( name, {} ):
+            if scene != 'noun_type':
+                line_nos += [ p['where']['line_no'] for p in presence_ns[name][scene] ]
+        result.append( numpy.sort( line_offsets[ numpy.array( line_nos, dtype=int ) - 1 ] ) )
+
+    return result
+
 def dispersion_plot(text, words, title="Lexical Dispersion Plot"):
     """
     Generate a lexical dispersion plot.
@@ -243,36 +424,40 @@ def dispersion_plot(text, words, title="Lexical Dispersion Plot"):
     :type text: list(str) or enum(str)
     :param words: The target words
     :type words: list of str
-    :param ignore_case: flag to set if case should be ignored when searching text
-    :type ignore_case: bool
     """
-    text = list(text)
-    words.reverse()
-    
-    words_to_comp = words
-    text_to_comp = text
-
-    points = [(x,y) for x in range(len(text_to_comp))
-              for y in range(len(words_to_comp))
-              if text_to_comp[x] == words_to_comp[y]]
-    if points:
-        x, y = zip(*points)
-    else:
-        x = y = ()
+    text = numpy.array( list( text ), dtype=object )
 
-    filename = re.sub( r'\s+', '_', title )
-    if filename[-4:] != '.png':
-        filename += '.png'
+    return plot_dispersion( [ numpy.flatnonzero( text == word ) for word in words ], words, title )
 
-    plt.plot(x, y, "b|", scalex=.1)
-    plt.yticks(range(len(words)), words, color="b")
-    plt.ylim(-1, len(words))
-    plt.title(title)
-    plt.xlabel("Word Offset")
-    output = StringIO.StringIO()
+def plot_dispersion( offsets, words, title ):
+    '''Plot the array of word offsets offsets[i] on the row labeled
+    words[i], with the first of words at the top.  Returns a StringIO
+    holding the PNG.
 
-    plt.savefig(output, format='png')
+    This draws on its own Agg figure rather than through pyplot's
+    global state, so plots can be made concurrently and without a
+    display.'''
+
+    rows = len( words )
+
+    if offsets:
+        x = numpy.concatenate( offsets )
+    else:
+        x = numpy.array( [] )
+    y = numpy.repeat( numpy.arange( rows - 1, -1, -1 ), [ len( o ) for o in offsets ] )
+
+    figure = Figure()
+    FigureCanvasAgg( figure )
+    axes = figure.add_subplot( 111 )
+
+    axes.plot( x, y, "b|", scalex=.1 )
+    axes.set_yticks( range( rows ) )
+    axes.set_yticklabels( list( reversed( words ) ), color="b" )
+    axes.set_ylim( -1, rows )
+    axes.set_title( title )
+    axes.set_xlabel( "Word Offset" )
+    output = StringIO.StringIO()
 
-    plt.clf()
+    figure.savefig( output, format='png' )
 
     return output
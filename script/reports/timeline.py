@@ -0,0 +1,141 @@
+'''Series of how a script unfolds over its length, at any resolution.
+
+timeline = Timeline( Structure, Presences ) # Presences is only needed for the presence series
+
+edges = timeline.get_edges( 100 )     # 101 word offsets splitting the script into 100 equal windows
+edges = timeline.get_page_edges( Script )
+     # The word offset of the start of each page, and of the end
+
+timeline.words( edges )               # Words in each window between consecutive edges
+timeline.dialog( edges )              # Words of dialog in each window
+timeline.dialog_density( edges )      # dialog over words
+timeline.presence( 'VENKMAN', edges ) # Presences of VENKMAN in each window
+timeline.presence( 'VENKMAN', edges, presence_types=[ DISCUSS ] )
+timeline.speakers( edges )            # How many characters speak in each window
+timeline.location_switches( edges )   # How many times the setting changes in each window
+
+Word offsets are counted as in Structure, with the words of each
+block of a scene spread evenly over its lines.  Word counts are kept as
+running totals at each block boundary and presences as sorted arrays
+of their offsets, so the totals over any set of windows are found from
+the edges alone whatever the size of the windows.  Each window
+includes its first edge and not its last, except the last window
+which includes the end of the script.
+'''
+
+import numpy
+
+from tsl.script.parse.const import CHARACTER, DISCUSS, LOCATION, SETTING
+
+class Timeline( object ):
+
+    def __init__( self, Structure, Presences=None ):
+        scenes = Structure.structure['scenes']
+
+        blocks = []
+        for scene_id in sorted( scenes.keys(), key=int ):
+            blocks += scenes[scene_id]['scene_blocks']
+
+        words = numpy.array( [ x['total_words'] for x in blocks ], dtype=int )
+        dialog = numpy.array( [ x['total_words'] if x['block_type'] == 'DIALOG' else 0 for x in blocks ], dtype=int )
+
+        self.total_words = int( words.sum() )
+
+        # Running totals at the start of each block and at the end.
+        self.boundaries = numpy.concatenate( ( [ 0 ], numpy.cumsum( words ) ) )
+        self.cumulative_dialog = numpy.concatenate( ( [ 0 ], numpy.cumsum( dialog ) ) )
+
+        # The line each block starts on and the line after the last.
+        self.boundary_lines = numpy.array( [ x['first_line'] for x in blocks ] + [ blocks[-1]['last_line'] + 1 ], dtype=float )
+
+        self.scene_starts = {}
+        offset = 0
+        for scene_id in sorted( scenes.keys(), key=int ):
+            self.scene_starts[scene_id] = offset
+            offset += scenes[scene_id]['total_words']
+
+        if Presences is not None:
+            self.index_presences( Presences )
+
+    def index_presences( self, Presences ):
+        presences = Presences.presences
+
+        offsets = self.get_line_offsets( [ x['where']['line_no'] for x in presences ] )
+
+        # A stable sort keeps presences on the same line in script
+        # order.
+        order = numpy.argsort( offsets, kind='mergesort' )
+
+        # Keyed on name and then presence type, the sorted offsets of
+        # each presence.
+        self.presence_offsets = {}
+        for i in order:
+            presence = presences[i]
+            self.presence_offsets.setdefault( presence['name'], {} ).setdefault( presence['presence_type'], [] ).append( offsets[i] )
+        for name in self.presence_offsets:
+            for presence_type in self.presence_offsets[name]:
+                self.presence_offsets[name][presence_type] = numpy.array( self.presence_offsets[name][presence_type] )
+
+        self.speaker_names = sorted( [ x for x in self.presence_offsets if DISCUSS in self.presence_offsets[x] and Presences.presence_ns[x]['noun_type'] == CHARACTER ] )
+
+        # Counted as in metrics.py, each setting presence of a location
+        # other than the one before it.
+        switches = []
+        current_location = None
+        for presence in presences:
+            if presence['presence_type'] == SETTING and presence['noun_type'] == LOCATION:
+                if presence['name'] != current_location:
+                    switches.append( presence['where']['line_no'] )
+                current_location = presence['name']
+        self.switch_offsets = numpy.sort( self.get_line_offsets( switches ) )
+
+    def get_line_offsets( self, line_nos ):
+        '''Return the word offset of the start of each of line_nos.'''
+        return numpy.interp( numpy.asarray( line_nos, dtype=float ), self.boundary_lines, self.boundaries )
+
+    def get_edges( self, windows ):
+        return numpy.linspace( 0, self.total_words, windows + 1 )
+
+    def get_page_edges( self, Script ):
+        first_lines = {}
+        for line in Script.script_lines:
+            if line['page_no'] not in first_lines:
+                first_lines[line['page_no']] = line['line_no']
+
+        edges = self.get_line_offsets( [ first_lines[x] for x in sorted( first_lines ) ] )
+        edges[0] = 0
+
+        return numpy.append( edges, self.total_words )
+
+    def words( self, edges ):
+        return numpy.diff( numpy.interp( edges, self.boundaries, self.boundaries ) )
+
+    def dialog( self, edges ):
+        return numpy.diff( numpy.interp( edges, self.boundaries, self.cumulative_dialog ) )
+
+    def dialog_density( self, edges ):
+        words = self.words( edges )
+        return self.dialog( edges ) / numpy.maximum( words, 1e-9 ) * ( words > 0 )
+
+    def count_events( self, offsets, edges ):
+        '''Return how many of the sorted offsets are in each window.'''
+        edges = numpy.array( edges, dtype=float )
+        # So events at the very end fall in the last window.
+        edges[-1] = numpy.inf
+        return numpy.diff( numpy.searchsorted( offsets, edges, side='left' ) )
+
+    def presence( self, name, edges, presence_types=[] ):
+        result = numpy.zeros( len( edges ) - 1, dtype=int )
+        for ( presence_type, offsets ) in self.presence_offsets.get( name, {} ).items():
+            if not presence_types or presence_type in presence_types:
+                result += self.count_events( offsets, edges )
+        return result
+
+    def speakers( self, edges ):
+        result = numpy.zeros( len( edges ) - 1, dtype=int )
+        for name in self.speaker_names:
+            result += self.count_events( self.presence_offsets[name][DISCUSS], edges ) > 0
+        return result
+
+    def location_switches( self, edges ):
+        return self.count_events( self.switch_offsets, edges )
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+'''Computes and saves the word tokens, part of speech tags and stems of
+each film's raw script, which metrics.py and the word histogram
+utilities then read rather than tagging the script themselves.
+
+Each film must have been parsed first, its scenes are tagged in
+parallel across a pool of processes shared by every film.
+
+Usage, from the utils directory:
+
+    ./annotate_scripts.py                   # Every film, a tagging process per core
+    ./annotate_scripts.py Ghostbusters Dune
+    ./annotate_scripts.py --processes 4
+'''
+
+import argparse
+import re
+import time
+
+import tsl.script.parse.annotate
+import tsl.script.Structure
+
+from tsl.utils.corpus import scripts
+
+def process_script( script, processes=None, pool=None ):
+    name = script[0]
+    script_file = script[1]
+
+    print "Annotating:", name
+
+    outdir = '../example-scripts/parsed/' + re.sub( r'\s+', '_', name.lower() )
+
+    Structure = tsl.script.Structure.Structure( name, outdir )
+    Structure.load()
+
+    Annotations = tsl.script.parse.annotate.annotate_script( name, script_file, outdir, Structure, processes, pool )
+    Annotations.save( pretty=False )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Annotate the scripts of the corpus with tokens, part of speech tags and stems.' )
+    parser.add_argument( 'films', nargs='*', help='Names of films to process, defaults to the whole corpus.' )
+    parser.add_argument( '--processes', type=int, default=None, help='Number of tagging processes, defaults to the number of cores.' )
+    args = parser.parse_args()
+
+    films = scripts
+    if args.films:
+        films = [ x for x in scripts if x[0] in args.films ]
+        unknown = set( args.films ) - set( [ x[0] for x in films ] )
+        if unknown:
+            raise Exception( "Unknown films: %s" % ( ', '.join( sorted( unknown ) ) ) )
+
+    pool = tsl.script.parse.annotate.create_pool( args.processes )
+
+    try:
+        for film in films:
+            start = time.time()
+            process_script( film, pool=pool )
+            print "%s took %0.02f seconds" % ( film[0], time.time() - start )
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -1,5 +1,6 @@
 #!/usr/bin/python
 
+import argparse
 import json
 import matplotlib.pyplot as plt
 import networkx as nx
@@ -16,40 +17,17 @@ import uuid
 
 import tsl.script.Presences
 import tsl.script.Interactions
+import tsl.script.Scenes
 import tsl.script.Script
 import tsl.script.Structure
 
 from tsl.script.parse.const import CHARACTER, DISCUSS, LOCATION, SETTING
+from tsl.script.reports.incidence import SceneIncidence
 from tsl.script.reports.reports import top_presences, top_interactions, get_presence_csv, get_interaction_csv
 
+from tsl.utils.corpus import scripts
 from tsl.utils.partition import get_dramatic_unit_partitions
 
-scripts = [
-#    ( 'Chinatown', '../example-scripts/chinatown.txt' ),
-#    ( 'Dune', '../example-scripts/dune.txt' ),
-    ( 'Ghostbusters', '../example-scripts/ghostbusters.txt' ),
-#    ( 'The Matrix', '../example-scripts/the_matrix.txt' ),
-#    ( 'Good Will Hunting', '../example-scripts/good_will_hunting.txt' ),
-#    ( 'The Book of Eli', '../example-scripts/the_book_of_eli.txt' ),
-#    ( 'Starwars', '../example-scripts/starwars.txt' ),
-#    ( 'Alien', '../example-scripts/alien.txt' ),
-#    ( 'Vertigo', '../example-scripts/vertigo.txt' ),
-#    ( 'Terminator 2', '../example-scripts/terminator_2.txt' ),
-#    ( 'Ratatouille', '../example-scripts/ratatouille.txt' ),
-    # Questionable formatting
-#    ( 'Analyze That', '../example-scripts/analyze_that.txt' ),
-#    ( 'Batman Begins', '../example-scripts/batman_begins.txt' ),
-#    ( 'Death to Smoochy', '../example-scripts/death_to_smoochy.txt' ),
-#    ( 'Get Carter', '../example-scripts/get_carter.txt' ),
-#    ( 'Gothika', '../example-scripts/gothika.txt' ),
-#    ( 'Groundhogs Day', '../example-scripts/groundhogs_day.txt' ),
-#    ( 'Red Planet', '../example-scripts/red_planet.txt' ),
-#    ( 'Smurfs', '../example-scripts/smurfs.txt' ),
-#    ( 'Sweet November', '../example-scripts/sweet_november.txt' ),
-#    ( 'Taking Lives', '../example-scripts/taking_lives.txt' ),
-#    ( 'Thirteen Ghosts', '../example-scripts/thirteen_ghosts.txt' ),
-    ]
-
 def character_lines( script ):
     #import pdb
     #pdb.set_trace()
@@ -79,17 +57,18 @@ def character_lines( script ):
     #Script = tsl.script.Script.Script( name, outdir )
     #Script.load()
 
-    Structure = tsl.script.Structure.Structure( name, outdir )
-    Structure.load()
+    Scenes = tsl.script.Scenes.Scenes( name, outdir )
+    Scenes.load()
 
     Presences = tsl.script.Presences.Presences( name, outdir )
     Presences.load()
 
-    structure = Structure.structure
-    presence_sn = Presences.presence_sn
+    # The structure and presences of every scene in one read.
+    scene_ids = sorted( Scenes.scene_index.keys(), key=int )
+    scenes = Scenes.load_scenes( scene_ids[0], scene_ids[-1] )
 
-    total_dialog_words = structure['dialog_words']
-    total_words = structure['total_words']
+    total_dialog_words = sum( [ x['structure']['dialog_words'] for x in scenes.values() ] )
+    total_words = sum( [ x['structure']['total_words'] for x in scenes.values() ] )
 
     top_ns = [ 1, 2, 4, 8, 16, 1024 ]
     top_ns = [ 2 ] 
@@ -113,20 +92,17 @@ def character_lines( script ):
         character_names_to_number = {}
         character_number = 0
         
-        co_occurences = numpy.zeros( shape=( top_n, top_n ) )
-
         for character in top_characters:
             top_character_names[character[0]] = True
             character_names_to_number[character[0]] = character_number
-            co_occurences[character_number][character_number] = 1
             
             sankey['nodes'].append( { 'name' : character[0] } )
 
             character_number += 1
 
-        for scene_key in sorted( structure['scenes'].keys(), 
-                                 key=lambda x: structure['scenes'][x]['scene_number'] ):
-            scene = structure['scenes'][scene_key]
+        for scene_key in sorted( scenes.keys(), 
+                                 key=lambda x: scenes[x]['structure']['scene_number'] ):
+            scene = scenes[scene_key]['structure']
 
             scene_dialog_words = scene['dialog_words']
             scene_total_words = scene['total_words']
@@ -137,7 +113,7 @@ def character_lines( script ):
 
             scene_uuid = str( uuid.uuid4() )
 
-            for ( name, presence_list ) in presence_sn[scene_key].items():
+            for ( name, presence_list ) in scenes[scene_key]['presence_sn'].items():
                 for presence in presence_list:
                     if presence['presence_type'] == SETTING:
                         scene_location = name
@@ -181,12 +157,6 @@ def character_lines( script ):
 
             running_words += scene_total_words
 
-            for i in scene_character_list:
-                for j in scene_character_list:
-                    co_occurences[i][j] += 1
-                    if i != j:
-                        co_occurences[j][i] += 1
-
             # Sankey links.
             for i in scene_character_list:
                 current_loc = len( scene_data )
@@ -250,6 +220,13 @@ def character_lines( script ):
         f.close()
 
 
+        # One more than the number of scenes each character is in down
+        # the diagonal, and twice the number of scenes each pair share
+        # elsewhere.
+        shared = SceneIncidence( Presences, names=[ x[0] for x in top_characters ] ).co_presence()
+        co_occurences = numpy.zeros( shape=( top_n, top_n ) )
+        co_occurences[:len( shared ), :len( shared )] = 2 * shared - numpy.diag( numpy.diag( shared ) ) + numpy.identity( len( shared ) )
+
         normalized = normalize( co_occurences )
         distances = sklearn.metrics.pairwise.pairwise_distances( normalized )
         groups = DBSCAN( min_samples=1 ).fit_predict( distances )
@@ -276,5 +253,17 @@ def output_top_interactions( interactions, filename ):
         f.write( "\n" )
     f.close()
 
-for script in scripts:
-    character_lines( script )
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Write the character lines of the films of the corpus.' )
+    parser.add_argument( 'films', nargs='*', help='Names of films to process, defaults to the whole corpus.' )
+    args = parser.parse_args()
+
+    films = scripts
+    if args.films:
+        films = [ x for x in scripts if x[0] in args.films ]
+        unknown = set( args.films ) - set( [ x[0] for x in films ] )
+        if unknown:
+            raise Exception( "Unknown films: %s" % ( ', '.join( sorted( unknown ) ) ) )
+
+    for film in films:
+        character_lines( film )
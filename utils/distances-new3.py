@@ -8,12 +8,15 @@ import networkx as nx
 import numpy
 import os
 import re
+import scipy.spatial.distance
 import shutil
 import sys
 
 import pprint
 pp = pprint.PrettyPrinter( indent=4 )
 
+from tsl.utils import metrics_table
+
 # Dimensions
 #
 # Don't change the order of things here unless you also change the
@@ -129,95 +132,89 @@ def projection_plot( movies, dimensions, title="Density versus Eccentricity", ou
 
 def get_movies( movies_dir, partition="all" ):
     '''Returns a hash keyed on movie title whose body is the Python
-    data structure made up of the _metrics.json for this film in the
-    movies_dir.
+    data structure made up of the _metrics.json for this film, read
+    in one query from the corpus metrics table in movies_dir.
 
     Parition is one of 'released', 'blacklist', or anything else.  If
     it is released only certain films will be operated on, if it is
     blacklist the inverse of that set is operated on, if it is
     something else all films are operated on.
     '''
+    connection = metrics_table.connect( movies_dir + '/metrics.sqlite' )
+    all_movies = metrics_table.get_metrics( connection )
+    connection.close()
+
     movies = {}
-    for dirpath, dirnames, filenames in os.walk( movies_dir):
-        for directory in dirnames:
-            metrics_files = [ x for x in os.listdir( os.path.join( dirpath, directory ) ) if x.endswith( '_metrics.json' ) ]
-            if len( metrics_files ) == 0:
-                print "Skipping %s/%s" % ( dirpath, directory )
-                continue
-                
-            metrics = json.load( open( os.path.join( dirpath, directory, metrics_files[0] ) ) )
-            
-            #if metrics['title'] not in ['Ghostbusters', 'Dune', 'Starwars', 'Vertigo', 'All is Lost']:
-            #if metrics['title'] not in ['Ghostbusters', 'Dune', 'Starwars' ]:
-            #    continue
-            
-            released = [
-                'Chinatown', 
-                'Dune', 
-                'Ghostbusters', 
-                'The Matrix', 
-                'Good Will Hunting', 
-                'The Book of Eli', 
-                'Starwars', 
-                'Alien', 
-                'Vertigo', 
-                'Terminator 2', 
-                'Ratatouille', 
-                'Analyze That', 
-                'Batman Begins', 
-                'Death to Smoochy', 
-                'Get Carter', 
-                'Gothika', 
-                'Groundhogs Day', 
-                'Red Planet', 
-                'Smurfs', 
-                'Sweet November', 
-                'Taking Lives', 
-                'Thirteen Ghosts', 
-                '42', 
-                'Frozen', 
-                'Fruitvale Station', 
-                'All is Lost', 
-                'Amour', 
-                'Argo', 
-                'August Osage County', 
-                'Celest and Jesse Forever', 
-                'Chronicle', 
-                'Dallas Buyers Club', 
-                'Despicable Me 2', 
-                'The Wolf of Wall Street', 
-                'Prince of Persia', 
-                'Oz the Great and Powerful', 
-                'Nebraska', 
-                'Monsters University', 
-                'Magic Mike', 
-                'Lone Survivor', 
-                'Kill Your Darlings', 
-                'Kick Ass 2', 
-                'The Great Gatsby', 
-                'The Invisible Woman', 
-                'The Past', 
-                'Twilight', 
-                'Wadjda', 
-                'Woman in Black', 
-                'Prisoners', 
-                'Real Steel', 
-                'Rush', 
-                'Rust and Bone', 
-                'Skyfall', 
-                'Smashed', 
-                'Snow White and the Huntsman', 
-                'The Croods', 
-                'Beautiful Creatures',
-                'The Killing Floor'
-                ]
-            
-            if partition == "released" and metrics['title'] not in released:
-                continue
-            elif partition == "blacklist" and metrics['title'] in released:
-                continue
+    for title in sorted( all_movies.keys() ):
+        metrics = all_movies[title]
+
+        released = [
+            'Chinatown', 
+            'Dune', 
+            'Ghostbusters', 
+            'The Matrix', 
+            'Good Will Hunting', 
+            'The Book of Eli', 
+            'Starwars', 
+            'Alien', 
+            'Vertigo', 
+            'Terminator 2', 
+            'Ratatouille', 
+            'Analyze That', 
+            'Batman Begins', 
+            'Death to Smoochy', 
+            'Get Carter', 
+            'Gothika', 
+            'Groundhogs Day', 
+            'Red Planet', 
+            'Smurfs', 
+            'Sweet November', 
+            'Taking Lives', 
+            'Thirteen Ghosts', 
+            '42', 
+            'Frozen', 
+            'Fruitvale Station', 
+            'All is Lost', 
+            'Amour', 
+            'Argo', 
+            'August Osage County', 
+            'Celest and Jesse Forever', 
+            'Chronicle', 
+            'Dallas Buyers Club', 
+            'Despicable Me 2', 
+            'The Wolf of Wall Street', 
+            'Prince of Persia', 
+            'Oz the Great and Powerful', 
+            'Nebraska', 
+            'Monsters University', 
+            'Magic Mike', 
+            'Lone Survivor', 
+            'Kill Your Darlings', 
+            'Kick Ass 2', 
+            'The Great Gatsby', 
+            'The Invisible Woman', 
+            'The Past', 
+            'Twilight', 
+            'Wadjda', 
+            'Woman in Black', 
+            'Prisoners', 
+            'Real Steel', 
+            'Rush', 
+            'Rust and Bone', 
+            'Skyfall', 
+            'Smashed', 
+            'Snow White and the Huntsman', 
+            'The Croods', 
+            'Beautiful Creatures',
+            'The Killing Floor'
+            ]
+        
+        if partition == "released" and metrics['title'] not in released:
+            continue
+        elif partition == "blacklist" and metrics['title'] in released:
+            continue
 
-            movies[metrics['title']] = metrics
+        movies[metrics['title']] = metrics
 
     return movies
 
@@ -367,7 +364,54 @@ def cartesian_distance( dists ):
         total_dist += dist**2
     return total_dist**0.5
 
-def compute_distances( movies, dist_funcs, distance_func, dimensions ):
+def five_vect_features( value, lookup ):
+    '''The coordinates five_vect compares, the first weighted by 3
+    and 0 past the end of value.'''
+    result = []
+    for i in range( 0, 5 ):
+        if i >= len( value ):
+            result.append( 0 )
+        elif i == 0:
+            result.append( 3*value[i][lookup] )
+        else:
+            result.append( value[i][lookup] )
+    return result
+
+# For dimensions whose value isn't a number, function of the value
+# returning the coordinates it contributes to a movie's feature vector.
+# The Euclidean distance between feature vectors is then the
+# cartesian_distance of the dist_funcs of register_dist_funcs.
+feature_funcs = {
+    'character_x_speakers' : lambda x: five_vect_features( x, 'speakers' ),
+    'scenes_percentage_for_characters' : lambda x: five_vect_features( x, 'percentage_of_scenes' ),
+    'percent_dialog_by_character' : lambda x: five_vect_features( x, 'percent_dialog' ),
+    'dialog_words_score' : lambda x: x[:2],
+    }
+
+def get_feature_matrix( movies, dimensions ):
+    '''Returns the sorted movie keys and an array with a row of the
+    feature vector of each along dimensions.'''
+    keys = sorted( movies.keys() )
+    rows = []
+    for k in keys:
+        row = []
+        for dim in dimensions:
+            if dim in feature_funcs:
+                row += feature_funcs[dim]( movies[k][dim] )
+            else:
+                row.append( movies[k][dim] )
+        rows.append( row )
+    return ( keys, numpy.array( rows, dtype=float ).reshape( len( keys ), -1 ) )
+
+def compute_distance_matrix( movies, dimensions ):
+    '''Returns the sorted movie keys and the square array of the
+    cartesian distance between each pair of them.'''
+    ( keys, features ) = get_feature_matrix( movies, dimensions )
+    if len( keys ) < 2:
+        return ( keys, numpy.zeros( ( len( keys ), len( keys ) ) ) )
+    return ( keys, scipy.spatial.distance.squareform( scipy.spatial.distance.pdist( features ) ) )
+
+def compute_pairwise_distances( movies, dist_funcs, distance_func, dimensions ):
     '''Returns a hash of hash.  The keys are every pair of movies, and
     the value is distance between them.'''
     distances = {}
@@ -388,36 +432,49 @@ def compute_distances( movies, dist_funcs, distance_func, dimensions ):
                 distances[k1] = { k2 : distance }
     return distances
 
+def get_distances( keys, square ):
+    '''Returns the distances data structure of the movies keys and
+    the square array of the distance between each pair of them, in the
+    order of keys.'''
+    return { 'keys' : keys,
+             'positions' : dict( [ ( k, i ) for ( i, k ) in enumerate( keys ) ] ),
+             'square' : square }
+
+def get_sub_matrix( distances, movie_keys ):
+    '''Returns the square array of the distances between movie_keys,
+    in their order.'''
+    positions = [ distances['positions'][k] for k in movie_keys ]
+    return distances['square'][numpy.ix_( positions, positions )]
+
+def compute_distances( movies, dist_funcs, distance_func, dimensions ):
+    '''Returns a hash of the sorted movie keys, the position of each
+    in keys, and the square array of the distance between every pair
+    of movies in that order.
+
+    For cartesian_distance this is computed for every pair at once
+    from the feature vectors of the movies, other distance functions
+    compare each pair with dist_funcs.'''
+    if distance_func is cartesian_distance:
+        return get_distances( *compute_distance_matrix( movies, dimensions ) )
+
+    pairwise = compute_pairwise_distances( movies, dist_funcs, distance_func, dimensions )
+    keys = sorted( pairwise.keys() )
+    square = numpy.array( [ [ pairwise[a][b] for b in keys ] for a in keys ], dtype=float ).reshape( len( keys ), len( keys ) )
+    return get_distances( keys, square )
+
 def eccentricity( distances ):
-    '''Returns a hash of movie, eccentricity.'''
-    result = {}
-    denominator = len( distances.keys() ) - 1
-    for k1 in sorted( distances.keys() ):
-        numerator = 0
-        for k2, distance in distances[k1].items():
-            if k1 == k2:
-                continue
-            numerator += distance
-        result[k1] = numerator / denominator
-    return result
+    '''Returns a hash of movie, eccentricity, the mean distance to
+    the other movies.'''
+    square = distances['square']
+    values = ( square.sum( 1 ) - numpy.diag( square ) ) / ( len( distances['keys'] ) - 1 )
+    return dict( zip( distances['keys'], values.tolist() ) )
 
 def density( distances ):
-    '''Returns a hash of movie, density.'''
-    result = {}
-    for k1 in sorted( distances.keys() ):
-        numerator = 0
-        for k2, distance in distances[k1].items():
-            if k1 == k2:
-                continue
-            try:
-                numerator += 1 / math.e**( distance**2 )
-            except:
-                # If we have an overflow don't worry about it, just
-                # add nothing.
-                raise Exception( "WHOOPS!" )
-                pass
-        result[k1] = numerator
-    return result
+    '''Returns a hash of movie, density, the sum over the other
+    movies of e to the minus their distance squared.'''
+    square = distances['square']
+    values = numpy.exp( -square**2 ).sum( 1 ) - numpy.exp( -numpy.diag( square )**2 )
+    return dict( zip( distances['keys'], values.tolist() ) )
 
 def compute_projection( distances, projection_func ):
     return projection_func( distances )
@@ -430,33 +487,47 @@ def get_clusters( movies_input, distances, epsilon, method=None ):
     one another.'''
 
     if method is None:
-        # Don't change the input value.
+        # The clusters are the connected components of the graph
+        # linking movies no more than epsilon apart, listed in the
+        # order of the first of their movies in the order we'd have
+        # grown them one at a time.
         movies = {}
         for movie in movies_input.keys():
             movies[movie] = True
-    
-        clusters = []
+        movie_keys = movies.keys()
 
-        while len( movies ):
-            current_cluster = {}
-
-            cluster_changed = True
-            while cluster_changed:
-                cluster_changed = False
-                movie_keys = movies.keys()
-                for movie in movie_keys:
-                    if len( current_cluster ) == 0:
-                        cluster_changed = True
-                        current_cluster[movie] = True
-                        del movies[movie]
-                    else:
-                        for cluster_movie in current_cluster.keys():
-                            if distances[cluster_movie][movie] <= epsilon:
-                                cluster_changed = True
-                                current_cluster[movie] = True
-                                if movie in movies:
-                                    del movies[movie]
-            clusters.append( current_cluster )
+        # Union-find, each movie's parent is the index of a movie in
+        # its cluster with the root its own parent.
+        parents = range( len( movie_keys ) )
+
+        def find( i ):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        components = len( movie_keys )
+
+        square = get_sub_matrix( distances, movie_keys )
+
+        for i in range( len( movie_keys ) ):
+            if components == 1:
+                break
+            for j in ( numpy.flatnonzero( square[i, i + 1:] <= epsilon ) + i + 1 ).tolist():
+                root_i = find( i )
+                root_j = find( j )
+                if root_i != root_j:
+                    parents[max( root_i, root_j )] = min( root_i, root_j )
+                    components -= 1
+
+        clusters = []
+        root_clusters = {}
+        for ( i, movie ) in enumerate( movie_keys ):
+            root = find( i )
+            if root not in root_clusters:
+                root_clusters[root] = {}
+                clusters.append( root_clusters[root] )
+            root_clusters[root][movie] = True
     else:
         print "ERROR - nondefault clustermethods not implemented yet."
         sys.exit( 0 )
@@ -468,7 +539,7 @@ def get_clusters( movies_input, distances, epsilon, method=None ):
         for a in sorted( movies_input.keys() ):
             current = []
             for b in sorted( movies_input.keys() ):
-                current.append( distances[a][b] )
+                current.append( distances['square'][distances['positions'][a], distances['positions'][b]] )
             square_dist.append( current )
         condensed_dist = hcluster.squareform( square_dist )
         clusters = method( condensed_dist )
@@ -479,6 +550,109 @@ def get_clusters( movies_input, distances, epsilon, method=None ):
 
     return clusters
 
+def get_dendrogram( movies_input, distances ):
+    '''Returns a hash of the movie keys, in the order get_clusters
+    considers them, and the single linkage dendrogram of the movies
+    as a linkage matrix for scipy.cluster.hierarchy with rows in
+    ascending order of distance.
+
+    The merges of single linkage are the edges of a minimum spanning
+    tree of the distances, which we find with Prim's algorithm in
+    O( n^2 ) for n movies.'''
+
+    movies = {}
+    for movie in movies_input.keys():
+        movies[movie] = True
+    movie_keys = movies.keys()
+
+    n = len( movie_keys )
+
+    square = get_sub_matrix( distances, movie_keys )
+
+    # For each movie not yet in the tree, the distance to and index
+    # of its nearest movie in the tree.
+    in_tree = numpy.zeros( n, dtype=bool )
+    nearest_distance = numpy.full( n, numpy.inf )
+    nearest = numpy.zeros( n, dtype=int )
+
+    edges = []
+
+    if n:
+        in_tree[0] = True
+        nearest_distance = square[0].copy()
+
+    for step in range( n - 1 ):
+        j = int( numpy.argmin( numpy.where( in_tree, numpy.inf, nearest_distance ) ) )
+        edges.append( ( nearest_distance[j], nearest[j], j ) )
+        in_tree[j] = True
+
+        closer = square[j] < nearest_distance
+        nearest_distance[closer] = square[j][closer]
+        nearest[closer] = j
+
+    edges.sort()
+
+    # Number the clusters as scipy does, cluster n + i being formed by
+    # the i'th merge.
+    parents = range( n )
+    nodes = range( n )
+    sizes = [ 1 ] * n
+
+    def find( i ):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    linkage = []
+    for ( distance, i, j ) in edges:
+        root_i = find( i )
+        root_j = find( j )
+        linkage.append( [ min( nodes[root_i], nodes[root_j] ), max( nodes[root_i], nodes[root_j] ), distance, sizes[root_i] + sizes[root_j] ] )
+        parents[root_j] = root_i
+        nodes[root_i] = n + len( linkage ) - 1
+        sizes[root_i] += sizes[root_j]
+
+    return { 'keys' : movie_keys,
+             'linkage' : numpy.array( linkage, dtype=float ).reshape( len( linkage ), 4 ) }
+
+def get_dendrogram_clusters( dendrogram, epsilon ):
+    '''Returns the clusters get_clusters would at epsilon for the
+    movies of dendrogram, making only its merges at distance epsilon
+    or less.'''
+
+    movie_keys = dendrogram['keys']
+    n = len( movie_keys )
+
+    # Union-find over the movies, with a movie of each node of the
+    # dendrogram standing for it.
+    parents = range( n )
+    members = range( n )
+
+    def find( i ):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    merges = int( numpy.searchsorted( dendrogram['linkage'][:, 2], epsilon, side='right' ) )
+    for row in dendrogram['linkage'][:merges]:
+        root_a = find( members[int( row[0] )] )
+        root_b = find( members[int( row[1] )] )
+        parents[max( root_a, root_b )] = min( root_a, root_b )
+        members.append( min( root_a, root_b ) )
+
+    clusters = []
+    root_clusters = {}
+    for ( i, movie ) in enumerate( movie_keys ):
+        root = find( i )
+        if root not in root_clusters:
+            root_clusters[root] = {}
+            clusters.append( root_clusters[root] )
+        root_clusters[root][movie] = True
+
+    return clusters
+
 def cluster_epsilon_finder( movies, distances ):
     '''Calculates epsilon via the following algorithm:
 
@@ -493,82 +667,17 @@ def cluster_epsilon_finder( movies, distances ):
     distances involved.
 
     4. We return the array of epsilons to the caller.
+
+    These are the distances of the merges of the single linkage
+    dendrogram, so we read them from get_dendrogram.
     '''
     # Handle pathological cases
     if not len( movies ):
         raise Exception("Expected at least one movie in cluster_epsilon_finder.")
     elif len( movies ) == 1:
         return [0]
-    
-    cluster_distances = []
-
-    # Create the initial cluster.
-    min_i = None
-    min_j = None
-    min_dist = None
-    for i in movies.keys():
-        for j in movies.keys():
-            if i == j:
-                continue
-            else:
-                if min_dist is None or distances[i][j] < min_dist:
-                    min_dist = distances[i][j]
-                    min_i = i
-                    min_j = j
-    clusters = [ { min_i : True, min_j : True } ]
-    cluster_distances.append( distances[min_i][min_j] )
-
-    for movie in movies.keys():
-        if movie != min_i and movie != min_j:
-            clusters.append( { movie : True } )
-    
-    # Process the rest of the points.
-    while len( clusters ) > 1:
-        min_dist = None
-        min_i = None
-        min_j = None
-        
-        for i_idx, cluster_i in enumerate( clusters ):
-            for j_idx, cluster_j in enumerate( clusters ):
-                if i_idx == j_idx:
-                    continue
-                else:
-                    for i in cluster_i.keys():
-                        for j in cluster_j.keys():
-                            if min_dist is None or distances[i][j] < min_dist:
-                                min_dist = distances[i][j]
-                                min_i_idx = i_idx
-                                min_j_idx = j_idx
-                                min_cluster_i = cluster_i
-                                min_cluster_j = cluster_j
-                                min_i = i
-                                min_j = j
-        # There are a few cases:
-        #
-        # 1. min_cluster_i and j are in singleton clusters := make a
-        # new cluster of the two of them.
-        #
-        # 2. min_cluster_i or j is a singleton, but the other is not
-        # := add the singleton to the larger cluster.
-        #
-        # 3. Neither min_cluster_i or j is a singleton := merge the
-        # two.
-        cluster_distances.append( min_dist )
-        if len( min_cluster_i.keys() ) == 1 and len( min_cluster_j.keys() ) == 1:
-            min_cluster_i[min_j] = True
-            clusters = clusters[:min_j_idx] + clusters[min_j_idx+1:]
-        elif len( min_cluster_i.keys() ) == 1 and len( min_cluster_j.keys() ) > 1:
-            min_cluster_j[min_i] = True
-            clusters = clusters[:min_i_idx] + clusters[min_i_idx+1:]
-        elif len( min_cluster_i.keys() ) > 1 and len( min_cluster_j.keys() ) == 1:
-            min_cluster_i[min_j] = True
-            clusters = clusters[:min_j_idx] + clusters[min_j_idx+1:]
-        else:
-            for j_point in min_cluster_j.keys():
-                min_cluster_i[j_point] = True
-            clusters = clusters[:min_j_idx] + clusters[min_j_idx+1:]
 
-    return cluster_distances
+    return get_dendrogram( movies, distances )['linkage'][:, 2].tolist()
 
 def output_d3( outdir, filename, vertices, edges, cliques, header, html_filename ):
     # NOTE: "element" can't have .'s in it or it causes some browser
@@ -592,7 +701,10 @@ def output_d3( outdir, filename, vertices, edges, cliques, header, html_filename
     f.write( html_body )
     f.close()
 
-def make_graphs( movies, distances, dimensions, proj_dimensions, epsilon, width, slide, shading_key=None ):
+def get_cover( movies, proj_dimensions, width, slide ):
+    '''Returns a hash keyed on the cells of the cover of the
+    projection of width and slide, of hashes of the movies in each
+    cell.'''
     # The substantial code complexity below is to allow this code to
     # work with any number of projected dimensions.
     
@@ -683,6 +795,19 @@ def make_graphs( movies, distances, dimensions, proj_dimensions, epsilon, width,
     #pp.pprint( movie_cell_map )
     #pp.pprint( cell_movie_map )
 
+    return cell_movie_map
+
+def get_cells( movies, cell_movie_map ):
+    '''Returns a list of each cell of cell_movie_map in order with
+    the hash of its movies.'''
+    return [ ( cell_string, { key : value for ( key, value ) in movies.items() if key in cell_movie_map[cell_string] } ) for cell_string in sorted( cell_movie_map ) ]
+
+def make_cell_graphs( movies, cells, get_cell_clusters, shading_key=None ):
+    '''Returns the nodes, edges and cliques of the graph of the
+    clusters of each of the cells of get_cells, where
+    get_cell_clusters is a function of the hash of the movies of a
+    cell returning their clusters as get_clusters does.'''
+
     node_map = {}
     node_keys = {}
     movie_node_map = {}
@@ -695,12 +820,8 @@ def make_graphs( movies, distances, dimensions, proj_dimensions, epsilon, width,
     # If true only add nodes if they are not strict subsets of existing nodes.
     eliminate_subsets = False
 
-    for cell_string in sorted( cell_movie_map ):
-        cell_movie_keys = cell_movie_map[cell_string].keys()
-                
-        cell_movies = { key : value for ( key, value ) in movies.items() if key in cell_movie_keys }
-
-        cell_movie_clusters = get_clusters( cell_movies, distances, epsilon )
+    for ( cell_string, cell_movies ) in cells:
+        cell_movie_clusters = get_cell_clusters( cell_movies )
 
         if eliminate_subsets:
             for cell_movie_cluster in cell_movie_clusters:
@@ -794,6 +915,55 @@ def make_graphs( movies, distances, dimensions, proj_dimensions, epsilon, width,
 
     return ( nodes, edges, filtered_cliques )
 
+def make_graphs( movies, distances, dimensions, proj_dimensions, epsilon, width, slide, shading_key=None ):
+    cells = get_cells( movies, get_cover( movies, proj_dimensions, width, slide ) )
+    return make_cell_graphs( movies, cells, lambda cell_movies: get_clusters( cell_movies, distances, epsilon ), shading_key )
+
+class MapperSweep( object ):
+    '''Makes the graphs of make_graphs for every width, slide and
+    epsilon of a sweep, sharing the work between them.
+
+    The cover of each width and slide is computed once, and the
+    single linkage dendrogram of the movies of each distinct cell once
+    whatever cover it is in, so the clusters at each epsilon are cuts
+    of the dendrogram rather than clustering the cell again.  The cuts
+    are kept too, as the same cells recur across covers.
+
+    sweep = MapperSweep( movies, distances, proj_dimensions, shading_key='rt' )
+    ( nodes, edges, cliques ) = sweep.make_graphs( epsilon, width, slide )
+         # As make_graphs( movies, distances, dimensions,
+         # proj_dimensions, epsilon, width, slide, shading_key )
+    '''
+
+    def __init__( self, movies, distances, proj_dimensions, shading_key=None ):
+        self.movies = movies
+        self.distances = distances
+        self.proj_dimensions = proj_dimensions
+        self.shading_key = shading_key
+
+        # Keyed on ( width, slide ), the cells of each cover.
+        self.covers = {}
+        # Keyed on the frozenset of the movies of a cell.
+        self.dendrograms = {}
+        # Keyed on the frozenset of the movies of a cell and epsilon.
+        self.clusters = {}
+
+    def get_cells( self, width, slide ):
+        if ( width, slide ) not in self.covers:
+            self.covers[( width, slide )] = get_cells( self.movies, get_cover( self.movies, self.proj_dimensions, width, slide ) )
+        return self.covers[( width, slide )]
+
+    def get_clusters( self, cell_movies, epsilon ):
+        cell = frozenset( cell_movies.keys() )
+        if ( cell, epsilon ) not in self.clusters:
+            if cell not in self.dendrograms:
+                self.dendrograms[cell] = get_dendrogram( cell_movies, self.distances )
+            self.clusters[( cell, epsilon )] = get_dendrogram_clusters( self.dendrograms[cell], epsilon )
+        return self.clusters[( cell, epsilon )]
+
+    def make_graphs( self, epsilon, width, slide ):
+        return make_cell_graphs( self.movies, self.get_cells( width, slide ), lambda cell_movies: self.get_clusters( cell_movies, epsilon ), self.shading_key )
+
 def get_dimensions( measures, projection ):
     '''Return a list of permutations whereby each element of measures
     is removed and used as the second element of projection.'''
@@ -896,7 +1066,7 @@ def index_html( outdir, mode="create", idx=0, label='', value=0, x='', y='' ):
         f.write( html_back )
         f.close()
 
-if __name__=="__main__":
+def main( movies_dir="../example-scripts/parsed" ):
 
     # GOALS:
     #
@@ -907,9 +1077,10 @@ if __name__=="__main__":
     # 2. Make N sets of charts, one for eccentricity + dim_i for measure I.
     #   * Set proj_title appropriately.
 
-    # Read in movie JSON files.
-    movies_dir = "../example-scripts/parsed"
+    # Movie JSON files are read from movies_dir.
 
+    # r_dist looks the distance functions up at module level.
+    global dist_funcs
     dist_funcs = {}
     register_dist_funcs( dist_funcs )
 
@@ -995,6 +1166,12 @@ if __name__=="__main__":
             print "Widths  : %s" % ( widths )
             print "Epsilons: %s" % ( epsilons )
 
+            shading_key = None
+            if partition == 'released':
+                shading_key = 'rt'
+
+            sweep = MapperSweep( movies, distances, proj, shading_key=shading_key )
+
             for ( step_idx, slide ) in enumerate( slides ):
                 index_html( outdir, "append", step_idx, 'slide', slide, 'eccentricity', current_proj )
                 graph_html( outdir, "create", step_idx, 'slide', slide, 'eccentricity', current_proj )
@@ -1002,10 +1179,7 @@ if __name__=="__main__":
                 for epsilon in epsilons:
                     graph_html( outdir, "start_row", step_idx, 'slide', slide, 'eccentricity', current_proj )
                     for width in widths:
-                        shading_key = None
-                        if partition == 'released':
-                            shading_key = 'rt'
-                        nodes, edges, filtered_cliques = make_graphs( movies, distances, dim, proj, epsilon, width, slide, shading_key = shading_key )
+                        nodes, edges, filtered_cliques = sweep.make_graphs( epsilon, width, slide )
 
                         filename = "_".join( [ 'eccentricity', current_proj, "%0.02f" % ( slide ), "%0.02f" % ( width ), "%0.02f" % ( epsilon ) ] ) + ".json"
 
@@ -1019,3 +1193,5 @@ if __name__=="__main__":
                 
     index_html( outdir, "end" )
 
+if __name__=="__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+'''Generates the reports of generate_reports.py for every film in the
+corpus, one film per worker process.
+
+Each worker loads its film's parsed outputs and writes its reports
+independently, and plots are drawn on their own Agg figures, so films
+never share any state.  A film which fails is reported without
+stopping the others.
+
+Usage, from the utils directory:
+
+    ./generate_corpus_reports.py                       # Every film, a worker per core
+    ./generate_corpus_reports.py Ghostbusters Dune
+    ./generate_corpus_reports.py --processes 4 --compression gzip
+'''
+
+import argparse
+import functools
+import multiprocessing
+import time
+import traceback
+
+import tsl.utils.generate_reports
+
+from tsl.utils.corpus import scripts
+
+def run_script( script, compression=None ):
+    '''Generate the reports for one film, returning its name, the
+    seconds taken, and the traceback if it failed or else None.'''
+
+    start = time.time()
+    error = None
+
+    try:
+        tsl.utils.generate_reports.process_script( script, compression )
+    except Exception:
+        error = traceback.format_exc()
+
+    return ( script[0], time.time() - start, error )
+
+def generate_corpus_reports( films, processes=None, compression=None ):
+    '''Generate reports for films across processes workers, by default
+    one per core.  Yields the result of run_script for each film as it
+    finishes.'''
+
+    pool = multiprocessing.Pool( processes )
+
+    try:
+        for result in pool.imap_unordered( functools.partial( run_script, compression=compression ), films ):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Generate reports for the films of the corpus in parallel.' )
+    parser.add_argument( 'films', nargs='*', help='Names of films to process, defaults to the whole corpus.' )
+    parser.add_argument( '--processes', type=int, default=None, help='Number of worker processes, defaults to the number of cores.' )
+    parser.add_argument( '--compression', choices=[ 'gzip', 'lzma' ], default=None, help='Compress the presence and interaction CSVs.' )
+    args = parser.parse_args()
+
+    films = scripts
+    if args.films:
+        films = [ x for x in scripts if x[0] in args.films ]
+        unknown = set( args.films ) - set( [ x[0] for x in films ] )
+        if unknown:
+            raise Exception( "Unknown films: %s" % ( ', '.join( sorted( unknown ) ) ) )
+
+    start = time.time()
+    failed = []
+
+    for ( name, elapsed, error ) in generate_corpus_reports( films, args.processes, args.compression ):
+        if error is None:
+            print "%s took %0.02f seconds" % ( name, elapsed )
+        else:
+            print "%s failed after %0.02f seconds:\n%s" % ( name, elapsed, error )
+            failed.append( name )
+
+    print "Generated reports for %d of %d films in %0.02f seconds" % ( len( films ) - len( failed ), len( films ), time.time() - start )
+    if failed:
+        print "Failed:", ', '.join( sorted( failed ) )
@@ -1,5 +1,6 @@
 #!/usr/bin/python
 
+import argparse
 import json
 import re
 import sys
@@ -10,18 +11,23 @@ import tsl.script.Script
 import tsl.script.Structure
 
 from tsl.script.parse.const import CHARACTER, DISCUSS, LOCATION, SETTING
-from tsl.script.reports.reports import top_presences, top_interactions, get_presence_csv, get_interaction_csv
-
-
-scripts = [
-    ( 'The Big Lebowski', '../example-scripts/the_big_lebowski.txt' ),
-    ( 'Chinatown', '../example-scripts/chinatown.txt' ),
-    ( 'Dune', '../example-scripts/dune.txt' ),
-    ( 'Ghostbusters', '../example-scripts/ghostbusters.txt' ),
-    ( 'The Matrix', '../example-scripts/the_matrix.txt' ),
+from tsl.script.reports.reports import run_reports, open_csv_file, write_csv_rows, write_presence_csv, write_interaction_csv
+from tsl.utils.corpus import scripts
+
+# The top N reports written for each script, as the filename and the
+# run_reports spec of each, the spec named 'plot' feeds the presence
+# plot rather than a file.
+top_reports = [
+    ( 'plot', { 'report' : 'presences', 'top_n' : 8, 'noun_types' : [ CHARACTER ] } ),
+    ( 'top5_characters.csv', { 'report' : 'presences', 'top_n' : 5, 'noun_types' : [ CHARACTER ] } ),
+    ( 'top5_speakers.csv', { 'report' : 'presences', 'top_n' : 5, 'presence_types' : [ DISCUSS ] } ),
+    ( 'top5_locations.csv', { 'report' : 'presences', 'top_n' : 5, 'noun_types' : [ LOCATION ] } ),
+    ( 'top5_hangouts.csv', { 'report' : 'interactions', 'top_n' : 5, 'interaction_types' : [ SETTING ] } ),
+    ( 'top5_bffs.csv', { 'report' : 'interactions', 'top_n' : 5, 'noun_types' : [ ( CHARACTER, CHARACTER ) ] } ),
+    ( 'top5_speakers.csv', { 'report' : 'interactions', 'top_n' : 5, 'interaction_types' : [ DISCUSS ] } ),
     ]
 
-def process_script( script ):
+def process_script( script, compression=None ):
     #import pdb
     #pdb.set_trace()
 
@@ -44,44 +50,54 @@ def process_script( script ):
     Interactions = tsl.script.Interactions.Interactions( name, outdir )
     Interactions.load()
 
-    presence_png = tsl.script.reports.reports.presence_plot( Script, map( lambda x: x[0], top_presences( Presences, top_n=8, noun_types=[CHARACTER] ) ), "Top 8 Character Presence in "+name )
+    results = run_reports( Presences, Interactions, [ x[1] for x in top_reports ] )
+
+    presence_png = tsl.script.reports.reports.presence_dispersion_plot( Script, Presences, map( lambda x: x[0], results[0] ), "Top 8 Character Presence in "+name )
     f = open( outdir+'/character_presence.png', 'w' )
     f.write( presence_png.getvalue() )
     presence_png.close()
     presence_png = None
     f.close()
 
-    f = open( outdir+'/presence.csv', 'w' )
-    f.write( get_presence_csv( Presences ) )
+    # The full presence and interaction CSVs can run to hundreds of
+    # thousands of rows, so they are streamed out row by row.
+    f = open_csv_file( outdir+'/presence.csv', compression )
+    write_presence_csv( Presences, f )
     f.close()
 
-    f = open( outdir+'/interaction.csv', 'w' )
-    f.write( get_interaction_csv( Presences, Interactions ) )
+    f = open_csv_file( outdir+'/interaction.csv', compression )
+    write_interaction_csv( Presences, Interactions, f )
     f.close()
 
-    output_top_presences( top_presences( Presences, top_n=5, noun_types=[CHARACTER] ), outdir+'/top5_characters.csv' )
-    output_top_presences( top_presences( Presences, top_n=5, presence_types=[DISCUSS] ), outdir+'/top5_speakers.csv' )
-    output_top_presences( top_presences( Presences, top_n=5, noun_types=[LOCATION] ), outdir+'/top5_locations.csv' )
-
-    output_top_interactions( top_interactions( Presences, Interactions, top_n=5, interaction_types=[SETTING] ), outdir+'/top5_hangouts.csv' )
-    output_top_interactions( top_interactions( Presences, Interactions, top_n=5, noun_types=[ ( CHARACTER, CHARACTER ) ] ), outdir+'/top5_bffs.csv' )
-    output_top_interactions( top_interactions( Presences, Interactions, top_n=5, interaction_types=[DISCUSS] ), outdir+'/top5_speakers.csv' )
+    for ( ( filename, spec ), result ) in zip( top_reports, results ):
+        if filename == 'plot':
+            continue
+        elif spec['report'] == 'presences':
+            output_top_presences( result, outdir+'/'+filename )
+        else:
+            output_top_interactions( result, outdir+'/'+filename )
 
 def output_top_presences( presences, filename ):
-    f = open( filename, 'w' )
-    f.write("name,noun_type,appearances\n")
-    for p in presences:
-        f.write( ','.join( [ p[0], p[1], str( p[2] ) ] ) )
-        f.write( "\n" )
+    f = open( filename, 'wb' )
+    write_csv_rows( f, [ [ 'name', 'noun_type', 'appearances' ] ] + presences )
     f.close()
 
 def output_top_interactions( interactions, filename ):
-    f = open( filename, 'w' )
-    f.write("name1,name2,interactions\n")
-    for i in interactions:
-        f.write( ','.join( [ i[0], i[1], str( i[2] ) ] ) )
-        f.write( "\n" )
+    f = open( filename, 'wb' )
+    write_csv_rows( f, [ [ 'name1', 'name2', 'interactions' ] ] + interactions )
     f.close()
 
-for script in scripts:
-    process_script( script )
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Generate the reports of the films of the corpus.' )
+    parser.add_argument( 'films', nargs='*', help='Names of films to process, defaults to the whole corpus.' )
+    args = parser.parse_args()
+
+    films = scripts
+    if args.films:
+        films = [ x for x in scripts if x[0] in args.films ]
+        unknown = set( args.films ) - set( [ x[0] for x in films ] )
+        if unknown:
+            raise Exception( "Unknown films: %s" % ( ', '.join( sorted( unknown ) ) ) )
+
+    for film in films:
+        process_script( film )
@@ -1,6 +1,7 @@
 #!/usr/bin/python
 
 import json
+import nltk
 import re
 import sys
 
@@ -9,6 +10,7 @@ import tsl.script.Interactions
 import tsl.script.Script
 import tsl.script.Structure
 
+from tsl.script.parse.annotate import get_annotations
 from tsl.script.parse.const import CHARACTER, DISCUSS, LOCATION, SETTING
 from tsl.script.reports.reports import top_presences, top_interactions, get_presence_csv, get_interaction_csv
 
@@ -90,20 +92,9 @@ scripts = [
 # nouns = [ word for ( word, tag ) in fd if tag.startswith('NN') ]
 
 def process( script ):
-    pdb.set_trace()
-    f = open( script )
-    raw = f.read()
-    raw_tokens = nltk.wordpunct_tokenize( raw )
-    tok = [ t for t in raw_tokens if re.search( r'\w', t ) ]
-    text = nltk.Text( tok )
-    # text.collocations()
-    words = [ w.lower() for w in text ]
-    # vocab = sorted( set( words ) ) 
-    # 
-    # Stemming
-    porter = nltk.PorterStemmer()
-    tagged_words = [ porter.stem( w ) for w in words ]
-    fd = nltk.FreqDist( tagged_words )
+    outdir = '../example-scripts/parsed/' + re.sub( r'\s+', '_', script[0].lower() )
+    Annotations = get_annotations( script[0], script[1], outdir )
+    fd = nltk.FreqDist( Annotations.get_tagged_stems() )
     verbs = [ word for ( word, tag ) in fd if tag.startswith('V') ]
     adj = [ word for ( word, tag ) in fd if tag.startswith('JJ') ]
     adv = [ word for ( word, tag ) in fd if tag.startswith('RB') ]
@@ -1,136 +1,55 @@
 #!/usr/bin/python
 
-import csv
+'''Computes the metrics of each film which distances-new3.py compares
+films by, writing them to the film's _metrics.json and its row of the
+corpus metrics table kept by metrics_table.py.
+
+Each metric is registered in metrics below with the inputs it reads
+and the fields it writes.  Only the requested metrics are computed,
+inputs such as the part of speech annotations are loaded once and only
+if a metric needs them, and each metric's result is cached alongside
+the metrics file until its code or inputs change.  Films are processed
+in parallel.
+
+Usage, from the utils directory:
+
+    ./metrics.py                                  # Default metrics for every film
+    ./metrics.py Ghostbusters Dune
+    ./metrics.py --metrics hearing,buddies        # Add these to existing metrics files
+    ./metrics.py --list
+'''
+
+import argparse
+import dis
+import functools
+import hashlib
+import inspect
 import json
 import math
+import multiprocessing
 import nltk
 import numpy
+import os
 import re
 import sys
+import time
+import traceback
 
 import tsl.script.Presences
 import tsl.script.Interactions
 import tsl.script.Script
 import tsl.script.Structure
 
+from tsl.script.parse.annotate import get_annotations, get_english_words
 from tsl.script.parse.const import CHARACTER, DISCUSS, LOCATION, SETTING
+from tsl.script.reports.incidence import SceneIncidence
+from tsl.script.reports.positions import PositionIndex
 from tsl.script.reports.reports import top_presences, top_interactions, get_presence_csv, get_interaction_csv
+from tsl.script.reports.timeline import Timeline
 
-from tsl.utils.partition import get_dramatic_unit_partitions
-
-scripts = [
-    #( 'Chinatown', '../example-scripts/chinatown.txt' ),
-    #( 'Dune', '../example-scripts/dune.txt' ),
-    #( 'Ghostbusters', '../example-scripts/ghostbusters.txt' ),
-    #( 'The Matrix', '../example-scripts/the_matrix.txt' ),
-    #( 'Good Will Hunting', '../example-scripts/good_will_hunting.txt' ),
-    #( 'The Book of Eli', '../example-scripts/the_book_of_eli.txt' ),
-    #( 'Starwars', '../example-scripts/starwars.txt' ),
-    #( 'Alien', '../example-scripts/alien.txt' ),
-    #( 'Vertigo', '../example-scripts/vertigo.txt' ),
-    #( 'Terminator 2', '../example-scripts/terminator_2.txt' ),
-    #( 'Ratatouille', '../example-scripts/ratatouille.txt' ),
-    # Questionable formatting
-    #( 'Analyze That', '../example-scripts/analyze_that.txt' ),
-    #( 'Death to Smoochy', '../example-scripts/death_to_smoochy.txt' ),
-    #( 'Get Carter', '../example-scripts/get_carter.txt' ),
-    #( 'Groundhogs Day', '../example-scripts/groundhogs_day.txt' ),
-    #( 'Red Planet', '../example-scripts/red_planet.txt' ),
-    #( 'Smurfs', '../example-scripts/smurfs.txt' ),
-    #( 'Sweet November', '../example-scripts/sweet_november.txt' ),
-    #( 'Taking Lives', '../example-scripts/taking_lives.txt' ),
-    #( 'Thirteen Ghosts', '../example-scripts/thirteen_ghosts.txt' ),
-    # New
-    #( '42', '../example-scripts/42.txt' ),
-    #( 'Frozen', '../example-scripts/frozen.txt' ),
-    #( 'Fruitvale Station', '../example-scripts/fruitvale_station.txt' ),
-    #( 'All is Lost', '../example-scripts/all_is_lost.txt' ),
-    #( 'Amour', '../example-scripts/amour.txt' ),
-    #( 'Argo', '../example-scripts/argo.txt' ),
-    #( 'August Osage County', '../example-scripts/august_osage_county.txt' ),
-    #( 'Celest and Jesse Forever', '../example-scripts/celeste_and_jesse_forever.txt' ),
-    #( 'Chronicle', '../example-scripts/chronicle.txt' ),
-    #( 'Dallas Buyers Club', '../example-scripts/dallas_buyers_club.txt' ),
-    #( 'Despicable Me 2', '../example-scripts/despicable_me_2.txt' ),
-    #( 'The Wolf of Wall Street', '../example-scripts/the_wolf_of_wall_street.txt' ),
-    #( 'Prince of Persia', '../example-scripts/prince_of_persia.txt' ),
-    #( 'Oz the Great and Powerful', '../example-scripts/oz_the_great_and_powerful.txt' ),
-    #( 'Nebraska', '../example-scripts/nebraska.txt' ),
-    #( 'Monsters University', '../example-scripts/monsters_university.txt' ),
-    #( 'Magic Mike', '../example-scripts/magic_mike.txt' ),
-    #( 'Lone Survivor', '../example-scripts/lone_survivor.txt' ),
-    #( 'Kill Your Darlings', '../example-scripts/kill_your_darlings.txt' ),
-    #( 'Kick Ass 2', '../example-scripts/kick_ass_2.txt' ),
-    #( '1969 A Space Odyssey', '../example-scripts/1969_a_space_odyssey.txt' ),
-    #( 'The Great Gatsby', '../example-scripts/the_great_gatsby.txt' ),
-    #( 'The Invisible Woman', '../example-scripts/the_invisible_woman.txt' ),
-    #( 'The Past', '../example-scripts/the_past.txt' ),
-    #( 'Twilight', '../example-scripts/twilight.txt' ),
-    #( 'Wadjda', '../example-scripts/wadjda.txt' ),
-    #( 'Woman in Black', '../example-scripts/woman_in_black.txt' ),
-    #( 'Faults', '../example-scripts/faults.txt' ),
-    #( 'Extinction', '../example-scripts/extinction.txt' ),
-    #( 'Elsewhere', '../example-scripts/elsewhere.txt' ),
-    #( 'Dude', '../example-scripts/dude.txt' ),
-    #( 'Dogfight', '../example-scripts/dogfight.txt' ),
-    #( 'Diablo Run', '../example-scripts/diablo_run.txt' ),
-    #( 'Clarity', '../example-scripts/clarity.txt' ),
-    #( 'Cake', '../example-scripts/cake.txt' ),
-    #( 'A Beautiful Day in the Neighborhood', '../example-scripts/a_beautiful_day_in_the_neighborhood.txt' ),
-    #( 'American Sniper', '../example-scripts/american_sniper.txt' ),
-    #( 'A Monster Calls', '../example-scripts/a_monster_calls.txt' ),
-    #( 'Beast', '../example-scripts/beast.txt' ),
-    #( 'Beauty Queen', '../example-scripts/beauty_queen.txt' ),
-    #( 'Broken Cove', '../example-scripts/broken_cove.txt' ),
-    #( 'Burn Site', '../example-scripts/burn_site.txt' ),
-    #( 'Bury the Lead', '../example-scripts/bury_the_lead.txt' ),
-    #( 'Pox Americana', '../example-scripts/pox_americana.txt' ),
-    #( 'Prisoners', '../example-scripts/prisoners.txt' ),
-    #( 'Pure', '../example-scripts/pure.txt' ),
-    #( 'Queen of Hearts', '../example-scripts/queen_of_hearts.txt' ),
-    #( 'Randle is Benign', '../example-scripts/randle_is_benign.txt' ),
-    #( 'Real Steel', '../example-scripts/real_steel.txt' ),
-    #( 'Reminiscence', '../example-scripts/reminiscence.txt' ),
-    #( 'Revelations', '../example-scripts/revelations.txt' ),
-    #( 'Rush', '../example-scripts/rush.txt' ),
-    #( 'Rust and Bone', '../example-scripts/rust_and_bone.txt' ),
-    #( 'Skyfall', '../example-scripts/skyfall.txt' ),
-    #( 'Smashed', '../example-scripts/smashed.txt' ),
-    #( 'Snow White and the Huntsman', '../example-scripts/snow_white_and_the_huntsman.txt' ),
-    #( 'The Croods', '../example-scripts/the_croods.txt' ),
-    #( 'Fixer', '../example-scripts/fixer.txt' ),
-    #( 'Free Byrd', '../example-scripts/free_byrd.txt' ),
-    #( 'Frisco', '../example-scripts/frisco.txt' ),
-    #( 'From Here to Albion', '../example-scripts/from_here_to_albion.txt' ),
-    #( 'Fully Wrecked', '../example-scripts/fully_wrecked.txt' ),
-    #( 'Holland Michigan', '../example-scripts/holland_michigan.txt' ),
-    #( 'Im So Proud of You', '../example-scripts/im_so_proud_of_you.txt' ),
-    #( 'Ink and Bone', '../example-scripts/ink_and_bone.txt' ),
-    #( 'Inquest', '../example-scripts/inquest.txt' ),
-    #( 'Ipoy Master', '../example-scripts/ipoy_master.txt' ),
-    #( 'Last Minute Maids', '../example-scripts/last_minute_maids.txt' ),
-    #( 'Line of Duty', '../example-scripts/line_of_duty.txt' ),
-    #( 'Make a Wish', '../example-scripts/make_a_wish.txt' ),
-    #( 'Man of Sorrow', '../example-scripts/man_of_sorrow.txt' ),
-    #( 'Nicholas', '../example-scripts/nicholas.txt' ),
-    #( 'Patient Z', '../example-scripts/patient_z.txt' ),
-    #( 'Beautiful Creatures', '../example-scripts/beautiful_creatures.txt' ),
-    #( 'Section 6', '../example-scripts/section_6.txt' ),
-    #( 'Seed', '../example-scripts/seed.txt' ),
-    #( 'Shovel Buddies', '../example-scripts/shovel_buddies.txt' ),
-    #( 'Spotlight', '../example-scripts/spotlight.txt' ),
-    #( 'Superbrat', '../example-scripts/superbrat.txt' ),
-    #( 'Sweetheart', '../example-scripts/sweetheart.txt' ),
-    #( 'The Shark is not Working', '../example-scripts/the_shark_is_not_working.txt' ),
-    #( 'The Line', '../example-scripts/the_line.txt' ),
-    #( 'The Killing Floor', '../example-scripts/the_killing_floor.txt' ),
-    #( 'The Fixer', '../example-scripts/the_fixer.txt' ),
-    #( 'The End of the Tour', '../example-scripts/the_end_of_the_tour.txt' ),
-    #( 'The Company Man', '../example-scripts/the_company_man.txt' ),
-    #( 'The Boy and His Tiger', '../example-scripts/the_boy_and_his_tiger.txt' ),
-    #( 'The Autopsy of Jane Doe', '../example-scripts/the_autopsy_of_jane_doe.txt' ),
-    #( 'Tchaikovskys Requiem', '../example-scripts/tchaikovskys_requiem.txt' ),
-    ]
+from tsl.utils import corpus
+from tsl.utils import metrics_table
+from tsl.utils.partition import DramaticUnits, SceneHierarchy
 
 def populate_release_stats( name, output ):
     released = {
@@ -193,351 +112,257 @@ def populate_release_stats( name, output ):
         'Beautiful Creatures' : { 'rt' : 0.46 },
         }
 
-    if name not in released:
-        #raise Exception( "ERROR - NO DATA FOR %s" % ( name ) )
-        pass
-    else:
+    if name in released:
         output['rt'] = released[name]['rt']
 
     return
 
-def process_script( script ):
-    #import pdb
-    #pdb.set_trace()
-
-    name = script[0]
-    script_file = script[1]
-
-    f = open( script_file )
-    raw_script = unicode( f.read(), errors = 'ignore' )
-
-    print "Working on:", name
-
-    file_dir = '../example-scripts/parsed/'
-    file_name = re.sub( r'\s+', '_', name.lower() )
-
-    outdir = file_dir + file_name
-
-    Script = tsl.script.Script.Script( name, outdir )
-    Script.load()
-
-    Structure = tsl.script.Structure.Structure( name, outdir )
-    Structure.load()
-
-    Presences = tsl.script.Presences.Presences( name, outdir )
-    Presences.load()
-
-    Interactions = tsl.script.Interactions.Interactions( name, outdir )
-    Interactions.load()
-
+def get_outdir( script ):
+    return '../example-scripts/parsed/' + re.sub( r'\s+', '_', script[0].lower() )
+
+def get_fname( script ):
+    return re.sub( r'\s+', '_', script[0].lower() )
+
+def load_output( cls, script ):
+    result = cls( script[0], get_outdir( script ) )
+    result.load()
+    return result
+
+def get_output_files( script, outputs ):
+    return [ tsl.script.Script.find_output_file( "%s/%s_%s" % ( get_outdir( script ), get_fname( script ), x ) ) for x in outputs ]
+
+# The data metrics are computed from.  Each input has:
+#
+# depends - other inputs it is computed from
+# files - function of the script returning the files it is read or
+#         computed from, besides those of the inputs it depends on
+# load - function of the script and the inputs it depends on
+#        returning its value
+inputs = {
+    'name' : {
+        'depends' : [],
+        'files'   : lambda script: [],
+        'load'    : lambda script: script[0],
+        },
+    'Structure' : {
+        'depends' : [],
+        'files'   : lambda script: get_output_files( script, [ 'structure' ] ),
+        'load'    : lambda script: load_output( tsl.script.Structure.Structure, script ),
+        },
+    'Presences' : {
+        'depends' : [],
+        'files'   : lambda script: get_output_files( script, [ 'presences', 'presence_sn', 'presence_ns' ] ),
+        'load'    : lambda script: load_output( tsl.script.Presences.Presences, script ),
+        },
+    'Interactions' : {
+        'depends' : [],
+        'files'   : lambda script: get_output_files( script, [ 'interactions' ] ),
+        'load'    : lambda script: load_output( tsl.script.Interactions.Interactions, script ),
+        },
+    # Annotations are only computed here if the annotate stage hasn't
+    # saved them, so they are versioned by what they're computed from.
+    'Annotations' : {
+        'depends' : [ 'Structure' ],
+        'files'   : lambda script: [ script[1] ],
+        'load'    : lambda script, Structure: get_annotations( script[0], script[1], get_outdir( script ), Structure=Structure ),
+        },
+    'top_characters' : {
+        'depends' : [ 'Presences' ],
+        'files'   : lambda script: [],
+        'load'    : lambda script, Presences: top_presences( Presences, noun_types=[CHARACTER] ),
+        },
+    'top_locations' : {
+        'depends' : [ 'Presences' ],
+        'files'   : lambda script: [],
+        'load'    : lambda script, Presences: top_presences( Presences, noun_types=[LOCATION] ),
+        },
+    # Rows in the order of top_characters.
+    'character_incidence' : {
+        'depends' : [ 'Presences', 'top_characters' ],
+        'files'   : lambda script: [],
+        'load'    : lambda script, Presences, top_characters: SceneIncidence( Presences, names=[ x[0] for x in top_characters ] ),
+        },
+    'stem_index' : {
+        'depends' : [ 'Annotations', 'Structure' ],
+        'files'   : lambda script: [],
+        'load'    : lambda script, Annotations, Structure: PositionIndex( Annotations, Structure ),
+        },
+    'timeline' : {
+        'depends' : [ 'Structure', 'Presences' ],
+        'files'   : lambda script: [],
+        'load'    : lambda script, Structure, Presences: Timeline( Structure, Presences ),
+        },
+    'dramatic_unit_index' : {
+        'depends' : [ 'Presences' ],
+        'files'   : lambda script: [],
+        'load'    : lambda script, Presences: DramaticUnits( Presences.presence_sn ),
+        },
+    'scene_hierarchy' : {
+        'depends' : [ 'Presences' ],
+        'files'   : lambda script: [],
+        'load'    : lambda script, Presences: SceneHierarchy( Presences.presence_sn ),
+        },
+    'dramatic_units' : {
+        'depends' : [ 'dramatic_unit_index' ],
+        'files'   : lambda script: [],
+        'load'    : lambda script, dramatic_unit_index: dramatic_unit_index.get_partitions( 0.5 ),
+        },
+    }
+
+def metric_release_stats( name ):
     output = {}
-
     populate_release_stats( name, output )
+    return output
 
-    output['title'] = name
-
-    top_characters = top_presences( Presences, noun_types=[CHARACTER] )
-
-    output['named_characters'] = len( top_characters )
-
-    top_locations = top_presences( Presences, noun_types=[LOCATION] )
+def metric_title( name ):
+    return { 'title' : name }
 
-    # Collocations
-    if False:
-        all_words = nltk.wordpunct_tokenize( raw_script )
-        word_tokens = [ t.lower() for t in all_words if re.search( r'\w', t ) ]
-        text = nltk.Text( word_tokens )
-        print text.collocations()
+def metric_named_characters( top_characters ):
+    return { 'named_characters' : len( top_characters ) }
 
-    # Distinct words.
-    #import pdb
-    #pdb.set_trace()
-        
-    all_words = nltk.wordpunct_tokenize( raw_script )
-    word_tokens = [ t for t in all_words if re.search( r'\w', t ) ]
-    text = nltk.Text( word_tokens )
-    words = [ w.lower() for w in text ]
+def metric_distinct_words( Annotations ):
+    words = [ w.lower() for w in Annotations.get_tokens() ]
     vocab = sorted( set( words ) )
-    english_words = set( w.lower() for w in nltk.corpus.words.words() )
+    return { 'distinct_words' : len( vocab ) }
+
+def metric_exotic_words( Annotations ):
+    '''Words which aren't in the English lexicon.'''
+    words = [ w.lower() for w in Annotations.get_tokens() ]
+    english_words = get_english_words()
     exotic_words = [ e for e in words if e not in english_words ]
     distinct_exotic_words = set( exotic_words )
-    #output['exotic_words'] = len( exotic_words )
-    #output['distinct_exotic_words'] = len( distinct_exotic_words )
-    output['distinct_words'] = len( vocab )
-
-    # Word categories
-    if True:
-        tagged_words = nltk.pos_tag( text )
-        porter = nltk.PorterStemmer()
-        stemmed_tags = [ ( porter.stem( t[0].lower() ), t[1] ) for t in tagged_words ]
-        fd = nltk.FreqDist( stemmed_tags )
-        verbs = [ word for ( word, tag ) in fd if ( tag.startswith('V') and len( word ) > 3 )]
-        adj = [ word for ( word, tag ) in fd if ( tag.startswith('JJ') and len( word ) > 1 ) ]
-        adv = [ word for ( word, tag ) in fd if ( tag.startswith('RB') and len( word ) > 1 ) ]
-        nouns = [ word for ( word, tag ) in fd if ( tag in ('NN', 'NNS' ) and len( word ) > 1 ) ]
-           
-        output['adj-adv_noun-verb_ratio'] = float( ( len( adj ) + len( adv ) ) ) / ( len( nouns ) + len( verbs ) )
-      
-        #output['vocabulary'] = {}
-        #output['vocabulary']['adjectives'] = adj[:10]
-        #output['vocabulary']['non_proper_nouns'] = nouns[:10]
-        #output['vocabulary']['verbs'] = verbs[:10]
-
-    # Word categories
-    #
-    # DEBUG - Limit this to action text.
-    if False:
-        tagged_words = nltk.pos_tag( text )
-        porter = nltk.PorterStemmer()
-        stemmed_tags = [ ( porter.stem( t[0].lower() ), t[1] ) for t in tagged_words ]
-
-        import pylab
-
-        text_to_comp = stemmed_tags
-
-        #print text_to_comp
-
-        verbs = [ text_to_comp[x][0] for x in range( len( text_to_comp ) )
-                  if text_to_comp[x][1].startswith( 'V' ) and len( text_to_comp[x][0] ) > 2 and text_to_comp[x][0] not in [ 'think', 'know', 'want', 'feel', 'see', 'here', 'say', 'happen', 'move', 'touch', 'there', 'have', 'were', 'are', 'saw', 'was', 'said', 'thought', 'knew', 'wanted', 'felt', 'happened', 'moved', 'touched', 'had', 'gitt' ] ]
-
-        print verbs
-
-        points = [(x,y) for x in range( len( text_to_comp ) )
-                  for y in range( 1 )
-                  if text_to_comp[x][1].startswith( 'V' ) and len( text_to_comp[x][0] ) > 2 and text_to_comp[x][0] not in [ 'think', 'know', 'want', 'feel', 'see', 'here', 'say', 'happen', 'move', 'touch', 'there', 'have', 'were', 'are', 'saw', 'was', 'said', 'thought', 'knew', 'wanted', 'felt', 'happened', 'moved', 'touched', 'had', 'gitt' ] ]
-
-        if points:
-            x, y = list(zip(*points))
-        else:
-            x = y = ()
-        pylab.plot(x, y, "b|", scalex=.1)
-        pylab.yticks(list(range(1)), ['verbs'], color="b")
-        pylab.ylim(-1, 1)
-        pylab.title("Lexical Dispersion Plot")
-        pylab.xlabel("Word Offset")
-        pylab.show()
-
-        stemmed_tags.dispersion_plot( [ word[0] for word in stemmed_tags if word[1].startswith( 'V' ) ] )
-
-        '''
-        for idx, tword in enumerate( stemmed_tags ):
-            word, tag = tword
-            if not tag.startswith( 'V' ) or len( word ) <= 2:
-                continue
-            if word not in [ 'think', 'know', 'want', 'feel', 'see', 'here', 'say', 'happen', 'move', 'touch', 'there', 'have' ]:
-                print idx
-                '''
-        sys.exit( 0 )
-
+    return { 'exotic_words' : len( exotic_words ),
+             'distinct_exotic_words' : len( distinct_exotic_words ) }
 
+def metric_word_categories( Annotations ):
+    stemmed_tags = Annotations.get_tagged_stems()
+    fd = nltk.FreqDist( stemmed_tags )
+    verbs = [ word for ( word, tag ) in fd if ( tag.startswith('V') and len( word ) > 3 )]
+    adj = [ word for ( word, tag ) in fd if ( tag.startswith('JJ') and len( word ) > 1 ) ]
+    adv = [ word for ( word, tag ) in fd if ( tag.startswith('RB') and len( word ) > 1 ) ]
+    nouns = [ word for ( word, tag ) in fd if ( tag in ('NN', 'NNS' ) and len( word ) > 1 ) ]
 
-    # R-numbers
-    if False:
-        porter = nltk.PorterStemmer()
-        word_line_offsets = {}
-        for line in Script.script_lines:
-            content = line['content']
-            line_no = line['line_no']
+    return { 'adj-adv_noun-verb_ratio' : float( ( len( adj ) + len( adv ) ) ) / ( len( nouns ) + len( verbs ) ) }
 
-            line_words = nltk.wordpunct_tokenize( content )
-            line_stems = [ porter.stem( w.lower() ) for w in line_words if re.search( r'\w', w ) ]
-
-            for stem in line_stems:
-                if stem in word_line_offsets:
-                    word_line_offsets[stem].append( line_no )
-                else:
-                    word_line_offsets[stem] = [ line_no ]
-
-
-        lines_per_page = 56
-        print "word, occurences, max_page_gap, num_gaps_15_page_or_more, num_gaps_30_page_or_more"
-        for word in sorted( word_line_offsets.keys() ):
-            offsets = word_line_offsets[word]
-            gap_lengths =  [ ( offsets[idx] - offsets[max(idx-1, 0)] ) for idx in range( len( offsets ) ) ]
-            max_gap = max( gap_lengths )
-        
-            num_15_pagegap = sum( [ 1 for gap in gap_lengths if gap >= lines_per_page*15 ] )
-            num_30_pagegap = sum( [ 1 for gap in gap_lengths if gap >= lines_per_page*30 ] )
-
-    # Number of characters who speak to the N'th speaker.
+def metric_character_x_speakers( Presences, Interactions, top_characters ):
+    '''Number of characters who speak to the N'th speaker.'''
     character_x_speakers = []
-    #interlocutor_score = 0
     for character in top_characters[:5]:
         name = character[0]
         speakers = top_interactions( Presences, Interactions, noun_types=[( CHARACTER, CHARACTER )], interaction_types=[DISCUSS], names=[name] ) 
         if name == top_characters[0][0]:
             character_x_speakers.append( { 'character' : name, 'speakers' : 3*len( speakers ) } )
-            #interlocutor_score += 3* len( speakers )
         else:
             character_x_speakers.append( { 'character' : name, 'speakers' : len( speakers ) } )
-            #interlocutor_score += len( speakers )
-    output['character_x_speakers'] = character_x_speakers
-    #output['interlocutor_score'] = interlocutor_score
+    return { 'character_x_speakers' : character_x_speakers }
 
-    #output['main_character_interlocutor_count'] = len( speakers )
-    
-    # Distinct locations
-    output['distinct_locations'] = len( top_locations )
-
-    # Number of location changes.
-    location_changes = 0
-    current_location = None
-    for presence in Presences.presences:
-        if presence['presence_type'] == SETTING and presence['noun_type'] == LOCATION:
-            if presence['name'] != current_location:
-                location_changes += 1
-            current_location = presence['name']
-    output['location_changes'] = math.log( location_changes )
-    
+def metric_distinct_locations( top_locations ):
+    return { 'distinct_locations' : len( top_locations ) }
 
-    # Percentage of scenes with main character
-    scenes = Presences.presence_sn.keys()
-    scene_count = len( scenes )
-    main_character_appearances = 0
-    for scene in scenes:
-        if top_characters[0][0] in Presences.presence_sn[scene]:
-            main_character_appearances += 1
-    #output['percentage_of_scenes_with_main_character'] = float( main_character_appearances ) / scene_count
-    #output['main_character'] = top_characters[0][0]
-
-    # Characters speaking in scene.
-    scene_talkers = {}
-    for presence in Presences.presences:
-        if presence['presence_type'] == DISCUSS:
-            scene = presence['where']['scene_id']
-            character = presence['name']
-            if scene in scene_talkers:
-                scene_talkers[scene][character] = True
-            else:
-                scene_talkers[scene] = { character : True }
-    scene_talker_data = []
-    for scene in scene_talkers.keys():
-        scene_talker_data.append( ( scene, len( scene_talkers[scene].keys() ) ) )
-        
-    for scene_id in Presences.presence_sn.keys():
-        if scene_id not in scene_talkers:
-            scene_talker_data.append( ( scene_id, 0 ) )
-    scene_talker_data = sorted( scene_talker_data, key=lambda a: int( a[0] ) )
-    
-    #output['characters_speaking_in_scene_stats'] = get_stats( scene_talker_data )
-    scene_talker_stats = get_stats( scene_talker_data )
-    output['scene_dialog_score'] = scene_talker_stats['median']
+def metric_location_changes( timeline ):
+    '''Log of the number of location changes.'''
+    location_changes = timeline.location_switches( timeline.get_edges( 1 ) )[0]
+    return { 'location_changes' : math.log( location_changes ) }
 
-    #output['characters_speaking_in_scene'] = scene_talker_data
+def metric_main_character_scenes( character_incidence, top_characters ):
+    '''Percentage of scenes with main character.'''
+    return { 'percentage_of_scenes_with_main_character' : character_incidence.scene_fractions()[0],
+             'main_character' : top_characters[0][0] }
 
-    # Ratio of dialog to non-dialog words per scene.
+def get_scene_talker_data( character_incidence ):
+    '''Characters speaking in each scene.'''
+    speakers = character_incidence.scene_totals( speaking=True )
+    return [ ( scene_id, int( speakers[i] ) ) for ( i, scene_id ) in enumerate( character_incidence.scene_ids ) ]
+
+def metric_scene_dialog_score( character_incidence ):
+    scene_talker_stats = get_stats( get_scene_talker_data( character_incidence ) )
+    return { 'scene_dialog_score' : scene_talker_stats['median'] }
+
+def metric_characters_speaking_in_scene( character_incidence ):
+    scene_talker_data = get_scene_talker_data( character_incidence )
+    return { 'characters_speaking_in_scene_stats' : get_stats( scene_talker_data ),
+             'characters_speaking_in_scene' : scene_talker_data }
+
+def metric_dialog_to_total_word_ratio( Structure ):
+    '''Ratio of dialog to non-dialog words per scene.'''
     scenes = Structure.structure['scenes']
     scene_word_ratios = [ ( x[0], float( x[1]['dialog_words'] ) / x[1]['total_words'] ) for x in scenes.items() ]
-    #output['dialog_to_total_word_ratio_in_scenes_stats'] = get_stats( scene_word_ratios )
-
-    # Global word counts
-    #output['total_words'] = Structure.structure['total_words']
-    #output['dialog_words'] = Structure.structure['dialog_words']
-    output['percent_dialog'] = float( Structure.structure['dialog_words'] ) / Structure.structure['total_words']
-
-    # Percentage of dialog in the 1st, 2nd, Nth portion of the text.
-    nths = 4;
-    nth_percent_of_dialog = []
-    percent_of_dialog_in_nth = []
-    for i in range( nths ):
-        nth_percent_of_dialog.append( 0 )
-        percent_of_dialog_in_nth.append( 0 )
-
-    # total_words, dialog_words
-    total_words = Structure.structure['total_words']
-    total_dialog = Structure.structure['dialog_words']
-    running_word_count = 0
-    current_nth = 0
-    nth_word_count = 0
-    nth_dialog_count = 0
-    for scene_id in sorted( Structure.structure['scenes'].keys(), key=int ):
-        scene = Structure.structure['scenes'][scene_id]
-        nth_word_count += scene['total_words']
-        nth_dialog_count += scene['dialog_words']
-        running_word_count += scene['total_words']
-        new_nth = int( nths * running_word_count / total_words )
-        if new_nth != current_nth:
-            nth_percent_of_dialog[current_nth] = float( nth_dialog_count ) / total_dialog
-            percent_of_dialog_in_nth[current_nth] = float( nth_dialog_count ) / nth_word_count
-            current_nth = new_nth
-            nth_word_count = 0
-            nth_dialog_count = 0
-
-    #output['nth_percent_of_dialog'] = nth_percent_of_dialog
-    #output['percent_of_dialog_in_nth'] = percent_of_dialog_in_nth
-
-    # % of action words.
+    return { 'dialog_to_total_word_ratio_in_scenes_stats' : get_stats( scene_word_ratios ) }
+
+def metric_word_counts( Structure ):
+    return { 'total_words' : Structure.structure['total_words'],
+             'dialog_words' : Structure.structure['dialog_words'] }
+
+def metric_percent_dialog( Structure ):
+    return { 'percent_dialog' : float( Structure.structure['dialog_words'] ) / Structure.structure['total_words'] }
+
+def metric_dialog_by_nth( timeline ):
+    '''Percentage of dialog in the 1st, 2nd, Nth portion of the text.'''
+    nths = 4
+    edges = timeline.get_edges( nths )
+    dialog = timeline.dialog( edges )
+    return { 'nth_percent_of_dialog' : list( dialog / dialog.sum() ),
+             'percent_of_dialog_in_nth' : list( timeline.dialog_density( edges ) ) }
+
+def metric_pacing( timeline ):
+    '''Dialog density, speakers and location changes in each percent of
+    the text.'''
+    edges = timeline.get_edges( 100 )
+    return { 'dialog_density_by_percent' : list( timeline.dialog_density( edges ) ),
+             'speakers_by_percent' : [ int( x ) for x in timeline.speakers( edges ) ],
+             'location_changes_by_percent' : [ int( x ) for x in timeline.location_switches( edges ) ] }
+
+def metric_total_action_words( Structure ):
     total_action_words = 0
     for scene in Structure.structure['scenes'].keys():
         for block in Structure.structure['scenes'][scene]['scene_blocks']:
             if block['block_type'] == 'ACTION':
                 total_action_words += block['total_words']
-    #output['total_action_words'] = total_action_words
+    return { 'total_action_words' : total_action_words }
 
-    # % of dialog by top-N speakers.
+def get_character_dialog( Presences, name ):
+    dialog = 0
+    for ( scene_id, presences ) in Presences.presence_ns[name].items():
+        if scene_id == 'noun_type':
+            continue
+        for presence in presences:
+            if presence['presence_type'] == DISCUSS:
+                dialog += presence['dialog_words']
+    return dialog
+
+def metric_percent_dialog_by_character( Structure, Presences, top_characters ):
+    '''% of dialog by top-N speakers.'''
     dialog_by_top_chars = []
-    #dialog_score = 0
     for character in top_characters[:5]:
         name = character[0]
-        
-        dialog = 0
-        for ( scene_id, presences ) in Presences.presence_ns[name].items():
-            if scene_id == 'noun_type':
-                continue
-            for presence in presences:
-                if presence['presence_type'] == DISCUSS:
-                    dialog += presence['dialog_words']
-        #dialog_by_top_chars.append( { 'character' : name, 'appearances' : character[2], 'percent_dialog' : float( dialog ) / Structure.structure['dialog_words'] } )
+        dialog = get_character_dialog( Presences, name )
         if name == top_characters[0][0]:
             dialog_by_top_chars.append( { 'character' : name, 'appearances' : character[2], 'percent_dialog' : 3 * float( dialog ) / Structure.structure['dialog_words'] } )
-            #dialog_score += 3*dialog_by_top_chars[-1]['percent_dialog']
         else:
             dialog_by_top_chars.append( { 'character' : name, 'appearances' : character[2], 'percent_dialog' : float( dialog ) / Structure.structure['dialog_words'] } )
-            #dialog_score += dialog_by_top_chars[-1]['percent_dialog']
             
-    output['percent_dialog_by_character'] = dialog_by_top_chars
-    #output['dialog_score'] = dialog_score
+    return { 'percent_dialog_by_character' : dialog_by_top_chars }
 
-    # Number of non-main characters who have at least 15 words of
-    # dialog.
+def metric_supporting_characters( Presences, top_characters ):
+    '''Log of the number of non-main characters who have at least 15
+    words of dialog.'''
     supporting_characters = 0
     for character in top_characters[1:]:
-        name = character[0]
-        
-        dialog = 0
-        for ( scene_id, presences ) in Presences.presence_ns[name].items():
-            if scene_id == 'noun_type':
-                continue
-            for presence in presences:
-                if presence['presence_type'] == DISCUSS:
-                    dialog += presence['dialog_words']
-        if dialog >= 15:
+        if get_character_dialog( Presences, character[0] ) >= 15:
             supporting_characters += 1
 
-    output['supporting_characters'] = math.log( supporting_characters )
+    return { 'supporting_characters' : math.log( supporting_characters ) }
            
-    # % of scenes that have the top-N characters.
-    scenes_with_top_chars = []
-    #presence_score = 0
-    for character in top_characters[:5]:
-        name = character[0]
-        scenes = len( Presences.presence_sn.keys() )
-        count = 0
-        for scene in Presences.presence_sn.keys():
-            if name in Presences.presence_sn[scene]:
-                count += 1
-        #scenes_with_top_chars.append( { 'character' : name, 'percentage_of_scenes' : float( count ) / scenes } )
-        if name == top_characters[0][0]:
-            scenes_with_top_chars.append( { 'character' : name, 'percentage_of_scenes' : 3 * float( count ) / scenes } )
-            #presence_score += 3*scenes_with_top_chars[-1]['percentage_of_scenes']
-        else:
-            scenes_with_top_chars.append( { 'character' : name, 'percentage_of_scenes' : 3 * float( count ) / scenes } )
-            #presence_score += scenes_with_top_chars[-1]['percentage_of_scenes']
+def metric_scenes_percentage_for_characters( character_incidence ):
+    '''% of scenes that have the top-N characters.'''
+    counts = character_incidence.scene_counts()
+    scenes = len( character_incidence.scene_ids )
+    scenes_with_top_chars = [ { 'character' : name, 'percentage_of_scenes' : 3 * float( counts[i] ) / scenes } for ( i, name ) in enumerate( character_incidence.names[:5] ) ]
 
-    #output['presence_score'] = presence_score
-    output['scenes_percentage_for_characters'] = scenes_with_top_chars
+    return { 'scenes_percentage_for_characters' : scenes_with_top_chars }
 
-    # % of words in the top-N locations
+def metric_top_location_words( Structure, Presences, top_locations ):
+    '''% of words in the top-N locations'''
     words_at_top_locs = []
     for location in top_locations:
         name = location[0]
@@ -550,13 +375,27 @@ def process_script( script ):
 
         words_at_top_locs.append( { 'location' : name, 'appearances' : location[2], 'percent_words' : float( words ) / Structure.structure['total_words'] } )
 
-    #output['percent_words_by_top_10_locations'] = words_at_top_locs[:10]
+    return { 'percent_words_by_top_10_locations' : words_at_top_locs[:10] }
+
+def metric_dramatic_units( dramatic_units ):
+    return { 'dramatic_units' : len( dramatic_units ) }
+
+def metric_dramatic_unit_sweep( dramatic_unit_index ):
+    '''The number of dramatic units at each coefficient from 0 to 1 in
+    steps of 0.01.'''
+    coefficients = numpy.linspace( 0, 1, 101 )
+    return { 'dramatic_unit_sweep' : [ int( x ) for x in dramatic_unit_index.counts( coefficients ) ] }
 
-    # Number of characters in dialog per DU.
-    dus = get_dramatic_unit_partitions( Presences.presence_sn, 0.5 )
-    output['dramatic_units'] = len( dus )
+def metric_scene_hierarchy( scene_hierarchy ):
+    '''Segments of the hierarchical segmentation at several distances,
+    and the scenes in each of its top three segments.'''
+    return { 'hierarchy_units' : [ int( x ) for x in scene_hierarchy.counts( [ 1, 2, 4, 8 ] ) ],
+             'act_scenes' : [ len( x ) for x in scene_hierarchy.get_segments( 3 ) ] }
+
+def metric_du_speakers( Presences, dramatic_units ):
+    '''Number of characters in dialog per DU.'''
     speaker_count = []
-    for du in dus:
+    for du in dramatic_units:
         speakers = {}
         for scene_idx in du:
             for name, presences in Presences.presence_sn["%s" % scene_idx].items():
@@ -570,63 +409,546 @@ def process_script( script ):
                     else:
                         break
         speaker_count.append( len( speakers.keys() ) )
-    #output['du_speakers'] = speaker_count
+    return { 'du_speakers' : speaker_count }
 
-    # Stats on number of words per unit of dialog.
+def metric_dialog_words_score( Structure ):
+    '''Stats on number of words per unit of dialog.'''
     dialog_stats = []
     for scene in Structure.structure['scenes'].keys():
         for block in Structure.structure['scenes'][scene]['scene_blocks']:
             if block['block_type'] == 'DIALOG':
                 dialog_stats.append( ( scene, block['total_words'] ) )
-    #output['dialog_block_word_count_stats'] = get_stats( dialog_stats )
     dialog_score_stats = get_stats( dialog_stats )
-    output['dialog_words_score'] = [ dialog_score_stats['average'],  dialog_score_stats['max'] ]
+    return { 'dialog_words_score' : [ dialog_score_stats['average'],  dialog_score_stats['max'] ] }
    
-    # Hearing - sum of number of characters speaking in a scene *
-    # words of dialog in a scene.
-    hearing = 0
-    for scene in Structure.structure['scenes'].keys():
-        scene_dialog = Structure.structure['scenes'][scene]['dialog_words']
-        if scene_dialog > 0:
-            scene_presences = Presences.presence_sn[scene]
-            speakers = 0
-            for person in scene_presences.keys():
-                presence_list = scene_presences[person]
-                for presence in presence_list:
-                    if presence['presence_type'] == DISCUSS:
-                        speakers += 1
-                        break
-            hearing += scene_dialog * speakers
-    output['hearing'] = hearing
+def metric_hearing( Structure, character_incidence ):
+    '''Hearing - sum of number of characters speaking in a scene *
+    words of dialog in a scene.'''
+    scenes = Structure.structure['scenes']
+    scene_dialog = numpy.array( [ scenes[x]['dialog_words'] for x in character_incidence.scene_ids ] )
+    return { 'hearing' : int( numpy.dot( scene_dialog, character_incidence.scene_totals( speaking=True ) ) ) }
 
-    # Buddies - the number of characters pairs a, b such that whenever
-    # a appears b is present at least 50% of the time.
-    buddies = []
+def metric_buddies( character_incidence ):
+    '''Buddies - the number of characters pairs a, b such that whenever
+    a appears b is present at least 50% of the time.'''
     buddy_threshold = 0.5
     min_appearances = 3
-    for character in sorted( top_characters ):
-        name = character[0]
-        character_scene_ids = [ x for x in Presences.presence_ns[name].keys() if x != 'noun_type' ]
-        if len( character_scene_ids ) <= min_appearances:
-            continue
-        for co_character in sorted( top_characters ):
-            co_name = co_character[0]
-            if co_name <= name:
-                continue
-            co_character_scene_ids = [ x for x in Presences.presence_ns[co_name].keys() if x != 'noun_type' ]
-            if len( co_character_scene_ids ) <= min_appearances:
+
+    counts = character_incidence.scene_counts()
+    shared = character_incidence.co_presence()
+
+    # Row i of ratios is the fraction of character i's scenes each
+    # other character is in.
+    ratios = shared / numpy.maximum( counts, 1 )[:, numpy.newaxis].astype( float )
+
+    candidates = counts > min_appearances
+    is_buddy = numpy.triu( ( ratios >= buddy_threshold ) & ( ratios.T >= buddy_threshold ), 1 ) & numpy.outer( candidates, candidates )
+
+    names = character_incidence.names
+    buddies = sorted( [ ( names[a], names[b], float( ratios[a, b] ), float( ratios[b, a] ) ) if names[a] < names[b] else
+                        ( names[b], names[a], float( ratios[b, a] ), float( ratios[a, b] ) )
+                        for ( a, b ) in zip( *numpy.nonzero( is_buddy ) ) ] )
+    return { 'buddies_list' : buddies,
+             'buddies' : len( buddies ) }
+
+def metric_word_recurrence( stem_index ):
+    '''R-numbers - how many words recur, and how many go 15 or 30 pages
+    or more between one use and the next.'''
+    lines_per_page = 56
+    stats = stem_index.get_gap_statistics( unit='line', thresholds=[ lines_per_page*15, lines_per_page*30 ] )
+    return { 'recurring_words' : int( numpy.sum( stats['occurrences'] > 1 ) ),
+             'words_with_15_page_gaps' : int( numpy.sum( stats['gaps_at_least'][:, 0] > 0 ) ),
+             'words_with_30_page_gaps' : int( numpy.sum( stats['gaps_at_least'][:, 1] > 0 ) ) }
+
+# The metrics we can compute for each script.  Each metric has:
+#
+# inputs - the inputs its compute function takes, in order
+# fields - the fields of the metrics output it writes
+# compute - function of its inputs returning a dictionary of its fields
+# default - True if it is computed when no metrics are named
+metrics = {
+    'release_stats' : {
+        'inputs'  : [ 'name' ],
+        'fields'  : [ 'rt' ],
+        'compute' : metric_release_stats,
+        'default' : True,
+        },
+    'title' : {
+        'inputs'  : [ 'name' ],
+        'fields'  : [ 'title' ],
+        'compute' : metric_title,
+        'default' : True,
+        },
+    'named_characters' : {
+        'inputs'  : [ 'top_characters' ],
+        'fields'  : [ 'named_characters' ],
+        'compute' : metric_named_characters,
+        'default' : True,
+        },
+    'distinct_words' : {
+        'inputs'  : [ 'Annotations' ],
+        'fields'  : [ 'distinct_words' ],
+        'compute' : metric_distinct_words,
+        'default' : True,
+        },
+    'exotic_words' : {
+        'inputs'  : [ 'Annotations' ],
+        'fields'  : [ 'exotic_words', 'distinct_exotic_words' ],
+        'compute' : metric_exotic_words,
+        'default' : False,
+        },
+    'word_categories' : {
+        'inputs'  : [ 'Annotations' ],
+        'fields'  : [ 'adj-adv_noun-verb_ratio' ],
+        'compute' : metric_word_categories,
+        'default' : True,
+        },
+    'word_recurrence' : {
+        'inputs'  : [ 'stem_index' ],
+        'fields'  : [ 'recurring_words', 'words_with_15_page_gaps', 'words_with_30_page_gaps' ],
+        'compute' : metric_word_recurrence,
+        'default' : True,
+        },
+    'character_x_speakers' : {
+        'inputs'  : [ 'Presences', 'Interactions', 'top_characters' ],
+        'fields'  : [ 'character_x_speakers' ],
+        'compute' : metric_character_x_speakers,
+        'default' : True,
+        },
+    'distinct_locations' : {
+        'inputs'  : [ 'top_locations' ],
+        'fields'  : [ 'distinct_locations' ],
+        'compute' : metric_distinct_locations,
+        'default' : True,
+        },
+    'location_changes' : {
+        'inputs'  : [ 'timeline' ],
+        'fields'  : [ 'location_changes' ],
+        'compute' : metric_location_changes,
+        'default' : True,
+        },
+    'main_character_scenes' : {
+        'inputs'  : [ 'character_incidence', 'top_characters' ],
+        'fields'  : [ 'percentage_of_scenes_with_main_character', 'main_character' ],
+        'compute' : metric_main_character_scenes,
+        'default' : False,
+        },
+    'scene_dialog_score' : {
+        'inputs'  : [ 'character_incidence' ],
+        'fields'  : [ 'scene_dialog_score' ],
+        'compute' : metric_scene_dialog_score,
+        'default' : True,
+        },
+    'characters_speaking_in_scene' : {
+        'inputs'  : [ 'character_incidence' ],
+        'fields'  : [ 'characters_speaking_in_scene_stats', 'characters_speaking_in_scene' ],
+        'compute' : metric_characters_speaking_in_scene,
+        'default' : False,
+        },
+    'dialog_to_total_word_ratio' : {
+        'inputs'  : [ 'Structure' ],
+        'fields'  : [ 'dialog_to_total_word_ratio_in_scenes_stats' ],
+        'compute' : metric_dialog_to_total_word_ratio,
+        'default' : False,
+        },
+    'word_counts' : {
+        'inputs'  : [ 'Structure' ],
+        'fields'  : [ 'total_words', 'dialog_words' ],
+        'compute' : metric_word_counts,
+        'default' : False,
+        },
+    'percent_dialog' : {
+        'inputs'  : [ 'Structure' ],
+        'fields'  : [ 'percent_dialog' ],
+        'compute' : metric_percent_dialog,
+        'default' : True,
+        },
+    'dialog_by_nth' : {
+        'inputs'  : [ 'timeline' ],
+        'fields'  : [ 'nth_percent_of_dialog', 'percent_of_dialog_in_nth' ],
+        'compute' : metric_dialog_by_nth,
+        'default' : False,
+        },
+    'pacing' : {
+        'inputs'  : [ 'timeline' ],
+        'fields'  : [ 'dialog_density_by_percent', 'speakers_by_percent', 'location_changes_by_percent' ],
+        'compute' : metric_pacing,
+        'default' : False,
+        },
+    'total_action_words' : {
+        'inputs'  : [ 'Structure' ],
+        'fields'  : [ 'total_action_words' ],
+        'compute' : metric_total_action_words,
+        'default' : False,
+        },
+    'percent_dialog_by_character' : {
+        'inputs'  : [ 'Structure', 'Presences', 'top_characters' ],
+        'fields'  : [ 'percent_dialog_by_character' ],
+        'compute' : metric_percent_dialog_by_character,
+        'default' : True,
+        },
+    'supporting_characters' : {
+        'inputs'  : [ 'Presences', 'top_characters' ],
+        'fields'  : [ 'supporting_characters' ],
+        'compute' : metric_supporting_characters,
+        'default' : True,
+        },
+    'scenes_percentage_for_characters' : {
+        'inputs'  : [ 'character_incidence' ],
+        'fields'  : [ 'scenes_percentage_for_characters' ],
+        'compute' : metric_scenes_percentage_for_characters,
+        'default' : True,
+        },
+    'top_location_words' : {
+        'inputs'  : [ 'Structure', 'Presences', 'top_locations' ],
+        'fields'  : [ 'percent_words_by_top_10_locations' ],
+        'compute' : metric_top_location_words,
+        'default' : False,
+        },
+    'dramatic_units' : {
+        'inputs'  : [ 'dramatic_units' ],
+        'fields'  : [ 'dramatic_units' ],
+        'compute' : metric_dramatic_units,
+        'default' : True,
+        },
+    'dramatic_unit_sweep' : {
+        'inputs'  : [ 'dramatic_unit_index' ],
+        'fields'  : [ 'dramatic_unit_sweep' ],
+        'compute' : metric_dramatic_unit_sweep,
+        'default' : False,
+        },
+    'scene_hierarchy' : {
+        'inputs'  : [ 'scene_hierarchy' ],
+        'fields'  : [ 'hierarchy_units', 'act_scenes' ],
+        'compute' : metric_scene_hierarchy,
+        'default' : False,
+        },
+    'du_speakers' : {
+        'inputs'  : [ 'Presences', 'dramatic_units' ],
+        'fields'  : [ 'du_speakers' ],
+        'compute' : metric_du_speakers,
+        'default' : False,
+        },
+    'dialog_words_score' : {
+        'inputs'  : [ 'Structure' ],
+        'fields'  : [ 'dialog_words_score' ],
+        'compute' : metric_dialog_words_score,
+        'default' : True,
+        },
+    'hearing' : {
+        'inputs'  : [ 'Structure', 'character_incidence' ],
+        'fields'  : [ 'hearing' ],
+        'compute' : metric_hearing,
+        'default' : True,
+        },
+    'buddies' : {
+        'inputs'  : [ 'character_incidence' ],
+        'fields'  : [ 'buddies_list', 'buddies' ],
+        'compute' : metric_buddies,
+        'default' : False,
+        },
+    }
+
+class MetricInputs( object ):
+    '''Loads the inputs of the metrics of one script on first use, so
+    each is loaded at most once and only if some metric needs it.'''
+
+    def __init__( self, script ):
+        self.script = script
+        self.values = {}
+        self.digests = {}
+
+    def get( self, name ):
+        if name not in self.values:
+            spec = inputs[name]
+            self.values[name] = spec['load']( self.script, *[ self.get( x ) for x in spec['depends'] ] )
+        return self.values[name]
+
+    def get_files( self, name ):
+        '''Return the files input name is read or computed from.'''
+        result = inputs[name]['files']( self.script )
+        for dependency in inputs[name]['depends']:
+            result += self.get_files( dependency )
+        return result
+
+    def get_key( self, metric ):
+        '''Return a SHA1 of the code metric is computed with and the
+        contents of the files its inputs come from.'''
+
+        digest = hashlib.sha1( metric )
+        digest.update( get_code_version( metric ) )
+
+        for name in metrics[metric]['inputs']:
+            digest.update( name )
+            for path in sorted( set( self.get_files( name ) ) ):
+                if path not in self.digests:
+                    self.digests[path] = hash_file( path )
+                digest.update( path + self.digests[path] )
+
+        return digest.hexdigest()
+
+# Keyed on metric, the SHA1 of get_code_version.
+code_versions = {}
+
+# Keyed on the name of a library module, the SHA1 of its source file.
+module_digests = {}
+
+def get_code_version( metric ):
+    '''Return a SHA1 of the code metric is computed with: the source of
+    its compute function, of the load function of each of its inputs
+    and the inputs they depend on, and of the functions of this file
+    those call, and the source files of the tsl modules any of them
+    use, with the tsl modules those import.  Editing one metric leaves
+    the cached results of the others current.'''
+
+    if metric not in code_versions:
+        functions = [ metrics[metric]['compute'] ]
+        pending = list( metrics[metric]['inputs'] )
+        while pending:
+            name = pending.pop()
+            functions.append( inputs[name]['load'] )
+            pending += inputs[name]['depends']
+
+        sources = set()
+        modules = set()
+        seen = set()
+
+        while functions:
+            function = functions.pop()
+            if function in seen:
                 continue
-            ratio_a = float( len( set( character_scene_ids ).intersection( set( co_character_scene_ids ) ) ) ) / len( character_scene_ids )
-            ratio_b = float( len( set( character_scene_ids ).intersection( set( co_character_scene_ids ) ) ) ) / len( co_character_scene_ids )
-            if ratio_a >= buddy_threshold and ratio_b >= buddy_threshold:
-                buddies.append( ( name, co_name, ratio_a, ratio_b ) )
-    #output['buddies_list'] = buddies
-    #output['buddies'] = len( buddies )
+            seen.add( function )
+            sources.add( inspect.getsource( function ) )
+
+            for names in get_global_references( function.func_code ):
+                value = resolve_reference( names, function.func_globals )
+                if inspect.isfunction( value ) and value.__module__ == __name__:
+                    functions.append( value )
+                elif inspect.ismodule( value ):
+                    add_library_module( value, modules )
+                elif inspect.isfunction( value ) or inspect.isclass( value ):
+                    add_library_module( sys.modules.get( value.__module__ ), modules )
+                elif isinstance( value, ( basestring, int, float ) ):
+                    # Constants such as the noun types.
+                    sources.add( repr( value ) )
+
+        digest = hashlib.sha1()
+        for source in sorted( sources ):
+            digest.update( source )
+        for name in sorted( modules ):
+            digest.update( name + module_digests[name] )
+        code_versions[metric] = digest.hexdigest()
+
+    return code_versions[metric]
+
+def get_global_references( code ):
+    '''Return each global code, or any code nested in it, refers to as
+    a list of the global's name and the attributes looked up on it in
+    turn, so tsl.script.Structure.Structure is [ 'tsl', 'script',
+    'Structure', 'Structure' ].'''
+
+    result = []
+    current = None
+
+    ops = [ ord( x ) for x in code.co_code ]
+    i = 0
+    while i < len( ops ):
+        op = ops[i]
+        arg = None
+        if op >= dis.HAVE_ARGUMENT:
+            arg = ops[i + 1] + ops[i + 2] * 256
+            i += 3
+        else:
+            i += 1
+
+        if op == dis.opmap['LOAD_GLOBAL']:
+            current = [ code.co_names[arg] ]
+            result.append( current )
+        elif op == dis.opmap['LOAD_ATTR'] and current is not None:
+            current.append( code.co_names[arg] )
+        else:
+            current = None
+
+    for const in code.co_consts:
+        if inspect.iscode( const ):
+            result += get_global_references( const )
+
+    return result
+
+def resolve_reference( names, namespace ):
+    '''Return the object names of get_global_references refers to,
+    following the attributes only as far as they are modules, or None
+    for builtins.'''
+
+    if names[0] not in namespace:
+        return None
+
+    value = namespace[names[0]]
+    for name in names[1:]:
+        if not inspect.ismodule( value ) or not hasattr( value, name ):
+            break
+        value = getattr( value, name )
+
+    return value
+
+def add_library_module( module, modules ):
+    '''Add the name of module, if it is a module of tsl, and of the
+    tsl modules it imports to modules, hashing their source files.'''
+
+    if module is None or not module.__name__.startswith( 'tsl.' ) or module.__name__ in modules:
+        return
+
+    modules.add( module.__name__ )
+    if module.__name__ not in module_digests:
+        module_digests[module.__name__] = hash_file( inspect.getsourcefile( module ) )
+
+    for imported in get_imported_modules( module ):
+        add_library_module( imported, modules )
+
+def get_imported_modules( module ):
+    '''Return the tsl modules module imports code or constants from.
+    Names bound to lists or dictionaries, such as the films of the
+    corpus, are data rather than code.'''
+
+    result = []
+
+    for line in inspect.getsource( module ).splitlines():
+        match = re.match( r'\s*import\s+(tsl\.[\w.]+)\s*$', line )
+        if match:
+            result.append( match.group( 1 ) )
+            continue
+
+        match = re.match( r'\s*from\s+(tsl[\w.]*)\s+import\s+(.+)$', line )
+        if match:
+            for name in match.group( 2 ).split( ',' ):
+                value = getattr( module, name.split()[-1], None )
+                if inspect.ismodule( value ):
+                    result.append( value.__name__ )
+                elif not isinstance( value, ( list, dict, tuple, set ) ):
+                    result.append( match.group( 1 ) )
+
+    return [ sys.modules[x] for x in result if x in sys.modules ]
+
+def hash_file( path ):
+    digest = hashlib.sha1()
+    if os.path.exists( path ):
+        f = open( path, 'rb' )
+        for block in iter( lambda: f.read( 1 << 20 ), '' ):
+            digest.update( block )
+        f.close()
+    return digest.hexdigest()
+
+def get_metrics_filename( script ):
+    return "%s/%s_metrics.json" % ( get_outdir( script ), get_fname( script ) )
+
+def get_cache_filename( script ):
+    return "%s/%s_metric_cache.json" % ( get_outdir( script ), get_fname( script ) )
+
+def read_json( filename ):
+    if os.path.exists( filename ):
+        f = open( filename, 'r' )
+        result = json.load( f )
+        f.close()
+        return result
+    else:
+        return {}
+
+def write_json( filename, data ):
+    # Write to the side and rename so an interrupted run never leaves
+    # a truncated file behind.
+    f = open( filename + '.tmp', 'w' )
+    json.dump( data, f, sort_keys=True, indent=4 )
+    f.close()
+    os.rename( filename + '.tmp', filename )
+
+def process_script( script, metric_names=None, force=False, update_table=True ):
+    '''Compute metric_names, by default every metric whose default is
+    True, for script and write them to its metrics file.
+
+    The result of each metric is cached along with a key of its code
+    and inputs, and only recomputed when the key changes or force is
+    True, so inputs such as the annotations are only loaded when a
+    metric which needs them has changed.  When metric_names are given
+    the fields of other metrics already in the metrics file are kept.
+    Unless update_table is False the film's row of the corpus metrics
+    table is updated to match.'''
 
-    # Write the output.
-    f = open( file_dir + file_name + '/%s_metrics.json' % ( file_name ), 'w' )
-    json.dump( output, f, sort_keys=True, indent=4 )
+    print "Working on:", script[0]
 
+    if metric_names is None:
+        metric_names = sorted( [ x for x in metrics if metrics[x]['default'] ] )
+        output = {}
+    else:
+        output = read_json( get_metrics_filename( script ) )
+
+    for metric in metric_names:
+        if metric not in metrics:
+            raise Exception( "Unknown metric %s, expected one of %s" % ( metric, ', '.join( sorted( metrics ) ) ) )
+
+    cache = read_json( get_cache_filename( script ) )
+
+    values = MetricInputs( script )
+
+    for metric in metric_names:
+        key = values.get_key( metric )
+
+        if force or cache.get( metric, {} ).get( 'key' ) != key:
+            cache[metric] = {
+                'key'    : key,
+                'fields' : metrics[metric]['compute']( *[ values.get( x ) for x in metrics[metric]['inputs'] ] )
+                }
+
+        output.update( cache[metric]['fields'] )
+
+    write_json( get_cache_filename( script ), cache )
+    write_json( get_metrics_filename( script ), output )
+
+    if update_table:
+        connection = metrics_table.connect()
+        metrics_table.update_film( connection, script[0], output )
+        connection.close()
+
+    return output
+
+def run_script( script, metric_names=None, force=False ):
+    '''Run process_script without updating the metrics table,
+    returning the script's name, the seconds taken, the traceback if it
+    failed or else None, and the metrics written or else None.'''
+
+    start = time.time()
+    error = None
+    output = None
+
+    try:
+        output = process_script( script, metric_names, force, update_table=False )
+    except Exception:
+        error = traceback.format_exc()
+
+    return ( script[0], time.time() - start, error, output )
+
+def process_scripts( films, metric_names=None, force=False, processes=None ):
+    '''Compute metrics for films across processes workers, by default
+    one per core.  Yields the script's name, the seconds taken, and the
+    traceback if it failed or else None for each film as it finishes.
+
+    The workers send each film's metrics back and only this process
+    writes the metrics table, so the workers never contend for it.'''
+
+    connection = metrics_table.connect()
+    pool = multiprocessing.Pool( processes )
+
+    try:
+        for ( name, elapsed, error, output ) in pool.imap_unordered( functools.partial( run_script, metric_names=metric_names, force=force ), films ):
+            if error is None:
+                metrics_table.update_film( connection, name, output )
+            yield ( name, elapsed, error )
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        connection.close()
 
 def get_stats( data ):
     '''Input is an unsorted array of ( 'scene_id', numerical quantity
@@ -640,18 +962,6 @@ def get_stats( data ):
              'median'  : numpy.median( numbers ),
              'stdev'   : numpy.std( numbers ) }
 
-
-
-
-
-    # top_presences( Presences, top_n=8, noun_types=[CHARACTER] )
-    #output_top_presences( top_presences( Presences, top_n=5, noun_types=[CHARACTER] ), outdir+'/top5_characters.csv' )
-    #output_top_presences( top_presences( Presences, top_n=5, presence_types=[DISCUSS] ), outdir+'/top5_speakers.csv' )
-    #output_top_presences( top_presences( Presences, top_n=5, noun_types=[LOCATION] ), outdir+'/top5_locations.csv' )
-    #output_top_interactions( top_interactions( Presences, Interactions, top_n=5, interaction_types=[SETTING] ), outdir+'/top5_hangouts.csv' )
-    #output_top_interactions( top_interactions( Presences, Interactions, top_n=5, noun_types=[ ( CHARACTER, CHARACTER ) ] ), outdir+'/top5_bffs.csv' )
-    #output_top_interactions( top_interactions( Presences, Interactions, top_n=5, interaction_types=[DISCUSS] ), outdir+'/top5_speakers.csv' )
-
 def output_top_presences( presences, filename ):
     f = open( filename, 'w' )
     f.write("name,noun_type,appearances\n")
@@ -668,28 +978,44 @@ def output_top_interactions( interactions, filename ):
         f.write( "\n" )
     f.close()
 
-f = open( "/wintmp/movies.csv", 'r' )
-movie_csv = csv.reader( f )
-
-release_stats = {}
-
-#for row in movie_csv:
-#    if row[6] in release_stats:
-#        print "ERROR - SECOND COPY OF:", row[6]
-#    release_stats[row[6]] = {
-#        'date' : row[0],
-#        'domestic_box' : row[1],
-#        'international_box' : row[2],
-#        'domestic_dvd_sales' : row[3],
-#        'production_budget' : row[4],
-#        'rt' : row[5],
-#        'name' : row[6],
-#        'key' : row[7],
-#        }
-
-#import pdb
-#pdb.set_trace()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Compute metrics for the films of the corpus.' )
+    parser.add_argument( 'films', nargs='*', help='Names of films to process, defaults to the whole corpus.' )
+    parser.add_argument( '--metrics', help='Comma separated metrics to compute, defaults to: %s' % ( ', '.join( sorted( [ x for x in metrics if metrics[x]['default'] ] ) ) ) )
+    parser.add_argument( '--force', action='store_true', help='Recompute the metrics even if their cached results are current.' )
+    parser.add_argument( '--processes', type=int, default=None, help='Number of worker processes, defaults to the number of cores.' )
+    parser.add_argument( '--list', action='store_true', help='List the metrics and the fields they write, and exit.' )
+    args = parser.parse_args()
+
+    if args.list:
+        for metric in sorted( metrics ):
+            print "%s%s: %s" % ( metric, '' if metrics[metric]['default'] else ' (not default)', ', '.join( metrics[metric]['fields'] ) )
+        sys.exit( 0 )
 
-for script in scripts:
-    process_script( script )
+    films = corpus.scripts
+    if args.films:
+        films = [ x for x in corpus.scripts if x[0] in args.films ]
+        unknown = set( args.films ) - set( [ x[0] for x in films ] )
+        if unknown:
+            raise Exception( "Unknown films: %s" % ( ', '.join( sorted( unknown ) ) ) )
+
+    metric_names = None
+    if args.metrics:
+        metric_names = args.metrics.split( ',' )
+        unknown = set( metric_names ) - set( metrics )
+        if unknown:
+            raise Exception( "Unknown metrics: %s" % ( ', '.join( sorted( unknown ) ) ) )
+
+    start = time.time()
+    failed = []
+
+    for ( name, elapsed, error ) in process_scripts( films, metric_names, args.force, args.processes ):
+        if error is None:
+            print "%s took %0.02f seconds" % ( name, elapsed )
+        else:
+            print "%s failed after %0.02f seconds:\n%s" % ( name, elapsed, error )
+            failed.append( name )
 
+    print "Computed metrics for %d of %d films in %0.02f seconds" % ( len( films ) - len( failed ), len( films ), time.time() - start )
+    if failed:
+        print "Failed:", ', '.join( sorted( failed ) )
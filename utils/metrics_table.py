@@ -0,0 +1,245 @@
+#!/usr/bin/python
+
+'''Keeps the metrics of every film in one SQLite table, so the
+distances and Mapper code can read the whole corpus in one query
+rather than walking the parsed directories for each film's
+_metrics.json.
+
+metrics.py updates a film's row each time it writes the film's metrics
+file, from the parent process only when films are processed by a pool
+of workers.  Each row of the films table holds the film's metrics as
+JSON and a REAL column for each of the features below, the numeric
+values distances-new3.py compares films by, so the features of the
+corpus can be queried without decoding any JSON.
+
+connection = connect()                 # ../example-scripts/parsed/metrics.sqlite by default
+update_film( connection, 'Alien', metrics )
+movies = get_metrics( connection )     # Keyed on title, the metrics of each film
+( titles, matrix ) = get_feature_matrix( connection, columns=[ 'hearing', 'percent_dialog' ] )
+     # A films by columns array of floats, NaN where a film lacks the
+     # field, with rows in the order of titles.
+export_csv( connection, 'metrics.csv' )
+
+Usage, from the utils directory:
+
+    ./metrics_table.py --sync              # Add any _metrics.json newer than the film's row
+    ./metrics_table.py --csv metrics.csv
+'''
+
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import time
+
+import numpy
+
+from tsl.utils import corpus
+
+parsed_dir = '../example-scripts/parsed'
+table_file = parsed_dir + '/metrics.sqlite'
+
+def scalar_feature( field ):
+    return { 'column' : field, 'field' : field, 'value' : lambda x: x }
+
+def entry_features( field, n, key=None ):
+    '''Return a feature for each of the first n entries of the list
+    valued field, or of the key of each entry if given.  Like the five
+    vector distances of distances-new3.py entries past the end of the
+    list are 0.'''
+
+    def get_entry( i ):
+        def value( x ):
+            if i >= len( x ):
+                return 0
+            elif key is None:
+                return x[i]
+            else:
+                return x[i][key]
+        return value
+
+    return [ { 'column' : "%s_%d" % ( field, i + 1 ), 'field' : field, 'value' : get_entry( i ) } for i in range( n ) ]
+
+# Each feature is a column of the films table, of the feature matrix
+# and of the exported CSV:
+#
+# column - name of the column
+# field - the metrics field it is computed from
+# value - function of the field's value returning the column's value
+#
+# Changing these rebuilds the films table from the stored metrics the
+# next time the table is opened.
+features = [ scalar_feature( x ) for x in [
+        'named_characters',
+        'distinct_locations',
+        'location_changes',
+        'percent_dialog',
+        'distinct_words',
+        'dramatic_units',
+        'adj-adv_noun-verb_ratio',
+        'supporting_characters',
+        'hearing',
+        'scene_dialog_score',
+        'recurring_words',
+        'words_with_15_page_gaps',
+        'words_with_30_page_gaps',
+        'rt',
+        ] ]
+features += entry_features( 'character_x_speakers', 5, 'speakers' )
+features += entry_features( 'scenes_percentage_for_characters', 5, 'percentage_of_scenes' )
+features += entry_features( 'percent_dialog_by_character', 5, 'percent_dialog' )
+features += entry_features( 'dialog_words_score', 2 )
+
+feature_columns = [ x['column'] for x in features ]
+
+film_columns = [ 'title', 'name', 'updated', 'metrics' ] + feature_columns
+
+def quote( column ):
+    return '"%s"' % ( column )
+
+def connect( filename=table_file ):
+    '''Return a connection to the metrics table in filename, creating
+    it, or rebuilding it if the features have changed, if need be.
+    Each statement commits as it runs, and writers from several
+    processes wait on each other rather than failing.'''
+
+    connection = sqlite3.connect( filename, timeout=60, isolation_level=None )
+
+    # The check and any rebuild are one transaction, so a process
+    # opening the table meanwhile waits and then finds it current.
+    connection.execute( 'BEGIN IMMEDIATE' )
+    try:
+        columns = [ x[1] for x in connection.execute( 'PRAGMA table_info( films )' ) ]
+        if columns != film_columns:
+            rebuild_films( connection, columns )
+        connection.execute( 'COMMIT' )
+    except:
+        connection.execute( 'ROLLBACK' )
+        raise
+
+    return connection
+
+def rebuild_films( connection, columns ):
+    '''Recreate the films table with the current feature columns,
+    recomputing the features of any films already in it.'''
+
+    rows = []
+    if columns:
+        rows = connection.execute( 'SELECT title, name, updated, metrics FROM films' ).fetchall()
+
+    connection.execute( 'DROP TABLE IF EXISTS films' )
+    # Where older tables kept the features.
+    connection.execute( 'DROP TABLE IF EXISTS features' )
+    connection.execute( 'CREATE TABLE films ( title TEXT PRIMARY KEY, name TEXT, updated REAL, metrics TEXT, %s )' % ( ', '.join( [ quote( x ) + ' REAL' for x in feature_columns ] ) ) )
+
+    for ( title, name, updated, metrics ) in rows:
+        write_film( connection, title, name, updated, json.loads( metrics ) )
+
+def get_feature_row( metrics ):
+    '''Return the value of each feature from metrics, None for those
+    whose field metrics lacks.'''
+    return [ x['value']( metrics[x['field']] ) if x['field'] in metrics else None for x in features ]
+
+def write_film( connection, title, name, updated, metrics ):
+    connection.execute( 'INSERT OR REPLACE INTO films VALUES ( %s )' % ( ', '.join( [ '?' ] * len( film_columns ) ) ),
+                        [ title, name, updated, json.dumps( metrics, sort_keys=True ) ] + get_feature_row( metrics ) )
+
+def update_film( connection, name, metrics, updated=None ):
+    '''Replace the row of the film called name with metrics, keyed on
+    its title.'''
+
+    if updated is None:
+        updated = time.time()
+
+    write_film( connection, metrics.get( 'title', name ), name, updated, metrics )
+
+def sync_files( connection, movies_dir=parsed_dir ):
+    '''Update the row of each film with a _metrics.json in movies_dir
+    modified since its row was, returning the titles updated.  As
+    metrics.py does the rows are named for the film in the corpus,
+    or for its directory if it isn't in the corpus.'''
+
+    updated = dict( connection.execute( 'SELECT title, updated FROM films' ).fetchall() )
+
+    names = dict( [ ( re.sub( r'\s+', '_', x[0].lower() ), x[0] ) for x in corpus.scripts ] )
+
+    result = []
+
+    for directory in sorted( os.listdir( movies_dir ) ):
+        filename = "%s/%s/%s_metrics.json" % ( movies_dir, directory, directory )
+        if not os.path.exists( filename ):
+            continue
+
+        modified = os.path.getmtime( filename )
+        f = open( filename, 'r' )
+        metrics = json.load( f )
+        f.close()
+
+        title = metrics.get( 'title', directory )
+        if updated.get( title, -1 ) < modified:
+            update_film( connection, names.get( directory, directory ), metrics, modified )
+            result.append( title )
+
+    return result
+
+def get_metrics( connection, titles=None ):
+    '''Return a dictionary keyed on title of the metrics of each film,
+    or of only those in titles.'''
+
+    result = {}
+    for ( title, metrics ) in connection.execute( 'SELECT title, metrics FROM films' ):
+        if titles is None or title in titles:
+            result[title] = json.loads( metrics )
+    return result
+
+def get_feature_matrix( connection, columns=None, titles=None ):
+    '''Return the list of titles in order and a titles by columns array
+    of the features of each film, by default every feature.'''
+
+    if columns is None:
+        columns = feature_columns
+
+    for column in columns:
+        if column not in feature_columns:
+            raise Exception( "Unknown feature %s, expected one of %s" % ( column, ', '.join( feature_columns ) ) )
+
+    rows = connection.execute( 'SELECT title, %s FROM films ORDER BY title' % ( ', '.join( [ quote( x ) for x in columns ] ) ) ).fetchall()
+    if titles is not None:
+        rows = [ x for x in rows if x[0] in titles ]
+
+    # None becomes NaN.
+    matrix = numpy.array( [ x[1:] for x in rows ], dtype=float ).reshape( len( rows ), len( columns ) )
+
+    return ( [ x[0] for x in rows ], matrix )
+
+def export_csv( connection, filename ):
+    '''Write the features of every film to filename with a header
+    row, leaving a feature empty where a film lacks its field.'''
+
+    f = open( filename, 'wb' )
+    writer = csv.writer( f )
+    writer.writerow( [ 'title' ] + feature_columns )
+    for row in connection.execute( 'SELECT title, %s FROM films ORDER BY title' % ( ', '.join( [ quote( x ) for x in feature_columns ] ) ) ):
+        writer.writerow( [ row[0].encode( 'utf-8' ) ] + [ '' if x is None else repr( x ) for x in row[1:] ] )
+    f.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Maintain and export the corpus metrics table.' )
+    parser.add_argument( '--table', default=table_file, help='The SQLite file of the table, defaults to %s.' % ( table_file ) )
+    parser.add_argument( '--sync', action='store_true', help='Add the metrics files of films modified since their rows were.' )
+    parser.add_argument( '--csv', help='Write the features of every film to this CSV file.' )
+    args = parser.parse_args()
+
+    connection = connect( args.table )
+
+    if args.sync:
+        titles = sync_files( connection, os.path.dirname( args.table ) or '.' )
+        print "Updated %d films: %s" % ( len( titles ), ', '.join( titles ) )
+
+    if args.csv:
+        export_csv( connection, args.csv )
+        print "Wrote %s" % ( args.csv )
+
+    connection.close()
@@ -1,18 +1,73 @@
 #!/usr/bin/env python
 
+import argparse
+import heapq
+import numpy
 import re
 
 import tsl.script.Presences
-import tsl.script.Script
-import tsl.script.Structure
+import tsl.script.Scenes
 
-scripts = [
-    #( 'The Big Lebowski', '../example-scripts/the_big_lebowski.txt' ),
-    #( 'Chinatown', '../example-scripts/chinatown.txt' ),
-    #( 'Dune', '../example-scripts/dune.txt' ),
-    ( 'Ghostbusters', '../example-scripts/ghostbusters.txt' ),
-    #( 'The Matrix', '../example-scripts/the_matrix.txt' ),
-    ]
+from tsl.script.parse.const import CHARACTER, LOCATION
+from tsl.utils.corpus import scripts
+
+class DramaticUnits( object ):
+    '''The dramatic units of get_dramatic_unit_partitions for any
+    coefficient.
+
+    Whether a new dramatic unit starts at a scene with characters
+    depends only on the overlap of its characters with those of the
+    last scene with characters before it, so we compute that overlap
+    once for each such scene and a coefficient c merely selects the
+    scenes whose overlap is below c.
+
+    units = DramaticUnits( Presences.presence_sn )
+    units.get_partitions( 0.5 )            # As get_dramatic_unit_partitions( presence_sn, 0.5 )
+    units.count( 0.5 )                     # len( units.get_partitions( 0.5 ) )
+    units.counts( [ 0.01, 0.25, 0.5, 1 ] ) # An array of the count at each coefficient
+    '''
+
+    def __init__( self, presence ):
+        self.scene_ids = sorted( presence.keys(), key=int )
+
+        # The index in scene_ids of each scene with characters, and the
+        # common over total characters of it and the last such scene.
+        starts = []
+        scores = []
+
+        prior_chars = set()
+
+        for ( i, scene ) in enumerate( self.scene_ids ):
+            current_chars = set( [ x[0] for x in presence[scene].items() if x[1][0]['noun_type'] == "CHARACTER" ] )
+
+            if len( current_chars ):
+                total_chars = len( current_chars | prior_chars )
+                common_chars = len( current_chars & prior_chars )
+
+                starts.append( i )
+                scores.append( common_chars / float( total_chars ) )
+
+                prior_chars = current_chars
+
+        self.starts = numpy.array( starts, dtype=int )
+        self.scores = numpy.array( scores, dtype=float )
+        self.sorted_scores = numpy.sort( self.scores )
+
+    def get_partitions( self, c ):
+        '''Return the dramatic units at coefficient c as
+        get_dramatic_unit_partitions does.'''
+
+        # The scenes before the first new unit aren't in any unit.
+        starts = list( self.starts[ self.scores < c ] )
+        ends = starts[1:] + [ len( self.scene_ids ) ]
+
+        return [ self.scene_ids[start:end] for ( start, end ) in zip( starts, ends ) ]
+
+    def count( self, c ):
+        return int( numpy.searchsorted( self.sorted_scores, c, side='left' ) )
+
+    def counts( self, coefficients ):
+        return numpy.searchsorted( self.sorted_scores, coefficients, side='left' )
 
 def get_dramatic_unit_partitions( presence, c ):
     '''A dramatic unit is a consecutive sequence of scenes where c
@@ -23,82 +78,215 @@ def get_dramatic_unit_partitions( presence, c ):
     Returns an array of arrays.  The elements of the outer array
     are the dramatic units, the elements of the inner array are the
     scenes numbers of the sceens within those dramatic units.
+
+    To find the units at several coefficients use DramaticUnits, which
+    computes the overlap of each pair of scenes only once.
+    '''
+    return DramaticUnits( presence ).get_partitions( c )
+
+def get_scene_profiles( presence, noun_type ):
+    '''Return, for each scene of presence in order, a dictionary with
+    a value of 1 for each name of noun_type present in the scene.'''
+    return [ dict( [ ( x[0], 1.0 ) for x in presence[scene].items() if x[1][0]['noun_type'] == noun_type ] ) for scene in sorted( presence.keys(), key=int ) ]
+
+def profile_similarity( a, b ):
+    '''The sum of the minimum over the sum of the maximum weight of
+    each name in either profile, the Jaccard index of their names
+    for profiles of single scenes.'''
+    maxima = 0.0
+    minima = 0.0
+    for name in set( a ) | set( b ):
+        maxima += max( a.get( name, 0 ), b.get( name, 0 ) )
+        minima += min( a.get( name, 0 ), b.get( name, 0 ) )
+    return minima / maxima
+
+def merge_profiles( a, a_size, b, b_size ):
+    result = {}
+    for name in set( a ) | set( b ):
+        result[name] = ( a.get( name, 0 ) * a_size + b.get( name, 0 ) * b_size ) / float( a_size + b_size )
+    return result
+
+class SceneHierarchy( object ):
+    '''A hierarchical segmentation of a script into runs of
+    consecutive scenes, from single scenes up to the whole script.
+
+    Starting from single scenes we repeatedly merge the two adjacent
+    segments which are closest, until one segment is left.  A segment
+    has a profile of the fraction of its scenes each character and each
+    location is present in, and the distance between two segments is 1
+    minus the weighted mean of the similarity of their character and
+    of their location profiles, taking only the kinds of name both
+    segments have.  As in Ward's method the distance is scaled by
+    2 * a * b / ( a + b ) for segments of a and b scenes, so runs of
+    short segments are merged before long ones and the top levels are
+    of comparable lengths.  Only adjacent segments are ever compared,
+    so with a heap of the distances between neighbours the whole
+    hierarchy takes O( n log n ) for n scenes.
+
+    Any level is then read off the order of the merges without
+    recomputation, by number of segments or by distance:
+
+    hierarchy = SceneHierarchy( Presences.presence_sn )
+    hierarchy.get_segments( 3 )          # Scene ids of 3 segments, say acts
+    hierarchy.get_segments_at( 2 )       # Segments once every merge at distance 2 or less is made
+    hierarchy.count( 2 )                 # len( hierarchy.get_segments_at( 2 ) )
+    hierarchy.counts( [ 1, 2, 4, 8 ] )
+    hierarchy.linkage
+         # The dendrogram as a linkage matrix for
+         # scipy.cluster.hierarchy, with leaves in scene order.
+
+    Distances of the merges can fall as well as rise, so the heights
+    of the dendrogram are the greatest distance of any merge so far.
     '''
-    prior_chars = set()
-    current_chars = set()
 
-    partitions = []
-    scenes = []
+    def __init__( self, presence, location_weight=0.5 ):
+        self.scene_ids = sorted( presence.keys(), key=int )
+        self.location_weight = location_weight
 
-    for scene in sorted( presence.keys(), key=int ):
-        '''If he current set is empty, don't change definition of
-        prior, include this in set.'''
+        n = len( self.scene_ids )
 
-        current_chars = set( [ x[0] for x in presence[scene].items() if x[1][0]['noun_type'] == "CHARACTER" ] )
+        characters = get_scene_profiles( presence, CHARACTER )
+        locations = get_scene_profiles( presence, LOCATION )
 
-        if len( current_chars ) == 0:
-            #print "Working on %s" % scene
-            #print current_chars
-            scenes.append( scene )
+        # Segments are identified by the index of their first scene.
+        sizes = [ 1 ] * n
+        previous = range( -1, n - 1 )
+        following = range( 1, n + 1 )
+        versions = [ 0 ] * n
+        nodes = range( n )
+
+        def get_distance( a, b ):
+            return self.get_distance( characters[a], locations[a], characters[b], locations[b] ) * 2.0 * sizes[a] * sizes[b] / ( sizes[a] + sizes[b] )
+
+        heap = [ ( get_distance( i - 1, i ), i - 1, i, 0, 0 ) for i in range( 1, n ) ]
+        heapq.heapify( heap )
+
+        linkage = []
+        distances = []
+
+        # The index of the merge which joins scene i to the scene
+        # before it, n - 1 for the first scene which is never joined.
+        self.merge_order = numpy.zeros( n, dtype=int )
+        if n:
+            self.merge_order[0] = n - 1
+
+        while heap:
+            ( distance, a, b, a_version, b_version ) = heapq.heappop( heap )
+
+            if versions[a] != a_version or versions[b] != b_version or sizes[a] == 0 or sizes[b] == 0:
+                continue
+
+            self.merge_order[b] = len( distances )
+            distances.append( distance )
+            linkage.append( [ nodes[a], nodes[b], distance, sizes[a] + sizes[b] ] )
+
+            characters[a] = merge_profiles( characters[a], sizes[a], characters[b], sizes[b] )
+            locations[a] = merge_profiles( locations[a], sizes[a], locations[b], sizes[b] )
+            sizes[a] += sizes[b]
+            sizes[b] = 0
+            versions[a] += 1
+            nodes[a] = n + len( linkage ) - 1
+
+            following[a] = following[b]
+            if following[a] < n:
+                previous[following[a]] = a
+                heapq.heappush( heap, ( get_distance( a, following[a] ), a, following[a], versions[a], versions[following[a]] ) )
+            if previous[a] >= 0:
+                heapq.heappush( heap, ( get_distance( previous[a], a ), previous[a], a, versions[previous[a]], versions[a] ) )
+
+        self.distances = numpy.array( distances, dtype=float )
+        self.heights = numpy.maximum.accumulate( self.distances ) if len( distances ) else self.distances
+
+        self.linkage = numpy.array( linkage, dtype=float ).reshape( len( linkage ), 4 )
+        self.linkage[:, 2] = self.heights
+
+    def get_distance( self, a_characters, a_locations, b_characters, b_locations ):
+        weights = 0.0
+        similarity = 0.0
+        for ( a, b, weight ) in [ ( a_characters, b_characters, 1 - self.location_weight ), ( a_locations, b_locations, self.location_weight ) ]:
+            if len( a ) and len( b ):
+                weights += weight
+                similarity += weight * profile_similarity( a, b )
+
+        if weights == 0:
+            # Nothing tells the segments apart.
+            return 0.0
         else:
-            total_chars = len( current_chars | prior_chars )
-            common_chars = len( current_chars & prior_chars )
-
-            #print "Working on %s" % scene
-            #print current_chars
-            #print "There are %s current, %s prior, %s total, %s common characters." % ( len( current_chars ), len( prior_chars ), total_chars, common_chars )
-        
-            if total_chars == 0 or common_chars / float( total_chars ) >= c:
-                scenes.append( scene )
-            else:
-                partitions.append( scenes )
-                scenes = [ scene ]
-
-            prior_chars = current_chars
-        
-    partitions.append( scenes )
-
-    return partitions[1:]
-
-def print_script( structure, text, name, partitions, c ):
+            return 1 - similarity / weights
+
+    def get_segments( self, count ):
+        '''Return the scene ids of each of count segments, the last
+        count segments before all were merged into one.'''
+
+        count = max( 1, min( count, len( self.scene_ids ) ) )
+
+        starts = list( numpy.flatnonzero( self.merge_order >= len( self.scene_ids ) - count ) )
+        ends = starts[1:] + [ len( self.scene_ids ) ]
+
+        return [ self.scene_ids[start:end] for ( start, end ) in zip( starts, ends ) ]
+
+    def count( self, distance ):
+        return len( self.scene_ids ) - int( numpy.searchsorted( self.heights, distance, side='right' ) )
+
+    def counts( self, distances ):
+        return len( self.scene_ids ) - numpy.searchsorted( self.heights, distances, side='right' )
+
+    def get_segments_at( self, distance ):
+        return self.get_segments( self.count( distance ) )
+
+def print_script( Scenes, name, partitions, c ):
+    '''Write the lines of each partition of consecutive scenes, reading
+    only the scenes of one partition at a time from Scenes.'''
     with open( '/wintmp/script-partitions/%s-%s.txt' % ( name, c ), 'wb' ) as outfile:
         for idx, p in enumerate( partitions ):
             outfile.write( "=============================== PARTITION %03d ===============================\n" % idx )
+            scenes = Scenes.load_scenes( p[0], p[-1] )
             for s in p:
-                first_line = structure['scenes'][s]['first_line']
-                last_line = structure['scenes'][s]['last_line']
-                for line in text[ int( first_line )-1 : int( last_line )-2 ]:
+                # All but the last two lines of the scene.
+                for line in scenes[s]['script_lines'][:-2]:
                     outfile.write( line['content'] )
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Print the dramatic units and scene hierarchy of the films of the corpus.' )
+    parser.add_argument( 'films', nargs='*', help='Names of films to process, defaults to the whole corpus.' )
+    args = parser.parse_args()
+
+    films = scripts
+    if args.films:
+        films = [ x for x in scripts if x[0] in args.films ]
+        unknown = set( args.films ) - set( [ x[0] for x in films ] )
+        if unknown:
+            raise Exception( "Unknown films: %s" % ( ', '.join( sorted( unknown ) ) ) )
 
     coefs = [ 0.01, 0.25 , 0.5, 1 ]
 
-    for film in scripts:
+    for film in films:
         name = film[0]
     
         outdir = '../example-scripts/parsed/' + re.sub( r'\s+', '_', name.lower() )
 
-        Script = tsl.script.Script.Script( name, outdir )
-        Script.load()
-
-        Structure = tsl.script.Structure.Structure( name, outdir )
-        Structure.load()
+        Scenes = tsl.script.Scenes.Scenes( name, outdir )
+        Scenes.load()
 
         Presences = tsl.script.Presences.Presences( name, outdir )
         Presences.load()
 
         presence_sn = Presences.presence_sn
-        structure = Structure.structure
-        text = Script.script_lines
 
         print "%s has %s scenes" % ( name, len( presence_sn.keys() ) )
 
+        units = DramaticUnits( presence_sn )
+
         for c in coefs:
-            partitions = get_dramatic_unit_partitions( presence_sn, c )
+            partitions = units.get_partitions( c )
             print "For coefficient %s there were %s dramatic units in %s" % ( c, len( partitions ), name )
             print "Partitions were:", partitions
 
-            #print_script( structure, text, name, partitions, c )
+            #print_script( Scenes, name, partitions, c )
+
+
 
+        hierarchy = SceneHierarchy( presence_sn )
 
+        for count in [ 3, 8 ]:
+            print "The top %s segments of the scene hierarchy were:" % ( count ), hierarchy.get_segments( count )
@@ -0,0 +1,326 @@
+#!/usr/bin/python
+
+'''Runs the parse, reports, metrics and distances stages over the
+corpus, re-running only the stages which are stale.
+
+The stages form a dependency graph:
+
+    parse -> reports
+    parse -> metrics -> distances
+    parse -> annotate -> metrics
+
+Parse, annotate, reports and metrics run once per film, distances runs once
+over the corpus metrics table.  Each run of a stage is keyed on a SHA1 of
+the contents of its input files and of the source code of the stage,
+distances on the metrics in the table rather than the bytes of its
+file, which change whenever a film's row is rewritten, and the keys of the last successful runs are kept in a manifest under
+the parsed directory.  A stage is run again only when its key changes
+or its outputs are missing, so editing one script re-runs that film's
+stages and then distances, while editing metrics.py re-runs metrics
+for every film and then distances.
+
+Usage, from the utils directory:
+
+    ./pipeline.py                      # Bring everything up to date
+    ./pipeline.py Ghostbusters Dune    # Only these films, plus distances
+    ./pipeline.py --stages parse,metrics
+    ./pipeline.py --force metrics      # Run metrics whether stale or not
+'''
+
+import argparse
+import hashlib
+import imp
+import json
+import os
+import re
+import time
+
+import tsl.script.Script
+
+from tsl.utils import metrics_table
+from tsl.utils.corpus import scripts
+
+parsed_dir = '../example-scripts/parsed'
+manifest_file = parsed_dir + '/pipeline_manifest.json'
+metrics_table_file = parsed_dir + '/metrics.sqlite'
+
+# The library code every per film stage runs through.
+library_code = [ '../script' ]
+
+# Parsed outputs the downstream stages read, interaction_ns and
+# interaction_sn are derived from interactions so aren't inputs.
+parsed_outputs = [ 'script_lines', 'structure', 'presences', 'presence_sn', 'presence_ns', 'interactions' ]
+
+def get_outdir( film ):
+    return parsed_dir + '/' + re.sub( r'\s+', '_', film[0].lower() )
+
+def get_parsed_files( film ):
+    outdir = get_outdir( film )
+    fname = re.sub( r'\s+', '_', film[0].lower() )
+    return [ tsl.script.Script.find_output_file( "%s/%s_%s" % ( outdir, fname, output ) ) for output in parsed_outputs ]
+
+def get_annotations_file( film ):
+    fname = re.sub( r'\s+', '_', film[0].lower() )
+    return tsl.script.Script.find_output_file( "%s/%s_annotations" % ( get_outdir( film ), fname ) )
+
+def get_structure_file( film ):
+    fname = re.sub( r'\s+', '_', film[0].lower() )
+    return tsl.script.Script.find_output_file( "%s/%s_structure" % ( get_outdir( film ), fname ) )
+
+def get_metrics_file( film ):
+    fname = re.sub( r'\s+', '_', film[0].lower() )
+    return "%s/%s_metrics.json" % ( get_outdir( film ), fname )
+
+# Utility scripts already imported by load_utility, keyed on filename.
+utilities = {}
+
+def load_utility( filename ):
+    '''Import one of the utility scripts by filename, which also covers
+    those like distances-new3.py that can't be imported by name.'''
+    if filename not in utilities:
+        name = re.sub( r'\W', '_', os.path.splitext( filename )[0] )
+        utilities[filename] = imp.load_source( name, filename )
+    return utilities[filename]
+
+def get_metrics_table_contents( film ):
+    '''Return the metrics of every film in the metrics table as JSON
+    in a canonical order, or nothing if there is no table yet.'''
+
+    if not os.path.exists( metrics_table_file ):
+        return ''
+
+    connection = metrics_table.connect( metrics_table_file )
+    contents = json.dumps( metrics_table.get_metrics( connection ), sort_keys=True )
+    connection.close()
+
+    return contents
+
+def run_parse( film ):
+    load_utility( 'parse_scripts.py' ).process_script( film )
+
+def run_annotate( film ):
+    load_utility( 'annotate_scripts.py' ).process_script( film )
+
+def run_reports( film ):
+    load_utility( 'generate_reports.py' ).process_script( film )
+
+def run_metrics( film ):
+    load_utility( 'metrics.py' ).process_script( film )
+
+def run_distances( film ):
+    load_utility( 'distances-new3.py' ).main( parsed_dir )
+
+# Each stage has:
+#
+# depends - stages which must be brought up to date first
+# per_film - True if run for each film, otherwise run once for the corpus
+# code - source files and directories whose contents version the stage
+# inputs - function of film returning the input files of the stage
+# contents - optional function of film returning a string of any other
+#       inputs of the stage
+# outputs - function of film returning files the stage must leave behind
+# run - function of film which runs the stage, film is None for
+#       corpus stages
+stages = {
+    'parse' : {
+        'depends'  : [],
+        'per_film' : True,
+        'code'     : [ 'parse_scripts.py' ] + library_code,
+        'inputs'   : lambda film: [ film[1] ],
+        'outputs'  : get_parsed_files,
+        'run'      : run_parse,
+        },
+    'annotate' : {
+        'depends'  : [ 'parse' ],
+        'per_film' : True,
+        'code'     : [ 'annotate_scripts.py' ] + library_code,
+        'inputs'   : lambda film: [ film[1], get_structure_file( film ) ],
+        'outputs'  : lambda film: [ get_annotations_file( film ) ],
+        'run'      : run_annotate,
+        },
+    'reports' : {
+        'depends'  : [ 'parse' ],
+        'per_film' : True,
+        'code'     : [ 'generate_reports.py' ] + library_code,
+        'inputs'   : get_parsed_files,
+        'outputs'  : lambda film: [ get_outdir( film ) + '/presence.csv' ],
+        'run'      : run_reports,
+        },
+    'metrics' : {
+        'depends'  : [ 'parse', 'annotate' ],
+        'per_film' : True,
+        'code'     : [ 'metrics.py', 'metrics_table.py', 'partition.py' ] + library_code,
+        'inputs'   : lambda film: [ film[1], get_annotations_file( film ) ] + get_parsed_files( film ),
+        'outputs'  : lambda film: [ get_metrics_file( film ), metrics_table_file ],
+        'run'      : run_metrics,
+        },
+    'distances' : {
+        'depends'  : [ 'metrics' ],
+        'per_film' : False,
+        'code'     : [ 'distances-new3.py', 'metrics_table.py' ],
+        'inputs'   : lambda film: [],
+        'contents' : get_metrics_table_contents,
+        'outputs'  : lambda film: [],
+        'run'      : run_distances,
+        },
+    }
+
+def get_stage_order( stage_names ):
+    '''Return stage_names in an order where every stage follows the
+    stages it depends on.'''
+
+    result = []
+    visiting = {}
+
+    def visit( name ):
+        if name in result:
+            return
+        if name in visiting:
+            raise Exception( "Cycle in pipeline stages at %s" % ( name ) )
+        visiting[name] = True
+        for dependency in stages[name]['depends']:
+            if dependency in stage_names:
+                visit( dependency )
+        result.append( name )
+
+    for name in sorted( stage_names ):
+        visit( name )
+
+    return result
+
+def get_files( paths ):
+    '''Expand any directories in paths to the Python source files
+    beneath them.'''
+
+    result = []
+
+    for path in paths:
+        if os.path.isdir( path ):
+            for ( dirpath, dirnames, filenames ) in os.walk( path ):
+                result += [ os.path.join( dirpath, x ) for x in filenames if x.endswith( '.py' ) ]
+        else:
+            result.append( path )
+
+    return sorted( result )
+
+def hash_files( paths, digest=None ):
+    '''Fold the names and contents of paths into digest, missing files
+    contribute only their name.'''
+
+    if digest is None:
+        digest = hashlib.sha1()
+
+    for path in paths:
+        digest.update( path )
+        if os.path.exists( path ):
+            f = open( path, 'rb' )
+            for block in iter( lambda: f.read( 1 << 20 ), '' ):
+                digest.update( block )
+            f.close()
+
+    return digest
+
+def get_key( stage, film, code_hashes ):
+    digest = hashlib.sha1( code_hashes[stage] )
+    hash_files( stages[stage]['inputs']( film ), digest )
+    if 'contents' in stages[stage]:
+        digest.update( stages[stage]['contents']( film ) )
+    return digest.hexdigest()
+
+def load_manifest():
+    if os.path.exists( manifest_file ):
+        f = open( manifest_file, 'r' )
+        manifest = json.load( f )
+        f.close()
+        return manifest
+    else:
+        return {}
+
+def save_manifest( manifest ):
+    if not os.path.isdir( parsed_dir ):
+        os.makedirs( parsed_dir )
+
+    # Write to the side and rename so an interrupted run never leaves
+    # a truncated manifest behind.
+    f = open( manifest_file + '.tmp', 'w' )
+    json.dump( manifest, f, sort_keys=True, indent=4 )
+    f.close()
+    os.rename( manifest_file + '.tmp', manifest_file )
+
+def run_pipeline( films, stage_names=None, force=[] ):
+    '''Bring stage_names, by default all stages, up to date for films.
+    Stages named in force run regardless of their keys.  Returns a
+    list of ( stage, film name, seconds ) for the stages which ran.'''
+
+    if stage_names is None:
+        stage_names = stages.keys()
+
+    code_hashes = {}
+    for stage in stages:
+        code_hashes[stage] = hash_files( get_files( stages[stage]['code'] ) ).hexdigest()
+
+    manifest = load_manifest()
+
+    ran = []
+
+    for stage in get_stage_order( stage_names ):
+        if stages[stage]['per_film']:
+            targets = films
+        else:
+            targets = [ None ]
+
+        for film in targets:
+            if film is None:
+                target = '*'
+            else:
+                target = film[0]
+
+            key = get_key( stage, film, code_hashes )
+            missing = [ x for x in stages[stage]['outputs']( film ) if not os.path.exists( x ) ]
+
+            if stage not in force and not missing and manifest.get( stage, {} ).get( target ) == key:
+                continue
+
+            print "Running %s for %s" % ( stage, target )
+
+            start = time.time()
+            stages[stage]['run']( film )
+            elapsed = time.time() - start
+
+            ran.append( ( stage, target, elapsed ) )
+
+            # Saved after every run so an interrupted pipeline picks up
+            # where it left off.
+            if stage not in manifest:
+                manifest[stage] = {}
+            manifest[stage][target] = key
+            save_manifest( manifest )
+
+    return ran
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Run the stale stages of the script processing pipeline.' )
+    parser.add_argument( 'films', nargs='*', help='Names of films to process, defaults to the whole corpus.' )
+    parser.add_argument( '--stages', help='Comma separated stages to bring up to date, defaults to all of: %s' % ( ', '.join( sorted( stages ) ) ) )
+    parser.add_argument( '--force', default='', help='Comma separated stages to run even if they are up to date.' )
+    args = parser.parse_args()
+
+    films = scripts
+    if args.films:
+        films = [ x for x in scripts if x[0] in args.films ]
+        unknown = set( args.films ) - set( [ x[0] for x in films ] )
+        if unknown:
+            raise Exception( "Unknown films: %s" % ( ', '.join( sorted( unknown ) ) ) )
+
+    stage_names = None
+    if args.stages:
+        stage_names = args.stages.split( ',' )
+
+    force = [ x for x in args.force.split( ',' ) if x ]
+
+    for name in ( stage_names or [] ) + force:
+        if name not in stages:
+            raise Exception( "Unknown stage: %s" % ( name ) )
+
+    for ( stage, target, elapsed ) in run_pipeline( films, stage_names, force ):
+        print "%s for %s took %0.02f seconds" % ( stage, target, elapsed )
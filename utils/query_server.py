@@ -0,0 +1,234 @@
+#!/usr/bin/python
+
+'''Serves queries over the parsed corpus as JSON over HTTP from one
+long running process, so the parsed outputs are read once rather than
+by every analysis.
+
+Every film's Structure, Presences and Interactions are loaded when the
+server starts and kept in memory along with a cache of report
+results.  Requests are handled one at a time in a single thread, so
+no locking is needed around the shared data.
+
+Usage, from the utils directory:
+
+    ./query_server.py                        # Every film, on port 8765
+    ./query_server.py --port 9000 Ghostbusters Dune
+
+Queries are GET requests, list arguments are comma separated and pair
+types are joined with a colon:
+
+    /films
+    /top_presences?film=Chinatown&top_n=5&noun_types=CHARACTER
+    /top_interactions?film=Chinatown&top_n=5&noun_types=CHARACTER:CHARACTER&interaction_types=DISCUSS
+    /singletons?film=Chinatown
+    /scenes?film=Chinatown&first=40&last=75
+
+top_presences and top_interactions take the options of the functions
+of the same name in tsl.script.reports.reports.  scenes returns the
+script lines, structure and presence_sn of each scene in the range,
+keyed on scene_id as tsl.script.Scenes.load_scenes does.  Errors are
+returned as { "error" : message } with a 400, 404 or 500 status.
+'''
+
+import argparse
+import BaseHTTPServer
+import json
+import re
+import time
+import traceback
+import urlparse
+
+import tsl.script.Interactions
+import tsl.script.Presences
+import tsl.script.Script
+import tsl.script.Structure
+
+from tsl.script.reports.cache import ReportCache
+from tsl.script.reports.reports import get_singletons, PRESENCE_REPORT_DEFAULTS, INTERACTION_REPORT_DEFAULTS
+from tsl.utils.corpus import scripts
+
+parsed_dir = '../example-scripts/parsed'
+
+# Keyed on film name, the loaded data of each film.
+films = {}
+
+cache = ReportCache( max_entries=4096 )
+
+# How each query argument is parsed, arguments not listed here are
+# passed through as strings.
+int_arguments = [ 'top_n', 'min_appearances', 'min_interactions', 'first', 'last' ]
+list_arguments = [ 'noun_types', 'presence_types', 'scene_list', 'interaction_types', 'names' ]
+pair_arguments = { 'top_interactions' : [ 'noun_types', 'presence_types' ] }
+
+def load_film( name ):
+    outdir = parsed_dir + '/' + re.sub( r'\s+', '_', name.lower() )
+
+    film = {}
+    for ( key, cls, outputs ) in [ ( 'Script', tsl.script.Script.Script, [ 'script_lines' ] ),
+                                   ( 'Structure', tsl.script.Structure.Structure, [ 'structure' ] ),
+                                   ( 'Presences', tsl.script.Presences.Presences, [ 'presences', 'presence_ns', 'presence_sn' ] ),
+                                   ( 'Interactions', tsl.script.Interactions.Interactions, [ 'interactions', 'interaction_ns' ] ) ]:
+        film[key] = cls( name, outdir )
+        film[key].load()
+        # Read everything now rather than on the first query.
+        for output in outputs:
+            getattr( film[key], output )
+
+    return film
+
+def query_films( film, args ):
+    return sorted( films.keys() )
+
+def query_top_presences( film, args ):
+    return cache.top_presences( film['Presences'], version=film['Script'].script, **args )
+
+def query_top_interactions( film, args ):
+    return cache.top_interactions( film['Presences'], film['Interactions'], version=film['Script'].script, **args )
+
+def query_singletons( film, args ):
+    return sorted( get_singletons( film['Presences'] ) )
+
+def query_scenes( film, args ):
+    if 'first' not in args:
+        raise QueryError( 400, "/scenes requires a first scene." )
+
+    script_lines = film['Script'].script_lines
+    scenes = film['Structure'].structure['scenes']
+    presence_sn = film['Presences'].presence_sn
+
+    result = {}
+
+    for number in range( args['first'], args.get( 'last', args['first'] ) + 1 ):
+        scene_id = str( number )
+        if scene_id in scenes:
+            scene = scenes[scene_id]
+            result[scene_id] = {
+                'script_lines' : script_lines[ scene['first_line']-1 : scene['last_line'] ],
+                'structure'    : scene,
+                'presence_sn'  : presence_sn.get( scene_id, {} )
+                }
+
+    return result
+
+# Keyed on path, the function answering the query, whether it needs a
+# film, and the other arguments it takes.
+queries = {
+    '/films'            : ( query_films, False, [] ),
+    '/top_presences'    : ( query_top_presences, True, PRESENCE_REPORT_DEFAULTS.keys() ),
+    '/top_interactions' : ( query_top_interactions, True, INTERACTION_REPORT_DEFAULTS.keys() ),
+    '/singletons'       : ( query_singletons, True, [] ),
+    '/scenes'           : ( query_scenes, True, [ 'first', 'last' ] ),
+    }
+
+class QueryError( Exception ):
+    def __init__( self, status, message ):
+        Exception.__init__( self, message )
+        self.status = status
+
+def parse_arguments( query, arguments ):
+    '''Turn the query string arguments of query into the keyword
+    arguments of the function answering it.'''
+
+    result = {}
+
+    for ( key, values ) in arguments.items():
+        value = values[-1]
+
+        if key in int_arguments:
+            try:
+                value = int( value )
+            except ValueError:
+                raise QueryError( 400, "%s must be an integer, not %s" % ( key, value ) )
+        elif key in list_arguments:
+            value = [ x for x in value.split( ',' ) if x ]
+            if key in pair_arguments.get( query, [] ):
+                pairs = [ tuple( x.split( ':' ) ) for x in value ]
+                for pair in pairs:
+                    if len( pair ) != 2:
+                        raise QueryError( 400, "%s must be pairs of types joined by a colon, not %s" % ( key, ':'.join( pair ) ) )
+                value = pairs
+
+        result[key] = value
+
+    return result
+
+def answer( path, query_string ):
+    '''Return the result of the query at path, or raise a QueryError
+    if it can't be answered.'''
+
+    query = path.rstrip( '/' ) or '/films'
+    if query not in queries:
+        raise QueryError( 404, "Unknown query %s, expected one of %s" % ( path, ', '.join( sorted( queries ) ) ) )
+    ( function, needs_film, allowed ) = queries[query]
+
+    args = parse_arguments( query[1:], urlparse.parse_qs( query_string ) )
+
+    film = None
+    if needs_film:
+        name = args.pop( 'film', None )
+        if name is None:
+            raise QueryError( 400, "%s requires a film." % ( query ) )
+        if name not in films:
+            raise QueryError( 404, "Unknown film %s" % ( name ) )
+        film = films[name]
+
+    unknown = set( args ) - set( allowed )
+    if unknown:
+        raise QueryError( 400, "Unknown arguments for %s: %s" % ( query, ', '.join( sorted( unknown ) ) ) )
+
+    return function( film, args )
+
+class QueryHandler( BaseHTTPServer.BaseHTTPRequestHandler ):
+
+    def do_GET( self ):
+        ( scheme, netloc, path, params, query_string, fragment ) = urlparse.urlparse( self.path )
+
+        try:
+            status = 200
+            body = json.dumps( answer( path, query_string ), separators=( ',', ':' ) )
+        except QueryError, e:
+            status = e.status
+            body = json.dumps( { 'error' : str( e ) } )
+        except Exception, e:
+            self.log_error( "Error answering %s: %s", self.path, traceback.format_exc() )
+            status = 500
+            body = json.dumps( { 'error' : str( e ) } )
+
+        self.send_response( status )
+        self.send_header( 'Content-Type', 'application/json' )
+        self.send_header( 'Content-Length', str( len( body ) ) )
+        self.end_headers()
+        self.wfile.write( body )
+
+    def log_message( self, format, *args ):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message( self, format, *args )
+
+def serve( names, host='127.0.0.1', port=8765, verbose=False ):
+    start = time.time()
+    for name in names:
+        print "Loading:", name
+        films[name] = load_film( name )
+    print "Loaded %d films in %0.02f seconds" % ( len( names ), time.time() - start )
+
+    server = BaseHTTPServer.HTTPServer( ( host, port ), QueryHandler )
+    server.verbose = verbose
+    print "Serving on http://%s:%d/" % ( host, port )
+    server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Serve queries over the parsed corpus.' )
+    parser.add_argument( 'films', nargs='*', help='Names of films to serve, defaults to the whole corpus.' )
+    parser.add_argument( '--host', default='127.0.0.1', help='Address to listen on, defaults to localhost only.' )
+    parser.add_argument( '--port', type=int, default=8765, help='Port to listen on.' )
+    parser.add_argument( '--verbose', action='store_true', help='Log each request.' )
+    args = parser.parse_args()
+
+    names = [ x[0] for x in scripts ]
+    if args.films:
+        unknown = set( args.films ) - set( names )
+        if unknown:
+            raise Exception( "Unknown films: %s" % ( ', '.join( sorted( unknown ) ) ) )
+        names = args.films
+
+    serve( names, args.host, args.port, args.verbose )
@@ -6,6 +6,8 @@ import pdb
 import re
 import sys
 
+from tsl.script.parse.annotate import get_annotations
+
 scripts = [
     ( 'The Big Lebowski', '../example-scripts/the_big_lebowski.txt' ),
     ( 'Chinatown', '../example-scripts/chinatown.txt' ),
@@ -16,24 +18,9 @@ scripts = [
 
 
 def process( script ):
-    #pdb.set_trace()
-    f = open( script )
-    raw = f.read()
-    raw_tokens = nltk.wordpunct_tokenize( raw )
-    tok = [ t for t in raw_tokens if re.search( r'\w', t ) ]
-    text = nltk.Text( tok )
-    # text.collocations()
-    #words = [ w.lower() for w in text ]
-    words = text
-    # vocab = sorted( set( words ) ) 
-    # 
-    # Stemming
-    # porter = nltk.PorterStemmer()
-    # [ porter.stem( w ) for w in words ]
-    tagged_words = nltk.pos_tag( words )
-    porter = nltk.PorterStemmer()
-    # [ porter.stem( w ) for w in words ]
-    stemmed_tags = [ ( porter.stem( t[0].lower() ), t[1] ) for t in tagged_words ]
+    outdir = '../example-scripts/parsed/' + re.sub( r'\s+', '_', script[0].lower() )
+    Annotations = get_annotations( script[0], script[1], outdir )
+    stemmed_tags = Annotations.get_tagged_stems()
     fd = nltk.FreqDist( stemmed_tags )
     verbs = [ word for ( word, tag ) in fd if ( tag.startswith('V') and len( word ) > 3 )]
     adj = [ word for ( word, tag ) in fd if ( tag.startswith('JJ') and len( word ) > 1 ) ]
@@ -43,7 +30,7 @@ def process( script ):
 
 for script in scripts:
     print script[0]
-    ( verbs, adj, adv, nouns ) = process( script[1] )
+    ( verbs, adj, adv, nouns ) = process( script )
     print "Adjectives      : ", adj[:10]
     print "Non-proper nouns: ", nouns[:10]
     print "Verbs           : ", verbs[:10]